@@ -4,25 +4,43 @@ Flask Web API服务
 提供图书推荐的RESTful API
 支持中英文双语
 """
+import json
+import os
 import sys
+import time
 from pathlib import Path
 
 # 添加项目根目录到路径
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, make_response, render_template, stream_with_context
 from flask_cors import CORS
 from config import config
 from src.core.keyword_recommender import KeywordBasedRecommender
 from src.utils.i18n import get_text, TRANSLATIONS
-from src.utils.logger_config import get_logger
+from src.utils.logger_config import get_logger, get_async_logger, dropped_records
+from src.utils import timing, metrics
+from src.utils.process_stats import memory_usage
 from functools import wraps
 from datetime import datetime
 
 # 初始化日志
 logger = get_logger('app')
-access_logger = get_logger('access')  # 专门的访问日志
+# JSON 格式的访问日志每行只有 JSON 对象（时间在对象中）
+access_log_fmt = '%(message)s' if config.ACCESS_LOG_FORMAT == 'json' else None
+if config.ACCESS_LOG_ASYNC:
+    # 专门的访问日志（后台线程批量写入）
+    access_logger = get_async_logger(
+        'access',
+        queue_size=config.ACCESS_LOG_QUEUE_SIZE,
+        batch_size=config.ACCESS_LOG_BATCH_SIZE,
+        overflow=config.ACCESS_LOG_OVERFLOW,
+        block_timeout=config.ACCESS_LOG_BLOCK_TIMEOUT,
+        fmt=access_log_fmt
+    )
+else:
+    access_logger = get_logger('access', fmt=access_log_fmt)  # 专门的访问日志
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
@@ -31,30 +49,129 @@ CORS(app)  # 允许跨域请求
 recommender = None
 
 
+def write_access_log(ip, method, path, query_string, user_agent, status=None, duration_ms=None, **fields):
+    """
+    记录一条访问日志（Flask 和 ASGI 入口共用，响应后调用）
+    
+    ACCESS_LOG_FORMAT 为 'json' 时每个请求写一行 JSON，包含状态码、耗时（毫秒）
+    和 fields（推荐请求的策略、喜欢的书籍数，见 access_log_fields）；
+    'text' 时保持原有格式，不记录这些字段
+    """
+    if ip and ',' in ip:
+        ip = ip.split(',')[0].strip()
+    
+    if config.ACCESS_LOG_FORMAT == 'json':
+        record = {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'ip': ip,
+            'method': method,
+            'path': path,
+            'query': query_string,
+            'status': status,
+            'latency_ms': round(duration_ms, 3) if duration_ms is not None else None
+        }
+        record.update(fields)
+        record['user_agent'] = user_agent
+        access_logger.info(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        return
+    
+    access_logger.info(
+        f"IP={ip} | Method={method} | Path={path} | "
+        f"Query={query_string} | UserAgent={user_agent}"
+    )
+
+
+def access_log_fields(data):
+    """推荐请求写入访问日志的字段: 策略和喜欢的书籍数"""
+    if not isinstance(data, dict) or 'favorite_books' not in data and 'requests' not in data:
+        return {}
+    fields = {'strategy': data.get('strategy', 'mixed')}
+    if isinstance(data.get('favorite_books'), list):
+        fields['books'] = len(data['favorite_books'])
+    return fields
+
+
 def log_access(f):
     """访问日志装饰器"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # 获取客户端信息
-        ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-        if ip and ',' in ip:
-            ip = ip.split(',')[0].strip()
-        
-        user_agent = request.headers.get('User-Agent', 'Unknown')
-        method = request.method
-        path = request.path
-        query_string = request.query_string.decode('utf-8')
-        
-        # 记录访问
-        access_logger.info(
-            f"IP={ip} | Method={method} | Path={path} | "
-            f"Query={query_string} | UserAgent={user_agent}"
-        )
-        
-        return f(*args, **kwargs)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = make_response(f(*args, **kwargs))
+            status = response.status_code
+            return response
+        finally:
+            # 获取客户端信息并记录访问（流式响应的耗时不含发送数据的时间）
+            write_access_log(
+                request.headers.get('X-Forwarded-For', request.remote_addr),
+                request.method,
+                request.path,
+                request.query_string.decode('utf-8'),
+                request.headers.get('User-Agent', 'Unknown'),
+                status=status,
+                duration_ms=(time.perf_counter() - start) * 1000,
+                **access_log_fields(request.get_json(silent=True) if request.is_json else None)
+            )
     return decorated_function
 
 
+@app.before_request
+def start_request_metrics():
+    """请求指标: 按路由规则（如 /api/book/<int:book_id>）统计，避免标签随参数增长"""
+    g.metrics_route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.metrics_start = metrics.request_started(g.metrics_route)
+
+
+@app.after_request
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    """请求结束时记录请求数和耗时（流式响应的请求上下文会再次结束，只记录一次）"""
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        metrics.request_finished(g.metrics_route, request.method, g.get('metrics_status', 500), start)
+
+
+metrics.registry.describe('entities', 'gauge', '知识图谱实体数（按类型）', merge='max')
+metrics.registry.describe('keywords', 'gauge', '评论关键词数', merge='max')
+metrics.registry.describe('result_cache_entries', 'gauge', '推荐结果缓存条目数', merge='pid')
+metrics.registry.describe('result_cache_bytes', 'gauge', '推荐结果缓存字节数', merge='pid')
+metrics.registry.describe('result_cache_hits_total', 'counter', '推荐结果缓存命中数')
+metrics.registry.describe('result_cache_misses_total', 'counter', '推荐结果缓存未命中数')
+metrics.registry.describe('process_resident_memory_bytes', 'gauge', '进程常驻内存', merge='pid')
+metrics.registry.describe('process_private_memory_bytes', 'gauge', '进程私有内存（不含与主进程共享的页）', merge='pid')
+metrics.registry.describe('access_log_dropped_total', 'counter', '访问日志队列满时丢弃的记录数')
+
+
+def collect_recommender_metrics():
+    """推荐器和进程的当前状态（指标抓取和多进程写入时调用）"""
+    samples = []
+    if recommender is not None:
+        for entity_type, entity_ids in recommender.entity_types.items():
+            samples.append(('entities', {'type': entity_type}, len(entity_ids)))
+        samples.append(('keywords', {}, len(recommender.all_keywords)))
+        cache_stats = recommender.result_cache.stats()
+        samples.append(('result_cache_hits_total', {}, cache_stats['hits']))
+        samples.append(('result_cache_misses_total', {}, cache_stats['misses']))
+        if 'entries' in cache_stats:
+            samples.append(('result_cache_entries', {'backend': cache_stats['backend']}, cache_stats['entries']))
+            samples.append(('result_cache_bytes', {'backend': cache_stats['backend']}, cache_stats['bytes']))
+    usage = memory_usage()
+    samples.append(('process_resident_memory_bytes', {}, usage['rss'] * 1024 * 1024))
+    if 'private' in usage:
+        samples.append(('process_private_memory_bytes', {}, usage['private'] * 1024 * 1024))
+    samples.append(('access_log_dropped_total', {}, dropped_records('access')))
+    return samples
+
+
+metrics.registry.register_collector(collect_recommender_metrics)
+
+
 def init_recommender():
     """初始化推荐器"""
     global recommender
@@ -77,19 +194,25 @@ def index():
     return render_template('index.html', lang=lang, translations=TRANSLATIONS[lang])
 
 
-@app.route('/api/translations/<lang>', methods=['GET'])
-def get_translations(lang):
-    """获取翻译文本API"""
+def handle_translations(lang):
+    """获取翻译文本，返回 (响应数据, 状态码)"""
     if lang not in TRANSLATIONS:
         lang = 'zh'
     
-    return jsonify({
+    return {
         'success': True,
         'data': {
             'lang': lang,
             'translations': TRANSLATIONS[lang]
         }
-    })
+    }, 200
+
+
+@app.route('/api/translations/<lang>', methods=['GET'])
+def get_translations(lang):
+    """获取翻译文本API"""
+    payload, status = handle_translations(lang)
+    return jsonify(payload), status
 
 
 @app.route('/api/book/<int:book_id>/keywords', methods=['GET'])
@@ -104,27 +227,29 @@ def get_book_keywords(book_id):
                 'message': '书籍不存在'
             }), 404
         
-        entity = recommender.entities[book_id]
-        
-        # 获取关键词
-        keywords = []
-        if book_id in recommender.book_keywords:
-            keyword_list = recommender.book_keywords[book_id]
-            keyword_weights = recommender.book_keyword_weights.get(book_id, {})
+        # 关键词数据只随数据重新加载变化，结果可缓存
+        cache_key = ('book_keywords', book_id)
+        payload = recommender.result_cache.get(cache_key)
+        if payload is None:
+            entity = recommender.entities[book_id]
             
-            # 构建关键词列表（带权重）
-            for kw in keyword_list[:30]:  # 最多返回30个
-                keywords.append({
-                    'word': kw,
-                    'weight': keyword_weights.get(kw, 0)
-                })
-        
-        # 获取评论统计
-        comment_stats = recommender.comment_stats.get(book_id, {})
-        
-        return jsonify({
-            'success': True,
-            'data': {
+            # 获取关键词
+            keywords = []
+            if book_id in recommender.book_keywords:
+                keyword_list = recommender.book_keywords[book_id]
+                keyword_weights = recommender.book_keyword_weights.get(book_id, {})
+                
+                # 构建关键词列表（带权重）
+                for kw in keyword_list[:30]:  # 最多返回30个
+                    keywords.append({
+                        'word': kw,
+                        'weight': keyword_weights.get(kw, 0)
+                    })
+            
+            # 获取评论统计
+            comment_stats = recommender.comment_stats.get(book_id, {})
+            
+            payload = {
                 'book_id': book_id,
                 'book_name': entity['name'],
                 'keywords': keywords,
@@ -134,6 +259,11 @@ def get_book_keywords(book_id):
                     'avg_rating': comment_stats.get('avg_rating', 0)
                 }
             }
+            recommender.result_cache.put(cache_key, payload)
+        
+        return jsonify({
+            'success': True,
+            'data': payload
         })
     
     except Exception as e:
@@ -144,13 +274,51 @@ def get_book_keywords(book_id):
         }), 500
 
 
-@app.route('/api/recommend', methods=['POST'])
-@log_access
-def recommend():
-    """推荐API"""
+def validate_recommend_options(strategy, relations):
+    """校验推荐策略和关系类型，返回错误信息，合法时返回 None"""
+    # 验证策略
+    valid_strategies = ['mixed', 'kg_only', 'keyword_only', 'embedding']
+    if strategy not in valid_strategies:
+        return f'无效的推荐策略，可选值: {", ".join(valid_strategies)}'
+    
+    # 验证关系
+    if relations is not None:
+        valid_relations = ['series', 'author', 'translator', 'publisher']
+        for rel in relations:
+            if rel not in valid_relations:
+                return f'无效的关系类型: {rel}，可选值: {", ".join(valid_relations)}'
+    return None
+
+
+def validate_batch_request(req):
+    """校验批量推荐的一组输入（书名列表，或含 favorite_books 书名列表的对象），返回错误信息，合法时返回 None"""
+    if isinstance(req, dict):
+        favorite_books = req.get('favorite_books')
+        selected_keywords = req.get('selected_keywords')
+    else:
+        favorite_books, selected_keywords = req, None
+    if not _is_string_list(favorite_books):
+        return '每组输入应为书名列表，或 favorite_books 为书名列表的对象'
+    if selected_keywords is not None and not _is_string_list(selected_keywords):
+        return 'selected_keywords 应为关键词列表'
+    return None
+
+
+def _is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def handle_recommend(data):
+    """
+    推荐请求处理（Flask 视图和 ASGI 入口共用）
+    
+    Args:
+        data: 请求JSON
+    
+    Returns:
+        (响应数据, 状态码)
+    """
     try:
-        # 获取请求数据
-        data = request.get_json()
         favorite_books = data.get('favorite_books', [])
         top_k = data.get('top_k', config.TOP_K)
         strategy = data.get('strategy', 'mixed')  # 推荐策略
@@ -160,30 +328,17 @@ def recommend():
         logger.info(f"推荐请求: books={favorite_books}, strategy={strategy}, top_k={top_k}")
         
         if not favorite_books:
-            return jsonify({
+            return {
                 'success': False,
                 'message': '请至少输入一本喜欢的书籍'
-            }), 400
-        
-        # 验证策略
-        valid_strategies = ['mixed', 'kg_only', 'keyword_only']
-        if strategy not in valid_strategies:
-            return jsonify({
-                'success': False,
-                'message': f'无效的推荐策略，可选值: {", ".join(valid_strategies)}'
-            }), 400
+            }, 400
         
-        # 验证关系
-        if relations is not None:
-            valid_relations = ['series', 'author', 'translator', 'publisher']
-            for rel in relations:
-                if rel not in valid_relations:
-                    return jsonify({
-                        'success': False,
-                        'message': f'无效的关系类型: {rel}，可选值: {", ".join(valid_relations)}'
-                    }), 400
+        error = validate_recommend_options(strategy, relations)
+        if error:
+            return {'success': False, 'message': error}, 400
         
         # 执行推荐
+        start_time = time.perf_counter()
         recommendations = recommender.recommend(
             favorite_books, 
             top_k=top_k,
@@ -191,8 +346,9 @@ def recommend():
             relations=relations,
             selected_keywords=selected_keywords
         )
+        metrics.registry.observe('recommend_duration_seconds', time.perf_counter() - start_time, {'strategy': strategy})
         
-        return jsonify({
+        return {
             'success': True,
             'data': {
                 'favorite_books': favorite_books,
@@ -202,60 +358,145 @@ def recommend():
                 'recommendations': recommendations,
                 'total': len(recommendations)
             }
-        })
+        }, 200
     
     except Exception as e:
         logger.error(f"推荐出错: {str(e)}", exc_info=True)
-        return jsonify({
+        return {
             'success': False,
             'message': f'推荐失败: {str(e)}'
-        }), 500
+        }, 500
 
 
-@app.route('/api/search', methods=['GET'])
+@app.route('/api/recommend', methods=['POST'])
 @log_access
-def search_books():
-    """搜索书籍API"""
+def recommend():
+    """推荐API"""
+    payload, status = handle_recommend(request.get_json(silent=True))
+    return jsonify(payload), status
+
+
+@app.route('/api/recommend/batch', methods=['POST'])
+@log_access
+def recommend_batch():
+    """
+    批量推荐API
+    
+    请求: {"requests": [{"id": ..., "favorite_books": [...], "selected_keywords": [...]} 或 [书名, ...], ...],
+           "top_k": 20, "strategy": "mixed", "relations": [...]}
+    响应: NDJSON，每组输入一行 {"index", "id", "favorite_books", "recommendations", "total"}，按输入顺序流式返回
+    """
+    data = request.get_json(silent=True) or {}
+    requests = data.get('requests')
+    top_k = data.get('top_k', config.TOP_K)
+    strategy = data.get('strategy', 'mixed')
+    relations = data.get('relations', None)
+    
+    if not isinstance(requests, list) or not requests:
+        return jsonify({'success': False, 'message': '请提供至少一组输入（requests）'}), 400
+    if len(requests) > config.RECOMMEND_BATCH_MAX_REQUESTS:
+        return jsonify({
+            'success': False,
+            'message': f'单次最多 {config.RECOMMEND_BATCH_MAX_REQUESTS} 组输入'
+        }), 400
+    for index, req in enumerate(requests):
+        error = validate_batch_request(req)
+        if error:
+            return jsonify({'success': False, 'message': f'第 {index} 组输入无效: {error}'}), 400
+    error = validate_recommend_options(strategy, relations)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
+    logger.info(f"批量推荐请求: {len(requests)} 组, strategy={strategy}, top_k={top_k}")
+    
+    def generate():
+        try:
+            results = recommender.recommend_batch(requests, top_k=top_k, strategy=strategy, relations=relations)
+            for index, (req, recommendations) in enumerate(zip(requests, results)):
+                req = req if isinstance(req, dict) else {'favorite_books': req}
+                yield app.json.dumps({
+                    'index': index,
+                    'id': req.get('id'),
+                    'favorite_books': req.get('favorite_books') or [],
+                    'recommendations': recommendations,
+                    'total': len(recommendations)
+                }) + '\n'
+        except Exception as e:
+            # 响应头已发出，只能以一行错误信息结束
+            logger.error(f"批量推荐出错: {str(e)}", exc_info=True)
+            yield app.json.dumps({'success': False, 'message': f'推荐失败: {str(e)}'}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def handle_search(query, limit=10):
+    """搜索请求处理（Flask 视图和 ASGI 入口共用），返回 (响应数据, 状态码)"""
     try:
-        query = request.args.get('q', '')
-        limit = int(request.args.get('limit', 10))
+        limit = int(limit)
         
         logger.info(f"搜索请求: query={query}, limit={limit}")
         
         if not query:
-            return jsonify({
+            return {
                 'success': False,
                 'message': '请输入搜索关键词'
-            }), 400
+            }, 400
         
         # 搜索书籍
-        results = []
-        for entity_id in recommender.book_entities:
-            entity = recommender.entities[entity_id]
-            if query.lower() in entity['name'].lower():
-                results.append({
-                    'book_id': entity_id,
-                    'book_name': entity['name'],
-                    'book_url': entity.get('url', ''),
-                    'rating': entity.get('rating', 0)
-                })
-                if len(results) >= limit:
-                    break
+        results = recommender.search_books(query, limit)
         
-        return jsonify({
+        return {
             'success': True,
             'data': {
                 'query': query,
                 'results': results,
                 'total': len(results)
             }
-        })
+        }, 200
     
     except Exception as e:
         logger.error(f"搜索出错: {str(e)}", exc_info=True)
-        return jsonify({
+        return {
             'success': False,
             'message': f'搜索失败: {str(e)}'
+        }, 500
+
+
+@app.route('/api/search', methods=['GET'])
+@log_access
+def search_books():
+    """搜索书籍API"""
+    payload, status = handle_search(request.args.get('q', ''), request.args.get('limit', 10))
+    return jsonify(payload), status
+
+
+@app.route('/api/book/<int:book_id>/similar', methods=['GET'])
+@log_access
+def get_similar_books(book_id):
+    """按读者评论查找相似书籍API"""
+    try:
+        limit = int(request.args.get('limit', 10))
+        if book_id not in recommender.entities:
+            return jsonify({
+                'success': False,
+                'message': '书籍不存在'
+            }), 404
+        
+        results = recommender.similar_books(book_id, limit)
+        return jsonify({
+            'success': True,
+            'data': {
+                'book_id': book_id,
+                'results': results,
+                'total': len(results)
+            }
+        })
+    
+    except Exception as e:
+        logger.error(f"查找相似书籍出错: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'获取失败: {str(e)}'
         }), 500
 
 
@@ -280,18 +521,18 @@ def get_book_detail(book_id):
             'series': []
         }
         
-        for neighbor in recommender.graph.neighbors(book_id):
-            neighbor_entity = recommender.entities.get(neighbor, {})
-            entity_type = neighbor_entity.get('type')
+        graph = recommender.graph
+        for neighbor in graph.neighbors(book_id):
+            entity_type = graph.node_type(neighbor)
             
             if entity_type == 'author':
-                related['authors'].append(neighbor_entity['name'])
+                related['authors'].append(graph.names[neighbor])
             elif entity_type == 'publisher':
-                related['publishers'].append(neighbor_entity['name'])
+                related['publishers'].append(graph.names[neighbor])
             elif entity_type == 'translator':
-                related['translators'].append(neighbor_entity['name'])
+                related['translators'].append(graph.names[neighbor])
             elif entity_type == 'series':
-                related['series'].append(neighbor_entity['name'])
+                related['series'].append(graph.names[neighbor])
         
         return jsonify({
             'success': True,
@@ -319,12 +560,13 @@ def get_stats():
     try:
         stats = {
             'total_entities': len(recommender.entities),
-            'total_relations': len(recommender.relations),
+            'total_relations': recommender.graph.number_of_edges(),
             'books': len(recommender.entity_types.get('book', [])),
             'authors': len(recommender.entity_types.get('author', [])),
             'publishers': len(recommender.entity_types.get('publisher', [])),
             'translators': len(recommender.entity_types.get('translator', [])),
-            'series': len(recommender.entity_types.get('series', []))
+            'series': len(recommender.entity_types.get('series', [])),
+            'result_cache': recommender.result_cache.stats()
         }
         
         return jsonify({
@@ -340,6 +582,30 @@ def get_stats():
         }), 500
 
 
+@app.route('/api/metrics', methods=['GET'])
+@log_access
+def get_metrics():
+    """
+    推荐各阶段的耗时和候选数统计（本进程）
+    
+    响应: {"pid", "since", "spans": {阶段: {"duration_ms": 直方图, "items": 直方图}}}，
+    直方图含 count / sum / mean / max / p50 / p90 / p99 和累计桶计数；?reset=1 读取后清零
+    """
+    snapshot = timing.recorder.snapshot()
+    if request.args.get('reset') == '1':
+        timing.recorder.reset()
+    return jsonify({
+        'success': True,
+        'data': {'pid': os.getpid(), **snapshot}
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def get_prometheus_metrics():
+    """Prometheus 指标（文本格式，预派生多进程模式下为所有工作进程的合计）"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 if __name__ == '__main__':
     init_recommender()
     app.run(host=config.HOST, port=config.PORT, debug=config.DEBUG, use_reloader=False)
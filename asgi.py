@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI 服务入口
+生产环境使用，例如: uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+- /api/recommend: 推荐计算在有界线程池中执行，排队和执行中的请求超过上限时直接返回 503（背压）
+- /api/search: 书名查找和日志写入在单独的小线程池中执行，不阻塞事件循环，也不受推荐请求排队影响
+- /api/translations: 只读内存中的翻译表，直接在事件循环中处理
+- 其余接口转发给 Flask 应用
+以上三类接口的请求指标（/metrics）在这里统计，转发给 Flask 的由其请求钩子统计
+"""
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from asgiref.wsgi import WsgiToAsgi
+
+from config import config
+from src.utils import metrics
+import app as flask_app
+
+
+class AsyncRecommendApp:
+    """异步 API 应用（ASGI）"""
+    
+    def __init__(self, recommend_workers, max_pending, max_body_bytes, search_workers=2):
+        """
+        Args:
+            recommend_workers: 推荐计算线程数
+            search_workers: 搜索线程数
+            max_pending: 同时排队和执行的推荐请求上限
+            max_body_bytes: 请求体大小上限
+        """
+        self.wsgi = WsgiToAsgi(flask_app.app)
+        self.executor = ThreadPoolExecutor(max_workers=recommend_workers, thread_name_prefix='recommend')
+        self.search_executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix='search')
+        self.max_pending = max_pending
+        self.max_body_bytes = max_body_bytes
+        self.pending = 0  # 只在事件循环线程中修改
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        
+        if scope['type'] == 'http':
+            method = scope['method']
+            path = scope['path']
+            if method == 'POST' and path == '/api/recommend':
+                await self._handle('/api/recommend', scope, self.recommend(scope, receive, send))
+                return
+            if method == 'GET' and path == '/api/search':
+                await self._handle('/api/search', scope, self.search(scope, send))
+                return
+            if method == 'GET' and path.startswith('/api/translations/'):
+                with metrics.track_request('/api/translations/<lang>', method) as request_info:
+                    payload, status = flask_app.handle_translations(path[len('/api/translations/'):])
+                    await self._send_json(send, status, self._dumps(payload))
+                    request_info['status'] = status
+                return
+        
+        await self.wsgi(scope, receive, send)
+    
+    async def _handle(self, route, scope, handler):
+        """执行 handler（返回 (状态码, 访问日志字段) 的协程），统计请求指标，响应后记录访问日志"""
+        start = time.perf_counter()
+        status, fields = 500, {}
+        with metrics.track_request(route, scope['method']) as request_info:
+            try:
+                status, fields = await handler
+                request_info['status'] = status
+            finally:
+                self._log_access(scope, status, (time.perf_counter() - start) * 1000, fields)
+    
+    async def _lifespan(self, receive, send):
+        """启动时加载推荐器，关闭时释放线程池"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, flask_app.init_recommender)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                self.search_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    
+    async def recommend(self, scope, receive, send):
+        """推荐API（线程池执行），返回 (响应状态码, 访问日志字段)"""
+        # 背压: 超过上限直接拒绝，不再排队
+        if self.pending >= self.max_pending:
+            body = self._dumps({
+                'success': False,
+                'message': '服务繁忙，请稍后重试'
+            })
+            await self._send_json(send, 503, body, [(b'retry-after', b'1')])
+            return 503, {}
+        
+        self.pending += 1
+        try:
+            raw_body = await self._read_body(receive)
+            if raw_body is None:
+                await self._send_json(send, 413, self._dumps({
+                    'success': False,
+                    'message': '请求体过大'
+                }))
+                return 413, {}
+            
+            status, body, fields = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._run_recommend, raw_body
+            )
+        finally:
+            self.pending -= 1
+        await self._send_json(send, status, body)
+        return status, fields
+    
+    @staticmethod
+    def _run_recommend(raw_body):
+        """在线程池中执行: 解析请求、推荐、序列化响应，返回 (状态码, 响应体, 访问日志字段)"""
+        try:
+            data = json.loads(raw_body) if raw_body else None
+        except ValueError:
+            data = None
+        payload, status = flask_app.handle_recommend(data)
+        return status, AsyncRecommendApp._dumps(payload), flask_app.access_log_fields(data)
+    
+    async def search(self, scope, send):
+        """搜索书籍API（搜索线程池执行），返回 (响应状态码, 访问日志字段)"""
+        params = parse_qs(scope.get('query_string', b'').decode('utf-8'))
+        payload, status = await asyncio.get_running_loop().run_in_executor(
+            self.search_executor,
+            flask_app.handle_search,
+            params.get('q', [''])[0],
+            params.get('limit', [10])[0]
+        )
+        await self._send_json(send, status, self._dumps(payload))
+        return status, {}
+    
+    async def _read_body(self, receive):
+        """读取请求体，超过大小上限时返回 None"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+    
+    @staticmethod
+    def _dumps(payload):
+        """与 Flask jsonify 相同的 JSON 编码"""
+        return flask_app.app.json.dumps(payload).encode('utf-8')
+    
+    @staticmethod
+    async def _send_json(send, status, body, extra_headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode('ascii')),
+                (b'access-control-allow-origin', b'*'),
+                *extra_headers
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+    
+    @staticmethod
+    def _log_access(scope, status, duration_ms, fields):
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+        client = scope.get('client')
+        flask_app.write_access_log(
+            headers.get('x-forwarded-for', client[0] if client else None),
+            scope['method'],
+            scope['path'],
+            scope.get('query_string', b'').decode('utf-8'),
+            headers.get('user-agent', 'Unknown'),
+            status=status,
+            duration_ms=duration_ms,
+            **fields
+        )
+
+
+application = AsyncRecommendApp(
+    recommend_workers=config.ASGI_RECOMMEND_WORKERS,
+    max_pending=config.ASGI_MAX_PENDING,
+    max_body_bytes=config.ASGI_MAX_BODY_BYTES,
+    search_workers=config.ASGI_SEARCH_WORKERS
+)
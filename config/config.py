@@ -16,6 +16,12 @@ RESOURCES_DIR = os.path.join(DATA_DIR, 'resources')
 # 原始数据文件
 BOOK_INFO_FILE = os.path.join(RAW_DATA_DIR, 'newBookInformation')
 COMMENT_FILE = os.path.join(RAW_DATA_DIR, 'newCommentdata')
+BOOK_INFO_PARQUET_FILE = os.path.join(RAW_DATA_DIR, 'newBookInformation.parquet')  # 存在时代替 BOOK_INFO_FILE
+COMMENT_PARQUET_FILE = os.path.join(RAW_DATA_DIR, 'newCommentdata.parquet')  # 存在时代替 COMMENT_FILE（按 readBookUrl 排序）
+PARQUET_COMPRESSION = 'zstd'  # Parquet 压缩算法，也可以是 {列名: 算法} 为每列单独指定
+PARQUET_ROW_GROUP_SIZE = 100000  # Parquet 每个行组的行数
+COMMENT_STORE_DIR = os.path.join(PROCESSED_DATA_DIR, 'comments')  # 评论列存储（按图书链接排序的 .npy 文件目录，由评论文件转换）
+COMMENT_CHUNK_ROWS = 1000000  # 按块读取评论列存储时每块的最大评论数
 
 # 资源文件
 STOPWORDS_FILE = os.path.join(RESOURCES_DIR, 'ChineseStopWords.txt')
@@ -23,11 +29,17 @@ STOPWORDS_FILE = os.path.join(RESOURCES_DIR, 'ChineseStopWords.txt')
 # 知识图谱相关配置
 KG_DIR = os.path.join(PROCESSED_DATA_DIR, 'knowledge_graph')
 KG_ENTITIES_FILE = os.path.join(KG_DIR, 'entities.pkl')
-KG_RELATIONS_FILE = os.path.join(KG_DIR, 'relations.pkl')
-KG_EMBEDDINGS_FILE = os.path.join(KG_DIR, 'embeddings.pkl')
-KG_COMMENT_KEYWORDS_FILE = os.path.join(KG_DIR, 'comment_keywords.pkl')
+KG_RELATIONS_FILE = os.path.join(KG_DIR, 'relations.pkl')  # 旧版 networkx 格式，仅用于兼容
+KG_GRAPH_DIR = os.path.join(KG_DIR, 'graph')  # 实体表 + CSR 图存储（.npy 文件目录）
+KG_EMBEDDINGS_FILE = os.path.join(KG_DIR, 'embeddings.npy')  # TransE 实体嵌入（float32 数组，按实体ID索引）
+KG_COMMENT_KEYWORDS_FILE = os.path.join(KG_DIR, 'comment_keywords.pkl')  # 旧版 pickle 缓存，仅用于兼容
+KG_KEYWORDS_DIR = os.path.join(KG_DIR, 'comment_keywords')  # 关键词缓存（.npy 文件目录）
+KG_TITLE_INDEX_DIR = os.path.join(KG_DIR, 'title_index')  # 书名索引（.npy 文件目录）
+KG_POS_CACHE_FILE = os.path.join(KG_DIR, 'pos_cache.pkl')  # 关键词过滤用的词性缓存
+KG_NEIGHBORS_DIR = os.path.join(KG_DIR, 'neighbors')  # 预计算的图书近邻表（.npy 文件目录）
+KG_KEYWORD_ANN_DIR = os.path.join(KG_DIR, 'keyword_ann')  # 评论关键词向量的近似最近邻索引（.npy 文件目录）
 
-# 模型配置
+# 模型配置（TransE 实体嵌入训练）
 EMBEDDING_DIM = 128
 LEARNING_RATE = 0.001
 BATCH_SIZE = 256
@@ -37,9 +49,48 @@ EPOCHS = 50
 TOP_K = 20  # 推荐Top-K本书
 MIN_PATH_LENGTH = 2  # 最小推理路径长度
 MAX_PATH_LENGTH = 4  # 最大推理路径长度
+SCORING_ENGINE = 'python'  # 打分引擎: 'python'(逐个累加) / 'sparse'(稀疏矩阵向量化) / 'neighbors'(查预计算近邻表)
+NEIGHBOR_TABLE_TOP_N = 100  # 近邻表每本书每种策略保留的近邻数
+KEYWORD_ANN_MAX_POSTINGS = 256  # 关键词向量索引中每个关键词保留的倒排项数（按取值降序）
+KEYWORD_ANN_QUERY_TERMS = 10  # 相似图书查询时使用的查询向量关键词数
+RECOMMEND_BATCH_SIZE = 64  # 批量推荐每次一起打分的输入数
+RECOMMEND_BATCH_MAX_REQUESTS = 10000  # /api/recommend/batch 单次最多输入数
+
+# 推荐结果缓存（LRU + TTL）
+RESULT_CACHE_BACKEND = 'memory'  # 缓存后端: 'memory'(进程内) / 'sqlite'(本机多进程共享) / 'redis'
+RESULT_CACHE_SQLITE_FILE = os.path.join(PROCESSED_DATA_DIR, 'cache', 'result_cache.db')
+RESULT_CACHE_REDIS_URL = 'redis://localhost:6379/0'
+RESULT_CACHE_MAX_ENTRIES = 1024  # 最大缓存条目数，0 表示关闭
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 最大缓存字节数
+RESULT_CACHE_TTL = 600  # 缓存有效期（秒）
+
+# 推荐过程日志（各阶段耗时由 src/utils/timing.py 统计，见 /api/metrics）
+RECOMMEND_LOG_LEVEL = 'INFO'  # 设为 'DEBUG' 时按采样率输出推荐过程的详细日志
+RECOMMEND_LOG_SAMPLE_RATE = 0.01  # 输出详细日志的请求比例
+
+# 访问日志
+ACCESS_LOG_ASYNC = True  # 请求线程只把记录放入有界队列，由后台线程批量写入文件和控制台
+ACCESS_LOG_QUEUE_SIZE = 10000  # 队列容量
+ACCESS_LOG_BATCH_SIZE = 256  # 每批最多写入的记录数
+ACCESS_LOG_OVERFLOW = 'drop'  # 队列满时: 'drop' 丢弃（计入 /metrics 的 access_log_dropped_total）/ 'block' 等待
+ACCESS_LOG_BLOCK_TIMEOUT = 1.0  # 'block' 时最多等待的秒数，超时后丢弃
+ACCESS_LOG_FORMAT = 'text'  # 'text' / 'json'（每行一个 JSON 对象，含状态码、耗时、推荐策略和书籍数，见 src/utils/access_stats.py）
 
 # Web服务配置
 HOST = '0.0.0.0'
 PORT = 5000
 DEBUG = False  # 关闭调试模式，避免重复加载
 
+# ASGI 服务配置（uvicorn asgi:application）
+ASGI_RECOMMEND_WORKERS = 4  # 推荐计算线程数
+ASGI_MAX_PENDING = 32  # 同时排队和执行的推荐请求上限，超出时返回 503
+ASGI_MAX_BODY_BYTES = 1024 * 1024  # 请求体大小上限（字节）
+ASGI_SEARCH_WORKERS = 2  # 搜索线程数（书名查找和日志写入不在事件循环中执行）
+
+# 预派生多进程模式（python start.py --prefork）
+PREFORK_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # 工作进程数
+PREFORK_THREADS = 4  # 每个工作进程的线程数（WSGI 模式）
+PREFORK_TIMEOUT = 120  # 工作进程超时（秒）
+PREFORK_METRICS_DIR = os.path.join(PROCESSED_DATA_DIR, 'metrics')  # 各工作进程写入 /metrics 指标的共享目录（启动时清空）
+METRICS_FLUSH_INTERVAL = 2.0  # 多进程模式下每个进程写入指标的间隔（秒）
+
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+评论数据的列式存储
+评论文件（pandas pickle 或按 readBookUrl 排序的 Parquet 文件）一次性转换为
+按图书链接排序的列数组（.npy 文件和字符串表），之后以 mmap_mode='r' 打开，按图书分组逐块读取，不需要把全部评论加载到内存
+"""
+import os
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from src.core.graph_store import StringTable
+
+COMMENT_COLUMNS = ('readBookUrl', 'bookComment', 'rating', 'id')  # 分析评论只需要这几列
+
+
+def parse_rating(rating_str):
+    """解析评分字符串（如 'rating4-t'）为星级，无法解析时返回0"""
+    if pd.isna(rating_str):
+        return 0
+    try:
+        rating_str = str(rating_str)
+        if 'rating' in rating_str:
+            num = rating_str.replace('rating', '').split('-')[0]
+            return int(num)
+        return 0
+    except:
+        return 0
+
+
+class CommentStore:
+    """
+    评论列存储
+    
+    - urls: 有序的图书链接表（readBookUrl 去重），第 i 个链接的评论为行区间 url_indptr[i]:url_indptr[i + 1]
+    - comments: 评论文本（bookComment 转为字符串，没有该列时为空串）
+    - rating_scores: 解析后的星级（int32，无法解析时为0）
+    - id_hashes: 评论ID的哈希（uint64），用于计算增量更新的评论指纹
+    - source_stat: 转换时源文件的 (大小, 修改时间ns)
+    
+    同一链接内的评论保持源文件中的顺序。
+    """
+    
+    ARRAYS = ('url_indptr', 'rating_scores', 'id_hashes')
+    
+    def __init__(self, urls, comments, url_indptr, rating_scores, id_hashes, source_stat=None):
+        self.urls = urls
+        self.comments = comments
+        self.url_indptr = url_indptr
+        self.rating_scores = rating_scores
+        self.id_hashes = id_hashes
+        self.source_stat = source_stat
+    
+    @classmethod
+    def from_dataframe(cls, comment_data, source_stat=None):
+        """从评论 DataFrame 构建（需要 readBookUrl / rating / id 列）"""
+        codes, uniques = pd.factorize(comment_data['readBookUrl'].map(str), sort=True)
+        order = np.argsort(codes, kind='stable')
+        url_indptr = np.zeros(len(uniques) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(uniques)), out=url_indptr[1:])
+        
+        if 'bookComment' in comment_data.columns:
+            texts = comment_data['bookComment'].map(str).to_numpy(dtype=object)[order]
+        else:
+            texts = [''] * len(order)
+        
+        return cls(
+            StringTable.from_strings(uniques.tolist()),
+            StringTable.from_strings(texts),
+            url_indptr,
+            comment_data['rating'].map(parse_rating).to_numpy(dtype=np.int32)[order],
+            pd.util.hash_pandas_object(comment_data['id'], index=False).to_numpy()[order],
+            source_stat
+        )
+    
+    @classmethod
+    def convert(cls, source_file, path, previous=None, chunk_rows=1000000):
+        """
+        将评论文件转换为列存储并保存，返回以 mmap 方式打开的新存储
+        
+        Args:
+            source_file: 评论文件（pandas pickle，扩展名为 .parquet 时按 Parquet 读取）
+            path: 列存储目录
+            previous: 旧的列存储，Parquet 转换时复用其中评论没有变化的图书链接
+            chunk_rows: Parquet 转换时每块读取的评论数
+        
+        新存储先写到临时目录再替换 path，转换过程中旧存储仍可读取。
+        """
+        stat = os.stat(source_file)
+        source_stat = (stat.st_size, stat.st_mtime_ns)
+        tmp_path = path.rstrip(os.sep) + '.tmp'
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        
+        if source_file.endswith('.parquet'):
+            cls._convert_parquet(source_file, tmp_path, source_stat, previous, chunk_rows)
+        else:
+            comment_data = pd.read_pickle(source_file)
+            store = cls.from_dataframe(comment_data, source_stat)
+            del comment_data
+            store.save(tmp_path)
+            del store
+        
+        old_path = path.rstrip(os.sep) + '.old'
+        if os.path.isdir(old_path):
+            shutil.rmtree(old_path)
+        if os.path.isdir(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        if os.path.isdir(old_path):
+            shutil.rmtree(old_path)
+        return cls.load(path, mmap_mode='r')
+    
+    @classmethod
+    def _convert_parquet(cls, source_file, path, source_stat, previous, chunk_rows):
+        """
+        从按 readBookUrl 排序的 Parquet 文件按块转换
+        
+        1. 只读取 readBookUrl / id 两列，统计每个链接的评论数和评论ID哈希之和
+        2. 与旧存储相同的链接直接复制旧存储中的行
+        3. 其余链接按块读取需要的列，用 readBookUrl 的范围条件过滤
+           （下推到 Parquet 的行组统计信息，不相关的行组不读取）
+        
+        文件没有按 readBookUrl 排序时退化为读取需要的列后整表转换。
+        """
+        import pyarrow.parquet as pq
+        
+        parquet_file = pq.ParquetFile(source_file)
+        columns = [name for name in COMMENT_COLUMNS if name in parquet_file.schema_arrow.names]
+        scan = cls._scan_parquet(parquet_file, chunk_rows)
+        if scan is None:
+            print("Parquet 评论文件没有按 readBookUrl 排序，读取需要的列后整表转换...")
+            comment_data = pd.read_parquet(source_file, columns=columns)
+            cls.from_dataframe(comment_data, source_stat).save(path)
+            return
+        urls, url_counts, url_hashes = scan
+        url_indptr = np.zeros(len(urls) + 1, dtype=np.int64)
+        np.cumsum(url_counts, out=url_indptr[1:])
+        
+        # 评论数和评论ID哈希都没有变化的链接，记录其在旧存储中的链接号
+        reuse_from = np.full(len(urls), -1, dtype=np.int64)
+        if previous is not None and len(previous.urls):
+            previous_counts, previous_hashes = previous.url_fingerprints(chunk_rows)
+            previous_index = {url: i for i, url in enumerate(previous.urls)}
+            positions = np.array([previous_index.get(url, -1) for url in urls], dtype=np.int64)
+            found = np.flatnonzero(positions >= 0)
+            same = found[
+                (previous_counts[positions[found]] == url_counts[found])
+                & (previous_hashes[positions[found]] == url_hashes[found])
+            ]
+            reuse_from[same] = positions[same]
+        num_reused = int((reuse_from >= 0).sum())
+        if previous is not None:
+            print(f"  {len(urls)} 个图书链接，{num_reused} 个评论没有变化（复用旧存储），"
+                  f"{len(urls) - num_reused} 个需要读取")
+        
+        os.makedirs(path, exist_ok=True)
+        meta_file = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_file):
+            os.remove(meta_file)
+        url_array = np.array(urls, dtype=object)
+        comments = _StringTableAppender(path, 'comments')
+        rating_scores = _ArrayAppender(os.path.join(path, 'rating_scores.npy'), np.int32)
+        id_hashes = _ArrayAppender(os.path.join(path, 'id_hashes.npy'), np.uint64)
+        for start, end in _iter_url_chunks(url_indptr, chunk_rows):
+            reused = reuse_from[start:end]
+            from_previous = reused >= 0
+            counts = url_counts[start:end]
+            
+            changed = np.flatnonzero(~from_previous) + start
+            new = None
+            if len(changed):
+                new = cls._read_parquet_urls(
+                    source_file, columns, url_array, changed, all_urls=len(changed) == end - start
+                )
+                if len(new) != counts[~from_previous].sum() or len(new.urls) != len(changed):
+                    raise ValueError(f"Parquet 评论文件在转换过程中发生了变化: {source_file}")
+            
+            # 每个链接的行区间（旧存储或新读取的块中），相邻且来源相同的区间合并后整段复制
+            new_counts = np.where(from_previous, 0, counts)
+            row_ends = np.cumsum(new_counts)
+            row_starts = row_ends - new_counts
+            if num_reused:
+                row_starts[from_previous] = previous.url_indptr[reused[from_previous]]
+                row_ends = row_starts + counts
+            breaks = np.flatnonzero(
+                (from_previous[1:] != from_previous[:-1]) | (row_starts[1:] != row_ends[:-1])
+            ) + 1
+            bounds = np.concatenate([[0], breaks, [end - start]]).tolist()
+            for first, last in zip(bounds[:-1], bounds[1:]):
+                source = previous if from_previous[first] else new
+                row_start, row_end = int(row_starts[first]), int(row_ends[last - 1])
+                comments.append_table(source.comments, row_start, row_end)
+                rating_scores.append(source.rating_scores[row_start:row_end])
+                id_hashes.append(source.id_hashes[row_start:row_end])
+        
+        comments.close()
+        rating_scores.close()
+        id_hashes.close()
+        np.save(os.path.join(path, 'url_indptr.npy'), url_indptr)
+        StringTable.from_strings(urls).save(path, 'urls')
+        with open(meta_file, 'w', encoding='utf-8') as f:
+            json.dump({'num_comments': int(url_indptr[-1]), 'source_stat': list(source_stat)}, f)
+    
+    @staticmethod
+    def _scan_parquet(parquet_file, chunk_rows):
+        """
+        只读取 readBookUrl / id 两列，按链接统计评论数和评论ID哈希之和
+        
+        Returns:
+            (urls, url_counts, url_hashes)，文件没有按 readBookUrl 排序（或链接不是字符串、有空值）时返回 None
+        """
+        import pyarrow as pa
+        
+        url_type = parquet_file.schema_arrow.field('readBookUrl').type
+        if not (pa.types.is_string(url_type) or pa.types.is_large_string(url_type)):
+            return None
+        urls, url_counts, url_hashes = [], [], []
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=['readBookUrl', 'id']):
+            if batch.num_rows == 0:
+                continue
+            if batch.column(0).null_count:
+                return None
+            batch_urls = batch.column(0).to_numpy(zero_copy_only=False)
+            if (batch_urls[1:] < batch_urls[:-1]).any() or (urls and batch_urls[0] < urls[-1]):
+                return None
+            
+            starts = np.flatnonzero(np.concatenate([[True], batch_urls[1:] != batch_urls[:-1]]))
+            counts = np.diff(np.append(starts, len(batch_urls)))
+            hashes = np.add.reduceat(
+                pd.util.hash_pandas_object(batch.column(1).to_pandas(), index=False).to_numpy(), starts
+            )
+            urls.extend(batch_urls[starts].tolist())
+            url_counts.append(counts)
+            url_hashes.append(hashes)
+        if not urls:
+            return [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64)
+        
+        # 同一链接的评论跨越多个批次时合并
+        run_urls = np.array(urls, dtype=object)
+        keep = np.flatnonzero(np.concatenate([[True], run_urls[1:] != run_urls[:-1]]))
+        return (
+            run_urls[keep].tolist(),
+            np.add.reduceat(np.concatenate(url_counts), keep).astype(np.int64),
+            np.add.reduceat(np.concatenate(url_hashes), keep).astype(np.uint64)
+        )
+    
+    @classmethod
+    def _read_parquet_urls(cls, source_file, columns, urls, changed, all_urls=False):
+        """
+        读取一段有序链接中部分链接的评论
+        
+        按链接范围过滤（下推到行组统计信息和页面），范围内不需要的链接再按值过滤。
+        """
+        import pyarrow.parquet as pq
+        
+        first, last = urls[changed[0]], urls[changed[-1]]
+        table = pq.read_table(
+            source_file, columns=columns,
+            filters=[('readBookUrl', '>=', first), ('readBookUrl', '<=', last)]
+        )
+        comment_data = table.to_pandas()
+        del table
+        if not all_urls:
+            comment_data = comment_data[comment_data['readBookUrl'].isin(urls[changed])]
+        return cls.from_dataframe(comment_data)
+    
+    def save(self, path):
+        """保存为 .npy 文件目录"""
+        os.makedirs(path, exist_ok=True)
+        # 先删除元数据，写到一半中断时不会被当作完整的存储
+        meta_file = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_file):
+            os.remove(meta_file)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+        self.urls.save(path, 'urls')
+        self.comments.save(path, 'comments')
+        with open(meta_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'num_comments': len(self),
+                'source_stat': list(self.source_stat) if self.source_stat is not None else None
+            }, f)
+    
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """从 .npy 文件目录加载"""
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in cls.ARRAYS
+        }
+        return cls(
+            StringTable.load(path, 'urls', mmap_mode=mmap_mode),
+            StringTable.load(path, 'comments', mmap_mode=mmap_mode),
+            source_stat=cls.read_source_stat(path),
+            **arrays
+        )
+    
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, 'meta.json'))
+    
+    @staticmethod
+    def read_source_stat(path):
+        """存储中记录的源文件 (大小, 修改时间ns)，没有记录时返回 None"""
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            source_stat = json.load(f)['source_stat']
+        return tuple(source_stat) if source_stat is not None else None
+    
+    def __len__(self):
+        return len(self.rating_scores)
+    
+    def iter_chunks(self, max_rows):
+        """
+        按图书链接分块，逐个产出 (起始链接号, 结束链接号)
+        
+        每块的评论数不超过 max_rows（单个链接的评论数超过 max_rows 时单独成块）。
+        """
+        return _iter_url_chunks(self.url_indptr, max_rows)
+    
+    def url_fingerprints(self, chunk_rows):
+        """
+        按块计算每个图书链接的评论指纹
+        
+        Returns:
+            (url_counts, url_hashes): 按链接号索引的评论数和评论ID哈希之和（uint64，溢出回绕）
+        """
+        url_hashes = np.zeros(len(self.urls), dtype=np.uint64)
+        for start, end in self.iter_chunks(chunk_rows):
+            indptr = np.asarray(self.url_indptr[start:end + 1])
+            hashes = np.asarray(self.id_hashes[indptr[0]:indptr[-1]])
+            # 每个链接至少有一条评论，reduceat 的区间都不为空
+            url_hashes[start:end] = np.add.reduceat(hashes, indptr[:-1] - indptr[0])
+        return np.diff(self.url_indptr), url_hashes
+    
+    def fingerprints(self, url_book_ids, num_entities, chunk_rows):
+        """
+        按块计算每本书的评论指纹
+        
+        Args:
+            url_book_ids: 每个图书链接对应的图书ID（无法对应到图书的为 -1）
+            num_entities: 实体数
+            chunk_rows: 每块读取的评论数
+        
+        Returns:
+            (comment_counts, comment_hashes): 按实体ID索引的评论数和评论ID哈希之和（uint64，溢出回绕）
+        """
+        url_counts, url_hashes = self.url_fingerprints(chunk_rows)
+        mask = url_book_ids >= 0
+        comment_counts = np.zeros(num_entities, dtype=np.int64)
+        comment_hashes = np.zeros(num_entities, dtype=np.uint64)
+        np.add.at(comment_counts, url_book_ids[mask], url_counts[mask])
+        np.add.at(comment_hashes, url_book_ids[mask], url_hashes[mask])
+        return comment_counts, comment_hashes
+
+
+def _iter_url_chunks(url_indptr, max_rows):
+    """按链接行区间 url_indptr 分块，每块的行数不超过 max_rows（单个链接超过时单独成块）"""
+    num_urls = len(url_indptr) - 1
+    start = 0
+    while start < num_urls:
+        limit = url_indptr[start] + max_rows
+        end = int(np.searchsorted(url_indptr, limit, side='right')) - 1
+        end = min(max(end, start + 1), num_urls)
+        yield start, end
+        start = end
+
+
+class _ArrayAppender:
+    """
+    逐段追加写入一维 .npy 文件（总长度未知时使用）
+    
+    先写入长度为 0 的文件头占位，close() 时按实际长度重写文件头。
+    一维数组的文件头固定填充到 64 字节的整数倍，长度变化不影响文件头大小。
+    """
+    
+    def __init__(self, filename, dtype):
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self._file = open(filename, 'wb')
+        self._write_header()
+        self._header_size = self._file.tell()
+    
+    def _write_header(self):
+        np.lib.format.write_array_header_1_0(self._file, {
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (self.length,)
+        })
+    
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self._file.write(memoryview(values).cast('B'))
+        self.length += len(values)
+    
+    def close(self):
+        self._file.seek(0)
+        self._write_header()
+        if self._file.tell() != self._header_size:
+            raise ValueError("数组文件头长度变化")
+        self._file.close()
+
+
+class _StringTableAppender:
+    """逐段追加写入字符串表（{prefix}_data.npy / {prefix}_offsets.npy）"""
+    
+    def __init__(self, path, prefix):
+        self.data = _ArrayAppender(os.path.join(path, f'{prefix}_data.npy'), np.uint8)
+        self.offsets = _ArrayAppender(os.path.join(path, f'{prefix}_offsets.npy'), np.int64)
+        self.offsets.append([0])
+    
+    def append_table(self, table, start, end):
+        """追加字符串表 table 的第 start 到 end - 1 个字符串"""
+        offsets = np.asarray(table.offsets[start:end + 1])
+        base = self.data.length
+        self.data.append(table.data[offsets[0]:offsets[-1]])
+        self.offsets.append(offsets[1:] - offsets[0] + base)
+    
+    def close(self):
+        self.data.close()
+        self.offsets.close()
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+紧凑图存储
+用 NumPy 数组（CSR邻接表）保存知识图谱，替代 pickle 的 networkx.MultiDiGraph
+"""
+import os
+import shutil
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# 节点类型编码
+NODE_TYPES = ('book', 'author', 'publisher', 'translator', 'series', 'user', 'word')
+NODE_TYPE_CODES = {name: code for code, name in enumerate(NODE_TYPES)}
+
+# 关系类型编码
+RELATION_TYPES = (
+    'written_by', 'write',
+    'published_by', 'publish',
+    'translated_by', 'translate',
+    'belongs_to', 'contains',
+)
+RELATION_CODES = {name: code for code, name in enumerate(RELATION_TYPES)}
+
+
+@contextmanager
+def replacing_directory(path):
+    """
+    写入 .npy 文件目录: 先写到临时目录，全部写完后再替换 path
+    
+    用法: with replacing_directory(path) as tmp_path: 在 tmp_path 中写入文件。
+    正在以 mmap 方式读取旧文件的进程不受影响（旧文件只是被删除，不会被截断），
+    其他进程也不会读到写了一半的数组；写入出错时保留原目录。
+    临时目录名带进程号，多个进程同时保存时以最后替换的为准。
+    """
+    path = path.rstrip(os.sep)
+    tmp_path = f'{path}.tmp.{os.getpid()}'
+    old_path = f'{path}.old.{os.getpid()}'
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    try:
+        yield tmp_path
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    
+    if os.path.isdir(path):
+        os.rename(path, old_path)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # 其他进程在这期间已放入新目录，保留其结果
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class StringTable:
+    """
+    字符串表
+    
+    所有字符串按 UTF-8 编码拼接为一个字节数组，offsets[i]:offsets[i + 1] 为第 i 个字符串
+    """
+    
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+    
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [str(s).encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(data, offsets)
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def get_bytes(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+    
+    def bisect_left(self, value, lo=0, hi=None, order=None):
+        """
+        在有序字符串表中二分查找（UTF-8 字节序与 Python 字符串序一致）
+        
+        Args:
+            value: 要查找的字符串
+            order: 排序位置 -> 字符串下标，None 表示字符串表本身有序
+        """
+        return self._bisect(value.encode('utf-8'), lo, hi, order, right=False)
+    
+    def bisect_right(self, value, lo=0, hi=None, order=None):
+        return self._bisect(value.encode('utf-8'), lo, hi, order, right=True)
+    
+    def _bisect(self, key, lo, hi, order, right):
+        if hi is None:
+            hi = len(self) if order is None else len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            item = self.get_bytes(mid if order is None else order[mid])
+            if item < key or (right and item == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def save(self, path, prefix):
+        np.save(os.path.join(path, f'{prefix}_data.npy'), self.data)
+        np.save(os.path.join(path, f'{prefix}_offsets.npy'), self.offsets)
+    
+    @classmethod
+    def load(cls, path, prefix, mmap_mode=None):
+        return cls(
+            np.load(os.path.join(path, f'{prefix}_data.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, f'{prefix}_offsets.npy'), mmap_mode=mmap_mode)
+        )
+
+
+class GraphStore:
+    """
+    CSR格式的有向多重图
+    
+    - node_types: int32 数组，节点类型编码（见 NODE_TYPES）
+    - indptr / indices: 节点 u 的出边终点为 indices[indptr[u]:indptr[u + 1]]
+    - edge_relations: int8 数组，与 indices 对齐的关系类型编码（见 RELATION_TYPES）
+    - names: 实体名称表
+    - urls / ratings: 图书的豆瓣链接和评分（其他实体为空串和0）
+    
+    同一节点的出边保持插入顺序，neighbors() 的结果与 networkx 一致。
+    所有数组都可以用 mmap_mode='r' 加载，多个进程共享同一份页缓存。
+    """
+    
+    def __init__(self, node_types, indptr, indices, edge_relations, names, urls=None, ratings=None):
+        self.node_types = node_types
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_relations = edge_relations
+        self.names = names
+        self.urls = urls
+        self.ratings = ratings
+    
+    @classmethod
+    def from_relations(cls, entities, relations):
+        """
+        从实体字典和关系三元组构建
+        
+        Args:
+            entities: {entity_id: {'type': ..., 'name': ...}}，实体ID为 0..N-1
+            relations: [(head, relation, tail), ...]
+        """
+        node_types, names, urls, ratings = cls.node_arrays(entities)
+        heads = np.fromiter((r[0] for r in relations), dtype=np.int64, count=len(relations))
+        tails = np.fromiter((r[2] for r in relations), dtype=np.int32, count=len(relations))
+        codes = np.fromiter((RELATION_CODES[r[1]] for r in relations), dtype=np.int8, count=len(relations))
+        return cls.from_arrays(node_types, heads, tails, codes, names, urls, ratings)
+    
+    @staticmethod
+    def node_arrays(entities):
+        """从实体字典提取 (节点类型数组, 名称列表, URL列表, 评分列表)"""
+        num_nodes = max(entities) + 1 if entities else 0
+        node_types = np.full(num_nodes, -1, dtype=np.int32)
+        names = [''] * num_nodes
+        urls = [''] * num_nodes
+        ratings = [0] * num_nodes
+        for entity_id, entity in entities.items():
+            node_types[entity_id] = NODE_TYPE_CODES[entity['type']]
+            names[entity_id] = entity.get('name', '')
+            if entity['type'] == 'book':
+                urls[entity_id] = entity.get('url', '')
+                ratings[entity_id] = entity.get('rating', 0)
+        return node_types, names, urls, ratings
+    
+    @classmethod
+    def from_arrays(cls, node_types, heads, tails, codes, names, urls, ratings):
+        """
+        从边数组构建（同一起点的边保持输入顺序）
+        
+        names / urls 为字符串列表，ratings 中无法解析为数字的评分记为0
+        """
+        ratings = pd.to_numeric(pd.Series(ratings, dtype=object), errors='coerce').fillna(0)
+        order = np.argsort(heads, kind='stable')
+        counts = np.bincount(heads, minlength=len(node_types))
+        indptr = np.zeros(len(node_types) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(
+            np.asarray(node_types, dtype=np.int32),
+            indptr,
+            np.asarray(tails, dtype=np.int32)[order],
+            np.asarray(codes, dtype=np.int8)[order],
+            StringTable.from_strings(names),
+            StringTable.from_strings(urls),
+            ratings.to_numpy(dtype=np.float64)
+        )
+    
+    def save(self, path):
+        """保存为 .npy 文件目录（写入临时目录后替换，见 replacing_directory）"""
+        with replacing_directory(path) as tmp_path:
+            np.save(os.path.join(tmp_path, 'node_types.npy'), self.node_types)
+            np.save(os.path.join(tmp_path, 'indptr.npy'), self.indptr)
+            np.save(os.path.join(tmp_path, 'indices.npy'), self.indices)
+            np.save(os.path.join(tmp_path, 'edge_relations.npy'), self.edge_relations)
+            self.names.save(tmp_path, 'names')
+            self.urls.save(tmp_path, 'urls')
+            np.save(os.path.join(tmp_path, 'ratings.npy'), self.ratings)
+    
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """从 .npy 文件目录加载，mmap_mode='r' 时以内存映射方式只读加载"""
+        return cls(
+            np.load(os.path.join(path, 'node_types.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'indptr.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'indices.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'edge_relations.npy'), mmap_mode=mmap_mode),
+            StringTable.load(path, 'names', mmap_mode=mmap_mode),
+            StringTable.load(path, 'urls', mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'ratings.npy'), mmap_mode=mmap_mode)
+        )
+    
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, 'ratings.npy'))
+    
+    def number_of_nodes(self):
+        return len(self.node_types)
+    
+    def number_of_edges(self):
+        return len(self.indices)
+    
+    def entity_types(self):
+        """{类型名称: 实体ID数组}"""
+        return {
+            name: np.flatnonzero(self.node_types == code)
+            for code, name in enumerate(NODE_TYPES)
+        }
+    
+    def node_type(self, node):
+        """节点类型名称，节点不存在时返回 None"""
+        code = self.node_types[node]
+        return NODE_TYPES[code] if code >= 0 else None
+    
+    def edges(self, node):
+        """节点的出边: (终点数组, 关系编码数组)"""
+        start, end = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:end], self.edge_relations[start:end]
+    
+    def neighbors(self, node):
+        """节点的后继（去重，保持首次出现顺序）"""
+        start, end = self.indptr[node], self.indptr[node + 1]
+        return list(dict.fromkeys(self.indices[start:end].tolist()))
+    
+    def iter_relations(self):
+        """遍历所有关系三元组 (head, relation, tail)"""
+        for head in range(self.number_of_nodes()):
+            tails, codes = self.edges(head)
+            for tail, code in zip(tails.tolist(), codes.tolist()):
+                yield head, RELATION_TYPES[code], tail
+    
+    def to_networkx(self):
+        """构建等价的 networkx.MultiDiGraph（仅用于调试）"""
+        import networkx as nx
+        
+        graph = nx.MultiDiGraph()
+        for node in range(self.number_of_nodes()):
+            if self.node_types[node] >= 0:
+                graph.add_node(node, type=self.node_type(node), name=self.names[node])
+        for head, relation, tail in self.iter_relations():
+            graph.add_edge(head, tail, relation=relation)
+        return graph
+
+
+class EntityTable(Mapping):
+    """
+    实体表的只读字典视图
+    
+    entity_id -> {'id', 'type', 'name'}，图书另有 'url' 和 'rating'，
+    与 entities.pkl 中的实体字典字段一致（不含 original_data）。
+    """
+    
+    def __init__(self, graph):
+        self.graph = graph
+        self._count = int(np.count_nonzero(graph.node_types >= 0))
+    
+    def __contains__(self, entity_id):
+        return (
+            isinstance(entity_id, (int, np.integer))
+            and 0 <= entity_id < len(self.graph.node_types)
+            and self.graph.node_types[entity_id] >= 0
+        )
+    
+    def __getitem__(self, entity_id):
+        if entity_id not in self:
+            raise KeyError(entity_id)
+        entity_id = int(entity_id)
+        entity_type = NODE_TYPES[self.graph.node_types[entity_id]]
+        entity = {
+            'id': entity_id,
+            'type': entity_type,
+            'name': self.graph.names[entity_id]
+        }
+        if entity_type == 'book':
+            entity['url'] = self.graph.urls[entity_id]
+            entity['rating'] = float(self.graph.ratings[entity_id])
+        return entity
+    
+    def __iter__(self):
+        return iter(np.flatnonzero(self.graph.node_types >= 0).tolist())
+    
+    def __len__(self):
+        return self._count
+
+
+class ArrayView(Mapping):
+    """
+    数组的只读字典视图: id -> values[id]，只包含 mask 为 True 的 id
+    """
+    
+    def __init__(self, values, mask):
+        self.values = values
+        self.mask = mask
+    
+    def __contains__(self, key):
+        return isinstance(key, (int, np.integer)) and 0 <= key < len(self.mask) and bool(self.mask[key])
+    
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.values[key].item()
+    
+    def __iter__(self):
+        return iter(np.flatnonzero(self.mask).tolist())
+    
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
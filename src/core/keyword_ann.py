@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+评论关键词向量的近似最近邻索引
+每本书的关键词权重转换为 TF-IDF + L2 归一化的稀疏向量，按余弦相似度查找最相似的图书
+"""
+import os
+import sys
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from src.core.graph_store import replacing_directory
+
+
+class KeywordANNIndex:
+    """
+    稀疏向量的近似最近邻索引（按影响力排序的截断倒排表）
+    
+    - 向量: 文档 x 关键词 的 CSR 矩阵（indptr / indices / data），
+      值为 关键词权重 x 逆文档频率，每行 L2 归一化
+    - 倒排表: 关键词 -> 文档（post_indptr / post_docs / post_values），
+      每个关键词的文档按该词在文档向量中的取值降序排列，只保留前 max_postings 个
+    
+    查询时只取查询向量中取值最大的 query_terms 个关键词，读取它们的倒排表，
+    用这些分量累加的部分得分选出候选，再用精确余弦相似度重排。
+    两本书的余弦相似度主要由双方都很重要的关键词贡献，因此召回率很高，
+    而每次查询读取的倒排项数有上限，与图书总数无关。
+    
+    内部文档号即在 doc_book_ids 中的位置（图书ID升序），
+    所有数据都是数组，可以保存后用 mmap_mode='r' 加载。
+    """
+    
+    ARRAYS = ('doc_book_ids', 'indptr', 'indices', 'data', 'post_indptr', 'post_docs', 'post_values')
+    
+    def __init__(self, num_keywords, data_version, doc_book_ids, indptr, indices, data,
+                 post_indptr, post_docs, post_values):
+        self.num_keywords = num_keywords
+        self.data_version = data_version
+        self.doc_book_ids = doc_book_ids  # 文档号 -> 图书ID
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.post_indptr = post_indptr
+        self.post_docs = post_docs
+        self.post_values = post_values
+        self.vectors = sparse.csr_matrix((data, indices, indptr), shape=(len(doc_book_ids), num_keywords))
+    
+    @classmethod
+    def build(cls, store, max_postings=None, data_version=''):
+        """
+        从关键词存储构建索引
+        
+        Args:
+            store: KeywordStore
+            max_postings: 每个关键词保留的倒排项数，None表示使用 config.KEYWORD_ANN_MAX_POSTINGS
+            data_version: 数据版本标识
+        """
+        max_postings = max_postings or config.KEYWORD_ANN_MAX_POSTINGS
+        
+        # 只为有关键词的图书建立向量
+        counts = np.diff(store.book_indptr)
+        doc_book_ids = np.flatnonzero(counts > 0)
+        doc_counts = counts[doc_book_ids]
+        indptr = np.zeros(len(doc_book_ids) + 1, dtype=np.int64)
+        np.cumsum(doc_counts, out=indptr[1:])
+        positions = np.repeat(store.book_indptr[doc_book_ids] - indptr[:-1], doc_counts) + np.arange(indptr[-1])
+        indices = np.asarray(store.book_keyword_ids[positions], dtype=np.int32)
+        weights = np.asarray(store.book_keyword_weights[positions], dtype=np.float64)
+        
+        # TF-IDF（平滑 idf）+ L2 归一化
+        num_keywords = len(store.keywords)
+        df = np.bincount(indices, minlength=num_keywords)
+        idf = np.log((1 + len(doc_book_ids)) / (1 + df)) + 1
+        data = weights * idf[indices]
+        norms = np.sqrt(np.add.reduceat(data ** 2, indptr[:-1])) if len(data) else np.zeros(0)
+        norms[norms == 0] = 1.0
+        data = (data / np.repeat(norms, doc_counts)).astype(np.float32)
+        
+        vectors = sparse.csr_matrix((data, indices, indptr), shape=(len(doc_book_ids), num_keywords))
+        vectors.sort_indices()
+        
+        # 倒排表: 按 (关键词, 取值降序, 文档号) 排序后每个关键词截断
+        docs = np.repeat(np.arange(len(doc_book_ids), dtype=np.int32), doc_counts)
+        order = np.lexsort((docs, -data, indices))
+        post_keywords = indices[order]
+        keyword_start = np.zeros(num_keywords + 1, dtype=np.int64)
+        np.cumsum(df, out=keyword_start[1:])
+        rank = np.arange(len(order)) - keyword_start[post_keywords]
+        keep = order[rank < max_postings]
+        post_indptr = np.zeros(num_keywords + 1, dtype=np.int64)
+        np.cumsum(np.minimum(df, max_postings), out=post_indptr[1:])
+        
+        return cls(
+            num_keywords, data_version, doc_book_ids,
+            vectors.indptr.astype(np.int64), vectors.indices, vectors.data,
+            post_indptr, docs[keep], data[keep]
+        )
+    
+    def save(self, path):
+        """保存为 .npy 文件目录（写入临时目录后替换，见 replacing_directory）"""
+        with replacing_directory(path) as tmp_path:
+            for name in self.ARRAYS:
+                np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(self, name))
+            # 元数据最后写入，作为索引完整的标志
+            with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'num_keywords': self.num_keywords, 'data_version': self.data_version}, f)
+    
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """从 .npy 文件目录加载"""
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in cls.ARRAYS
+        }
+        return cls(meta['num_keywords'], meta['data_version'], **arrays)
+    
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, 'meta.json'))
+    
+    def __len__(self):
+        return len(self.doc_book_ids)
+    
+    def doc_of(self, book_id):
+        """图书ID对应的文档号，没有关键词向量时返回 None"""
+        pos = int(np.searchsorted(self.doc_book_ids, book_id))
+        if pos < len(self.doc_book_ids) and self.doc_book_ids[pos] == book_id:
+            return pos
+        return None
+    
+    def candidates(self, doc, k, query_terms=None):
+        """
+        用查询向量最重要的 query_terms 个关键词的倒排表选出候选文档
+        
+        按部分得分（已读取分量的点积）保留前 max(10k, 100) 个候选。
+        """
+        query_terms = query_terms or config.KEYWORD_ANN_QUERY_TERMS
+        start, end = self.indptr[doc], self.indptr[doc + 1]
+        keywords = self.indices[start:end]
+        values = self.data[start:end]
+        top = np.argsort(-values, kind='stable')[:query_terms]
+        
+        starts = self.post_indptr[keywords[top]]
+        lengths = self.post_indptr[keywords[top] + 1] - starts
+        if lengths.sum() == 0:
+            return np.zeros(0, dtype=np.int64)
+        # 展开所有 [start, start + length) 区间
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        docs, inverse = np.unique(self.post_docs[offsets], return_inverse=True)
+        partial = np.bincount(
+            inverse, weights=self.post_values[offsets] * np.repeat(values[top], lengths), minlength=len(docs)
+        )
+        
+        keep = docs != doc
+        docs, partial = docs[keep], partial[keep]
+        limit = max(10 * k, 100)
+        if len(docs) > limit:
+            docs = docs[np.argpartition(-partial, limit - 1)[:limit]]
+        return docs
+    
+    def query(self, book_id, k=10, query_terms=None):
+        """
+        近似查找与该书评论关键词最相似的 k 本书
+        
+        Returns:
+            [(图书ID, 余弦相似度), ...]，按相似度降序（同分按图书ID升序）
+        """
+        doc = self.doc_of(book_id)
+        if doc is None or k <= 0:
+            return []
+        docs = self.candidates(doc, k, query_terms)
+        if len(docs) == 0:
+            return []
+        return self._top(docs, self._similarity(doc, docs), k)
+    
+    def _similarity(self, doc, docs):
+        """查询文档与候选文档的精确余弦相似度（向量已归一化，即点积）"""
+        query_keywords = self.indices[self.indptr[doc]:self.indptr[doc + 1]]
+        query_values = self.data[self.indptr[doc]:self.indptr[doc + 1]]
+        
+        # 展开候选文档的所有分量，与查询向量（关键词有序）按关键词对齐
+        starts = self.indptr[docs]
+        lengths = self.indptr[docs + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        keywords = self.indices[offsets]
+        pos = np.minimum(np.searchsorted(query_keywords, keywords), len(query_keywords) - 1)
+        matched = query_keywords[pos] == keywords
+        products = np.where(matched, self.data[offsets] * query_values[pos], 0.0)
+        rows = np.repeat(np.arange(len(docs)), lengths)
+        return np.bincount(rows, weights=products, minlength=len(docs))
+    
+    def exact_query(self, book_id, k=10):
+        """精确查找（与所有文档计算余弦相似度），用于评估召回率"""
+        doc = self.doc_of(book_id)
+        if doc is None or k <= 0:
+            return []
+        similarity = self.vectors.dot(self.vectors[doc].T).toarray().ravel()
+        docs = np.arange(len(self.doc_book_ids))
+        keep = docs != doc
+        return self._top(docs[keep], similarity[keep], k)
+    
+    def _top(self, docs, similarity, k):
+        """相似度最高的 k 个文档（只保留相似度大于 0 的）"""
+        keep = similarity > 0
+        docs, similarity = docs[keep], similarity[keep]
+        order = np.lexsort((docs, -similarity))[:k]
+        return list(zip(self.doc_book_ids[docs[order]].tolist(), similarity[order].tolist()))
+    
+    def measure_recall(self, k=10, sample_size=200, seed=0, query_terms=None):
+        """
+        随机抽样图书，对比近似查找和精确查找的结果
+        
+        Returns:
+            {'recall': 平均召回率, 'ann_ms': 近似查找平均耗时, 'exact_ms': 精确查找平均耗时, 'queries': 查询数}
+        """
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(self.doc_book_ids, size=min(sample_size, len(self.doc_book_ids)), replace=False)
+        recalls = []
+        ann_time = exact_time = 0.0
+        for book_id in sample.tolist():
+            start = time.perf_counter()
+            approx = self.query(book_id, k, query_terms)
+            ann_time += time.perf_counter() - start
+            
+            start = time.perf_counter()
+            exact = self.exact_query(book_id, k)
+            exact_time += time.perf_counter() - start
+            
+            if exact:
+                recalls.append(len({b for b, _ in approx} & {b for b, _ in exact}) / len(exact))
+        queries = max(len(sample), 1)
+        return {
+            'recall': float(np.mean(recalls)) if recalls else 0.0,
+            'ann_ms': ann_time / queries * 1000,
+            'exact_ms': exact_time / queries * 1000,
+            'queries': len(sample)
+        }
+
+
+if __name__ == '__main__':
+    from src.core.keyword_recommender import KeywordBasedRecommender
+    
+    recommender = KeywordBasedRecommender()
+    recommender.load_kg()
+    recommender.load_and_analyze_comments()
+    index = recommender.build_keyword_ann()
+    
+    result = index.measure_recall(k=10)
+    print(f"Recall@10 = {result['recall']:.3f}, 近似查找 {result['ann_ms']:.2f} ms/次, "
+          f"精确查找 {result['exact_ms']:.2f} ms/次（{result['queries']} 次查询）")
@@ -4,10 +4,12 @@
 提取评论中的关键词，进行语义匹配推荐
 """
 import pickle
+import time
+import random
+import logging
+import hashlib
 import numpy as np
-import networkx as nx
 from collections import defaultdict, Counter
-import pandas as pd
 import sys
 from pathlib import Path
 
@@ -16,6 +18,17 @@ project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 from config import config
+from src.core.graph_store import GraphStore, EntityTable, ArrayView, NODE_TYPE_CODES, RELATION_CODES
+from src.core.keyword_store import KeywordStore
+from src.core.comment_store import CommentStore
+from src.core.scoring_engine import SparseScoringEngine
+from src.core.neighbor_table import NeighborTable
+from src.core.keyword_ann import KeywordANNIndex
+from src.core.title_index import TitleIndex
+from src.core import pos_cache
+from src.core.result_cache import create_result_cache
+from src.utils import timing
+from src.utils.logger_config import get_logger
 import jieba
 import jieba.analyse
 from sklearn.feature_extraction.text import TfidfVectorizer
@@ -23,30 +36,141 @@ from sklearn.metrics.pairwise import cosine_similarity
 import os
 
 
+# 优先保留的词性（图书特征相关）
+FEATURE_POS = frozenset({
+    'n',   # 名词（主题、概念）
+    'nr',  # 人名（角色）
+    'ns',  # 地名（场景）
+    'nt',  # 机构名
+    'nz',  # 其他专名
+    'vn',  # 名动词（行为特征）
+    'an',  # 名形词（属性特征）
+    'i',   # 成语
+    'l',   # 习语
+})
+
+# 主题词：科幻、历史、爱情、悬疑等
+THEME_KEYWORDS = frozenset({
+    '科幻', '历史', '爱情', '悬疑', '推理', '奇幻', '武侠', '都市',
+    '军事', '战争', '冒险', '魔幻', '玄幻', '修仙', '穿越', '重生',
+    '宫斗', '商战', '职场', '校园', '青春', '文学', '哲学', '心理'
+})
+
+# 情节元素：战斗、阴谋、复仇等
+PLOT_KEYWORDS = frozenset({
+    '战斗', '阴谋', '复仇', '成长', '救赎', '背叛', '牺牲', '冒险',
+    '探索', '发现', '秘密', '真相', '命运', '选择', '挑战', '困境'
+})
+
+# 人物特征：主角、反派、英雄等
+CHARACTER_KEYWORDS = frozenset({
+    '主角', '主人公', '英雄', '反派', '配角', '角色', '人物', '性格',
+    '天才', '强者', '弱者', '智者', '勇士', '领袖', '导师'
+})
+
+# 风格特征：幽默、深刻、细腻等
+STYLE_KEYWORDS = frozenset({
+    '幽默', '深刻', '细腻', '宏大', '震撼', '感人', '温暖', '黑暗',
+    '轻松', '沉重', '诗意', '哲理', '讽刺', '批判', '浪漫', '现实'
+})
+
+# 世界观：宇宙、文明、社会等
+WORLDVIEW_KEYWORDS = frozenset({
+    '宇宙', '文明', '社会', '世界', '时代', '历史', '未来', '现代',
+    '古代', '王朝', '帝国', '国家', '民族', '种族', '星球', '维度'
+})
+
+FEATURE_WORDS = THEME_KEYWORDS | PLOT_KEYWORDS | CHARACTER_KEYWORDS | STYLE_KEYWORDS | WORLDVIEW_KEYWORDS
+
+
+# 关键词提取工作进程的状态（由进程池初始化函数设置，每个工作进程一份）
+_worker_state = {}
+
+
+def _init_comment_worker(stopwords, comment_store_dir, pos_cache_file):
+    """工作进程初始化: 保存停用词，以内存映射方式打开评论列存储，加载词性缓存"""
+    # fork 方式启动时已继承主进程加载的词性缓存
+    if pos_cache.size() == 0:
+        pos_cache.load(pos_cache_file)
+    store = CommentStore.load(comment_store_dir, mmap_mode='r')
+    _worker_state.update(
+        stopwords=stopwords,
+        comments=store.comments,
+        rating_scores=store.rating_scores
+    )
+
+
+def _process_comment_shard(task):
+    """
+    工作进程任务: task 为 (book_id, start, end)，处理评论列存储中该区间内的评论
+    
+    Returns:
+        (处理结果, 本次新标注的词性)
+    """
+    book_id, start, end = task
+    comments = _worker_state['comments']
+    result = KeywordBasedRecommender._process_book_comments(
+        book_id,
+        [comments[i] for i in range(start, end)],
+        _worker_state['rating_scores'][start:end],
+        _worker_state['stopwords']
+    )
+    return result, pos_cache.take_added()
+
+
 class KeywordBasedRecommender:
     """基于评论关键词的推荐器"""
     
+    # 知识图谱关系（固定顺序）及其权重
+    ALL_RELATIONS = ('series', 'author', 'translator', 'publisher')
+    RELATION_WEIGHTS = {
+        'series': 0.4,
+        'author': 0.3,
+        'translator': 0.2,
+        'publisher': 0.15
+    }
+    
     def __init__(self):
-        self.entities = {}
+        self.entities = {}  # EntityTable（实体表视图）
         self.entity_types = {}
-        self.relations = []
-        self.graph = None
+        self.graph = None  # GraphStore（CSR邻接表）
         self.book_entities = []
         self.book_ratings = {}
-        self.book_neighbors_cache = {}
+        self.relation_index = {}  # 关系倒排索引 {关系类型: (indptr, book_ids)}
+        self.title_index = None  # 书名搜索索引
         self.book_url_to_id = {}
         self.comment_stats = {}
         self.book_popularity = {}
         
-        # 关键词相关
+        # 关键词相关（加载缓存后为 KeywordStore 上的只读视图）
+        self.keyword_store = None
         self.book_keywords = {}  # 每本书的关键词
         self.book_keyword_weights = {}  # 关键词权重
         self.all_keywords = set()  # 所有关键词
         self.keyword_to_books = defaultdict(set)  # 关键词到书籍的反向索引
         
+        # 稀疏矩阵打分引擎（首次使用时构建）、预计算近邻表、关键词向量索引和实体嵌入（首次使用时加载）
+        self._scoring_engine = None
+        self._neighbor_table = None
+        self._keyword_ann = None
+        self._embeddings = None
+        
+        # 推荐结果缓存（知识图谱或关键词缓存重新加载时失效）
+        self.result_cache = create_result_cache(
+            backend=config.RESULT_CACHE_BACKEND,
+            max_entries=config.RESULT_CACHE_MAX_ENTRIES,
+            max_bytes=config.RESULT_CACHE_MAX_BYTES,
+            ttl=config.RESULT_CACHE_TTL,
+            sqlite_file=config.RESULT_CACHE_SQLITE_FILE,
+            redis_url=config.RESULT_CACHE_REDIS_URL
+        )
+        
+        # 推荐过程的详细日志（DEBUG 级别，按 config.RECOMMEND_LOG_SAMPLE_RATE 采样输出）
+        self.logger = get_logger('recommender', getattr(logging, config.RECOMMEND_LOG_LEVEL))
+        
         # 加载停用词
         self.stopwords = self._load_stopwords()
-        
+    
     def _load_stopwords(self):
         """加载停用词"""
         try:
@@ -95,156 +219,362 @@ class KeywordBasedRecommender:
         print("正在加载知识图谱...")
         
         try:
-            print(f"加载实体文件: {config.KG_ENTITIES_FILE}")
-            with open(config.KG_ENTITIES_FILE, 'rb') as f:
-                data = pickle.load(f)
-                self.entities = data['entities']
-                self.entity_types = data['entity_types']
-            print(f"✓ 实体加载成功: {len(self.entities)} 个实体")
-        except Exception as e:
-            print(f"❌ 加载实体文件失败: {str(e)}")
-            print(f"文件路径: {config.KG_ENTITIES_FILE}")
-            print(f"请检查文件是否完整，或运行 python knowledge_graph_builder.py 重新生成")
-            raise
-        
-        try:
-            print(f"加载关系文件: {config.KG_RELATIONS_FILE}")
-            with open(config.KG_RELATIONS_FILE, 'rb') as f:
-                data = pickle.load(f)
-                self.relations = data['relations']
-                self.graph = data['graph']
-            print(f"✓ 关系加载成功: {len(self.relations)} 条关系")
+            if not GraphStore.exists(config.KG_GRAPH_DIR):
+                self._convert_legacy_kg()
+            
+            # 以内存映射方式只读加载，多个工作进程共享同一份页缓存
+            print(f"加载知识图谱数组: {config.KG_GRAPH_DIR}")
+            self.graph = GraphStore.load(config.KG_GRAPH_DIR, mmap_mode='r')
+            self.entities = EntityTable(self.graph)
+            self.entity_types = self.graph.entity_types()
+            print(f"✓ 知识图谱加载成功: {len(self.entities)} 个实体, {self.graph.number_of_edges()} 条关系")
         except Exception as e:
-            print(f"❌ 加载关系文件失败: {str(e)}")
-            print(f"文件路径: {config.KG_RELATIONS_FILE}")
+            print(f"❌ 加载知识图谱失败: {str(e)}")
+            print(f"文件路径: {config.KG_GRAPH_DIR}")
             print(f"请检查文件是否完整，或运行 python knowledge_graph_builder.py 重新生成")
             raise
         
         self.book_entities = self.entity_types.get('book', [])
+        self.book_ratings = ArrayView(self.graph.ratings, self.graph.node_types == NODE_TYPE_CODES['book'])
         
-        print("构建图书索引和缓存...")
-        for book_id in self.book_entities:
-            book = self.entities[book_id]
-            self.book_ratings[book_id] = float(book.get('rating', 0))
-            book_url = book.get('url', '')
-            if book_url:
-                self.book_url_to_id[book_url] = book_id
-            self.book_neighbors_cache[book_id] = self._get_neighbors_by_type(book_id)
+        print("构建关系倒排索引...")
+        self._build_relation_index()
+        self._scoring_engine = None
+        self._neighbor_table = None
+        self._keyword_ann = None
+        self._embeddings = None
+        self.result_cache.invalidate(self._cache_namespace())
+        
+        if not TitleIndex.exists(config.KG_TITLE_INDEX_DIR):
+            print("构建书名索引...")
+            self._build_title_index().save(config.KG_TITLE_INDEX_DIR)
+        self.title_index = TitleIndex.load(config.KG_TITLE_INDEX_DIR, mmap_mode='r')
         
-        print(f"知识图谱加载完成: {len(self.entities)} 个实体, {len(self.relations)} 条关系")
+        print(f"知识图谱加载完成: {len(self.entities)} 个实体, {self.graph.number_of_edges()} 条关系")
+    
+    def _convert_legacy_kg(self):
+        """将旧版 pickle 格式（entities.pkl + relations.pkl）转换为数组存储"""
+        print(f"未找到知识图谱数组，从旧版 pickle 文件转换...")
+        with open(config.KG_ENTITIES_FILE, 'rb') as f:
+            entities = pickle.load(f)['entities']
+        with open(config.KG_RELATIONS_FILE, 'rb') as f:
+            relations = pickle.load(f)['relations']
+        GraphStore.from_relations(entities, relations).save(config.KG_GRAPH_DIR)
+        print(f"已转换为数组存储: {config.KG_GRAPH_DIR}")
+    
+    def _build_title_index(self):
+        """从知识图谱构建书名索引"""
+        book_ids = np.asarray(self.book_entities)
+        return TitleIndex.build(
+            book_ids,
+            [self.graph.names[book_id] for book_id in book_ids.tolist()],
+            self.graph.ratings[book_ids]
+        )
     
     def load_and_analyze_comments(self):
-        """加载并深度分析评论 - 提取关键词（支持缓存）"""
+        """
+        加载并深度分析评论 - 提取关键词（支持增量缓存）
         
-        # 检查是否有缓存
-        cache_file = os.path.join(config.KG_DIR, 'comment_keywords.pkl')
+        缓存中保存了每本书的评论指纹（评论数 + 评论ID哈希）。评论文件变化后，
+        只对指纹发生变化的图书重新提取关键词，结果合并到已有缓存中。
+        """
         
-        if os.path.exists(cache_file):
-            print(f"发现关键词缓存文件，直接加载...")
-            try:
-                with open(cache_file, 'rb') as f:
-                    cache_data = pickle.load(f)
-                    self.book_keywords = cache_data['book_keywords']
-                    self.book_keyword_weights = cache_data['book_keyword_weights']
-                    self.all_keywords = cache_data['all_keywords']
-                    self.keyword_to_books = cache_data['keyword_to_books']
-                    self.comment_stats = cache_data['comment_stats']
-                    self.book_popularity = cache_data['book_popularity']
-                
-                print(f"缓存加载完成:")
-                print(f"  - {len(self.book_keywords)} 本书有关键词")
-                print(f"  - 共 {len(self.all_keywords)} 个不同关键词")
-                return
-            except Exception as e:
-                print(f"缓存加载失败: {e}，重新提取关键词")
+        self._scoring_engine = None
+        self._neighbor_table = None
+        self._keyword_ann = None
+        cached = self._load_keyword_cache()
+        
+        # 评论文件未变化，直接使用缓存
+        if cached is not None and cached.source_stat is not None \
+                and tuple(cached.source_stat.tolist()) == self._comment_file_stat():
+            self._attach_keyword_store(cached)
+            print(f"缓存加载完成:")
+            print(f"  - {len(self.book_keywords)} 本书有关键词")
+            print(f"  - 共 {len(self.all_keywords)} 个不同关键词")
+            return
+        
+        # 只部署了关键词缓存（没有评论文件和评论列存储）时无法检查更新，直接使用缓存
+        if self._comment_file_stat() is None:
+            if cached is not None:
+                print(f"未找到评论文件和评论列存储，使用已有的关键词缓存")
+                self._attach_keyword_store(cached)
+            else:
+                print(f"未找到评论文件和评论列存储，也没有关键词缓存，跳过关键词提取")
+            return
         
-        # 没有缓存，开始提取
         try:
-            print("正在加载评论数据...")
-            comment_data = pd.read_pickle(config.COMMENT_FILE)
-            print(f"评论数据加载完成: {len(comment_data)} 条评论")
-            
-            # 解析评分
-            def parse_rating(rating_str):
-                if pd.isna(rating_str):
-                    return 0
-                try:
-                    rating_str = str(rating_str)
-                    if 'rating' in rating_str:
-                        num = rating_str.replace('rating', '').split('-')[0]
-                        return int(num)
-                    return 0
-                except:
-                    return 0
-            
-            comment_data['rating_score'] = comment_data['rating'].apply(parse_rating)
-            
-            print("提取评论关键词（使用多进程加速）...")
-            
-            # 按图书分组
-            book_groups = list(comment_data.groupby('readBookUrl'))
-            print(f"共 {len(book_groups)} 本书需要处理")
-            
-            # 使用多进程并行处理
-            from multiprocessing import Pool, cpu_count
+            comment_store = self._open_comment_store()
+            print(f"评论数据: {len(comment_store)} 条评论, {len(comment_store.urls)} 个图书链接")
             
-            num_processes = max(1, cpu_count() - 1)  # 留一个核心给系统
-            print(f"使用 {num_processes} 个进程并行处理...")
+            self.book_url_to_id = {}
+            for book_id in np.asarray(self.book_entities).tolist():
+                book_url = self.graph.urls[book_id]
+                if book_url:
+                    self.book_url_to_id[book_url] = book_id
             
-            # 准备数据
-            tasks = []
-            for book_url, comments in book_groups:
-                if pd.isna(book_url):
-                    continue
-                book_id = self.book_url_to_id.get(str(book_url))
-                if book_id:
-                    tasks.append((book_url, comments, book_id, self.stopwords))
+            # 每个图书链接对应的图书ID（无法对应到图书的为 -1）
+            url_book_ids = np.array(
+                [self.book_url_to_id.get(url, -1) for url in comment_store.urls], dtype=np.int64
+            )
+            comment_counts, comment_hashes = comment_store.fingerprints(
+                url_book_ids, self.graph.number_of_nodes(), config.COMMENT_CHUNK_ROWS
+            )
             
-            # 并行处理
-            with Pool(processes=num_processes) as pool:
-                results = []
-                for i, result in enumerate(pool.imap_unordered(self._process_book_comments, tasks, chunksize=100)):
-                    if result:
-                        results.append(result)
-                    if (i + 1) % 1000 == 0:
-                        print(f"  已处理 {i + 1}/{len(tasks)} 本书")
+            self.book_keywords = {}
+            self.book_keyword_weights = {}
+            self.comment_stats = {}
+            self.book_popularity = {}
+            if cached is None:
+                changed = np.flatnonzero(comment_counts)
+                print(f"没有可用的关键词缓存，全量提取")
+            elif not cached.has_fingerprints():
+                # 旧版缓存没有指纹，以当前评论数据为基准，不重新提取
+                changed = np.zeros(0, dtype=np.int64)
+                print(f"关键词缓存中没有评论指纹，以当前评论数据为基准记录指纹")
+                self._load_keyword_dicts(cached)
+            else:
+                changed = np.flatnonzero(
+                    (comment_counts != cached.comment_counts) | (comment_hashes != cached.comment_hashes)
+                )
+                print(f"评论有变化的图书: {len(changed)} 本，增量提取")
+                self._load_keyword_dicts(cached)
+                for book_id in changed.tolist():
+                    self.book_keywords.pop(book_id, None)
+                    self.book_keyword_weights.pop(book_id, None)
+                    self.comment_stats.pop(book_id, None)
+                    self.book_popularity.pop(book_id, None)
             
-            # 整合结果
-            print("整合处理结果...")
-            for result in results:
-                book_id = result['book_id']
-                self.book_keywords[book_id] = result['keywords']
-                self.book_keyword_weights[book_id] = result['keyword_weights']
-                self.comment_stats[book_id] = result['stats']
-                self.book_popularity[book_id] = result['popularity']
+            if len(changed) > 0:
+                # 每本书一个任务: 列存储中该书评论的行区间
+                urls = np.flatnonzero(np.isin(url_book_ids, changed))
+                urls = urls[np.argsort(url_book_ids[urls], kind='stable')]
+                tasks = list(zip(
+                    url_book_ids[urls].tolist(),
+                    comment_store.url_indptr[urls].tolist(),
+                    comment_store.url_indptr[urls + 1].tolist()
+                ))
+                results = self._extract_keywords(tasks)
                 
-                for kw in result['keywords']:
-                    self.all_keywords.add(kw)
-                    self.keyword_to_books[kw].add(book_id)
+                # 合并结果
+                print("整合处理结果...")
+                for result in results:
+                    book_id = result['book_id']
+                    self.book_keywords[book_id] = result['keywords']
+                    self.book_keyword_weights[book_id] = result['keyword_weights']
+                    self.comment_stats[book_id] = result['stats']
+                    self.book_popularity[book_id] = result['popularity']
             
+            all_keywords = {kw for keywords in self.book_keywords.values() for kw in keywords}
             print(f"\n关键词提取完成:")
             print(f"  - {len(self.book_keywords)} 本书有关键词")
-            print(f"  - 共提取 {len(self.all_keywords)} 个不同关键词")
-            print(f"  - 平均每本书 {np.mean([len(kws) for kws in self.book_keywords.values()]):.1f} 个关键词")
+            print(f"  - 共提取 {len(all_keywords)} 个不同关键词")
+            if self.book_keywords:
+                print(f"  - 平均每本书 {np.mean([len(kws) for kws in self.book_keywords.values()]):.1f} 个关键词")
             
             # 保存缓存
             print("保存关键词缓存...")
-            os.makedirs(config.KG_DIR, exist_ok=True)
-            with open(cache_file, 'wb') as f:
-                pickle.dump({
-                    'book_keywords': self.book_keywords,
-                    'book_keyword_weights': self.book_keyword_weights,
-                    'all_keywords': self.all_keywords,
-                    'keyword_to_books': dict(self.keyword_to_books),
-                    'comment_stats': self.comment_stats,
-                    'book_popularity': self.book_popularity
-                }, f)
-            print(f"缓存已保存到: {cache_file}")
-            
+            self._save_keyword_store(
+                comment_counts=comment_counts,
+                comment_hashes=comment_hashes,
+                source_stat=np.asarray(self._comment_file_stat(), dtype=np.int64)
+            )
+            print(f"缓存已保存到: {config.KG_KEYWORDS_DIR}")
+        
         except Exception as e:
             print(f"评论分析失败: {e}")
             import traceback
             traceback.print_exc()
+            if cached is not None:
+                print("使用已有的关键词缓存")
+                self._attach_keyword_store(cached)
+    
+    def _load_keyword_cache(self):
+        """
+        加载关键词缓存（旧版 pickle 缓存会先转换为数组存储）
+        
+        Returns:
+            KeywordStore，没有可用缓存时返回 None
+        """
+        num_entities = self.graph.number_of_nodes()
+        
+        if KeywordStore.exists(config.KG_KEYWORDS_DIR):
+            print(f"发现关键词缓存，加载...")
+            try:
+                store = KeywordStore.load(config.KG_KEYWORDS_DIR, mmap_mode='r')
+                if len(store.has_stats) == num_entities:
+                    return store
+                print(f"关键词缓存与知识图谱不匹配（知识图谱已重建），忽略缓存")
+            except Exception as e:
+                print(f"缓存加载失败: {e}")
+            return None
+        
+        # 兼容旧版 pickle 缓存，转换为数组存储
+        cache_file = config.KG_COMMENT_KEYWORDS_FILE
+        if os.path.exists(cache_file):
+            print(f"发现旧版关键词缓存文件，转换为数组存储...")
+            try:
+                with open(cache_file, 'rb') as f:
+                    cache_data = pickle.load(f)
+                store = KeywordStore.from_dicts(
+                    num_entities,
+                    cache_data['book_keywords'],
+                    cache_data['book_keyword_weights'],
+                    cache_data['comment_stats'],
+                    cache_data['book_popularity']
+                )
+                store.save(config.KG_KEYWORDS_DIR)
+                return KeywordStore.load(config.KG_KEYWORDS_DIR, mmap_mode='r')
+            except Exception as e:
+                print(f"缓存加载失败: {e}")
+        return None
+    
+    @classmethod
+    def _data_version(cls):
+        """
+        当前数据的版本标识（知识图谱和关键词缓存文件的大小与修改时间）
+        
+        近邻表、关键词向量索引记录生成时的数据版本，与此不一致时失效。
+        """
+        parts = cls._file_stamps((config.KG_GRAPH_DIR, config.KG_KEYWORDS_DIR))
+        return hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+    
+    @classmethod
+    def _cache_namespace(cls):
+        """
+        推荐结果缓存的命名空间（数据版本 + 近邻表和实体嵌入文件的大小与修改时间）
+        
+        共享缓存中只有加载了相同数据的进程会互相命中；离线重新生成近邻表或重新训练嵌入后，
+        neighbors 引擎和 embedding 策略的旧结果也不再命中。
+        """
+        parts = [cls._data_version()] + cls._file_stamps((config.KG_NEIGHBORS_DIR, config.KG_EMBEDDINGS_FILE))
+        return hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+    
+    @staticmethod
+    def _file_stamps(paths):
+        """文件（目录为其中的每个文件）的 '名称:大小:修改时间' 列表，不存在的路径跳过"""
+        parts = []
+        for path in paths:
+            if os.path.isdir(path):
+                files = [(name, os.path.join(path, name)) for name in sorted(os.listdir(path))]
+            elif os.path.exists(path):
+                files = [(os.path.basename(path), path)]
+            else:
+                continue
+            for name, file_path in files:
+                stat = os.stat(file_path)
+                parts.append(f'{name}:{stat.st_size}:{stat.st_mtime_ns}')
+        return parts
+    
+    @staticmethod
+    def _comment_source_file():
+        """评论源文件（存在 Parquet 文件时优先使用）"""
+        if os.path.exists(config.COMMENT_PARQUET_FILE):
+            return config.COMMENT_PARQUET_FILE
+        return config.COMMENT_FILE
+    
+    @classmethod
+    def _comment_file_stat(cls):
+        """
+        评论文件的 (大小, 修改时间ns)，用于判断缓存是否需要检查更新
+        
+        评论文件已删除、只保留了列存储时，返回列存储转换时记录的值。
+        """
+        try:
+            stat = os.stat(cls._comment_source_file())
+        except OSError:
+            if CommentStore.exists(config.COMMENT_STORE_DIR):
+                return CommentStore.read_source_stat(config.COMMENT_STORE_DIR)
+            return None
+        return stat.st_size, stat.st_mtime_ns
+    
+    def _open_comment_store(self):
+        """以内存映射方式打开评论列存储（不存在或评论文件变化后先从评论文件转换）"""
+        previous = None
+        if CommentStore.exists(config.COMMENT_STORE_DIR):
+            previous = CommentStore.load(config.COMMENT_STORE_DIR, mmap_mode='r')
+            if previous.source_stat == self._comment_file_stat():
+                return previous
+            print("评论文件已变化，重新转换列存储...")
+        else:
+            print("未找到评论列存储，从评论文件转换...")
+        start_time = time.time()
+        store = CommentStore.convert(
+            self._comment_source_file(), config.COMMENT_STORE_DIR,
+            previous=previous, chunk_rows=config.COMMENT_CHUNK_ROWS
+        )
+        print(f"转换完成: {len(store)} 条评论，耗时 {time.time() - start_time:.1f} 秒")
+        return store
+    
+    def _load_keyword_dicts(self, store):
+        """将关键词存储中的数据读出为可修改的字典"""
+        self.book_keywords = dict(store.book_keywords_view())
+        self.book_keyword_weights = dict(store.book_keyword_weights_view())
+        self.comment_stats = dict(store.comment_stats_view())
+        self.book_popularity = dict(store.book_popularity_view())
+    
+    def _extract_keywords(self, tasks):
+        """
+        对指定图书提取关键词（多进程），返回 _process_book_comments 的结果列表
+        
+        tasks 为 (book_id, start, end)，即评论列存储中该书评论的行区间。工作进程以内存映射方式
+        打开同一份列存储，只读取任务区间内的评论；停用词通过进程池初始化函数每个工作进程只传一次。
+        """
+        print("提取评论关键词（使用多进程加速）...")
+        print(f"共 {len(tasks)} 本书需要处理")
+        if not tasks:
+            return []
+        
+        # 使用多进程并行处理
+        from multiprocessing import Pool, cpu_count
+        
+        num_processes = max(1, cpu_count() - 1)  # 留一个核心给系统
+        print(f"使用 {num_processes} 个进程并行处理...")
+        
+        # 词性缓存在创建进程池前加载，工作进程新标注的词性随结果回传并写回磁盘
+        pos_cache.load(config.KG_POS_CACHE_FILE)
+        print(f"词性缓存: {pos_cache.size()} 个词")
+        
+        with Pool(processes=num_processes, initializer=_init_comment_worker,
+                  initargs=(self.stopwords, config.COMMENT_STORE_DIR, config.KG_POS_CACHE_FILE)) as pool:
+            results = []
+            for i, (result, new_pos) in enumerate(pool.imap_unordered(_process_comment_shard, tasks, chunksize=100)):
+                pos_cache.update(new_pos)
+                if result:
+                    results.append(result)
+                if (i + 1) % 1000 == 0:
+                    print(f"  已处理 {i + 1}/{len(tasks)} 本书")
+        
+        pos_cache.save(config.KG_POS_CACHE_FILE)
+        print(f"词性缓存已更新: {pos_cache.size()} 个词")
+        
+        return results
+    
+    def _save_keyword_store(self, **fingerprints):
+        """将关键词提取结果保存为数组存储，并切换为内存映射的只读视图"""
+        store = KeywordStore.from_dicts(
+            self.graph.number_of_nodes(),
+            self.book_keywords,
+            self.book_keyword_weights,
+            self.comment_stats,
+            self.book_popularity,
+            **fingerprints
+        )
+        store.save(config.KG_KEYWORDS_DIR)
+        self._attach_keyword_store(KeywordStore.load(config.KG_KEYWORDS_DIR, mmap_mode='r'))
+    
+    def _attach_keyword_store(self, store):
+        """使用关键词存储上的只读视图"""
+        self.keyword_store = store
+        self.book_keywords = store.book_keywords_view()
+        self.book_keyword_weights = store.book_keyword_weights_view()
+        self.all_keywords = store.all_keywords_view()
+        self.keyword_to_books = store.keyword_to_books_view()
+        self.comment_stats = store.comment_stats_view()
+        self.book_popularity = store.book_popularity_view()
+        self._scoring_engine = None
+        self._neighbor_table = None
+        self._keyword_ann = None
+        self.result_cache.invalidate(self._cache_namespace())
     
     @staticmethod
     def _is_book_feature_keyword(word, weight, word_freq_in_book, total_books_with_word):
@@ -257,8 +587,6 @@ class KeywordBasedRecommender:
         3. 词的特异性（不能太常见）
         4. 语义类别（主题、情节、人物、风格等）
         """
-        import jieba.posseg as pseg
-        
         # 1. 基础过滤：太短或太常见的词
         if len(word) < 2:
             return False
@@ -267,69 +595,20 @@ class KeywordBasedRecommender:
         if weight < 0.01:
             return False
         
-        # 3. 词性判断
-        pos_tags = list(pseg.cut(word))
-        if not pos_tags:
+        # 3. 词性判断（带缓存，每个词只标注一次）
+        main_pos = pos_cache.get_pos(word)
+        if not main_pos:
             return False
         
-        main_pos = pos_tags[0].flag
-        
-        # 优先保留的词性（图书特征相关）
-        feature_pos = {
-            'n',   # 名词（主题、概念）
-            'nr',  # 人名（角色）
-            'ns',  # 地名（场景）
-            'nt',  # 机构名
-            'nz',  # 其他专名
-            'vn',  # 名动词（行为特征）
-            'an',  # 名形词（属性特征）
-            'i',   # 成语
-            'l',   # 习语
-        }
-        
-        # 4. 语义类别判断（基于词的特征）
-        # 主题词：科幻、历史、爱情、悬疑等
-        theme_keywords = {
-            '科幻', '历史', '爱情', '悬疑', '推理', '奇幻', '武侠', '都市',
-            '军事', '战争', '冒险', '魔幻', '玄幻', '修仙', '穿越', '重生',
-            '宫斗', '商战', '职场', '校园', '青春', '文学', '哲学', '心理'
-        }
-        
-        # 情节元素：战斗、阴谋、复仇等
-        plot_keywords = {
-            '战斗', '阴谋', '复仇', '成长', '救赎', '背叛', '牺牲', '冒险',
-            '探索', '发现', '秘密', '真相', '命运', '选择', '挑战', '困境'
-        }
-        
-        # 人物特征：主角、反派、英雄等
-        character_keywords = {
-            '主角', '主人公', '英雄', '反派', '配角', '角色', '人物', '性格',
-            '天才', '强者', '弱者', '智者', '勇士', '领袖', '导师'
-        }
-        
-        # 风格特征：幽默、深刻、细腻等
-        style_keywords = {
-            '幽默', '深刻', '细腻', '宏大', '震撼', '感人', '温暖', '黑暗',
-            '轻松', '沉重', '诗意', '哲理', '讽刺', '批判', '浪漫', '现实'
-        }
-        
-        # 世界观：宇宙、文明、社会等
-        worldview_keywords = {
-            '宇宙', '文明', '社会', '世界', '时代', '历史', '未来', '现代',
-            '古代', '王朝', '帝国', '国家', '民族', '种族', '星球', '维度'
-        }
-        
-        # 5. 综合判断
+        # 4. 综合判断
         is_feature = False
         
-        # 规则1：属于特征词类别
-        if word in theme_keywords or word in plot_keywords or word in character_keywords:
-            is_feature = True
-        elif word in style_keywords or word in worldview_keywords:
+        # 规则1：属于特征词类别（主题、情节、人物、风格、世界观）
+        if word in FEATURE_WORDS:
             is_feature = True
         
         # 规则2：词性符合且长度>=3
-        elif main_pos in feature_pos and len(word) >= 3:
+        elif main_pos in FEATURE_POS and len(word) >= 3:
             is_feature = True
         
         # 规则3：专有名词（人名、地名等）
@@ -347,20 +626,25 @@ class KeywordBasedRecommender:
         return is_feature
     
     @staticmethod
-    def _process_book_comments(args):
-        """处理单本书的评论（用于多进程）"""
-        book_url, comments, book_id, stopwords = args
+    def _process_book_comments(book_id, comment_texts, rating_scores, stopwords):
+        """
+        处理单本书的评论（用于多进程）
         
+        Args:
+            book_id: 图书实体ID
+            comment_texts: 评论文本列表
+            rating_scores: 与评论一一对应的评分数组
+            stopwords: 停用词集合
+        """
         try:
             # 获取高分评论
             high_rating_comments = []
             all_comments = []
             
-            for _, row in comments.iterrows():
-                comment_text = str(row.get('bookComment', ''))
+            for comment_text, rating_score in zip(comment_texts, rating_scores.tolist()):
                 if comment_text and comment_text != 'nan':
                     all_comments.append(comment_text)
-                    if row['rating_score'] >= 4:
+                    if rating_score >= 4:
                         high_rating_comments.append(comment_text)
             
             if not all_comments:
@@ -409,9 +693,9 @@ class KeywordBasedRecommender:
             filtered_keywords.sort(key=lambda x: x[1], reverse=True)
             
             # 统计信息
-            total_comments = len(comments)
+            total_comments = len(comment_texts)
             high_rating_count = len(high_rating_comments)
-            avg_rating = comments['rating_score'].mean()
+            avg_rating = rating_scores.mean()
             
             return {
                 'book_id': book_id,
@@ -426,7 +710,7 @@ class KeywordBasedRecommender:
                 },
                 'popularity': np.log1p(total_comments) * (1 + high_rating_count / total_comments if total_comments > 0 else 0)
             }
-            
+        
         except Exception as e:
             return None
     
@@ -440,28 +724,116 @@ class KeywordBasedRecommender:
         }
         
         for neighbor in self.graph.neighbors(book_id):
-            neighbor_entity = self.entities.get(neighbor, {})
-            entity_type = neighbor_entity.get('type')
+            entity_type = self.graph.node_type(neighbor)
             if entity_type in neighbors:
                 neighbors[entity_type].append(neighbor)
         
         return neighbors
     
-    def get_book_by_name(self, book_name):
-        """根据书名查找图书实体"""
-        book_name_lower = book_name.lower()
+    def _build_relation_index(self):
+        """
+        构建 实体 -> 图书 的倒排索引（CSR格式）
         
-        for entity_id in self.book_entities:
-            entity = self.entities[entity_id]
-            if entity['name'].lower() == book_name_lower:
-                return entity_id
+        每种关系一份 (indptr, book_ids)：实体 e 关联的图书为
+        book_ids[indptr[e]:indptr[e + 1]]，按图书ID升序排列。
+        索引由图的反向边（write / publish / translate / contains）向量化生成，
+        在加载时构建一次，之后各请求只读共享。
+        """
+        graph = self.graph
+        num_entities = graph.number_of_nodes()
+        heads = np.repeat(np.arange(num_entities, dtype=np.int64), np.diff(graph.indptr))
+        self.relation_index = {}
         
-        for entity_id in self.book_entities:
-            entity = self.entities[entity_id]
-            if book_name_lower in entity['name'].lower() or entity['name'].lower() in book_name_lower:
-                return entity_id
+        for rel_type, relation in (
+            ('author', 'write'),
+            ('publisher', 'publish'),
+            ('translator', 'translate'),
+            ('series', 'contains'),
+        ):
+            mask = graph.edge_relations == RELATION_CODES[relation]
+            # 按 (实体, 图书) 排序去重
+            pairs = np.unique(heads[mask] * num_entities + graph.indices[mask])
+            entity_ids = pairs // num_entities
+            counts = np.bincount(entity_ids, minlength=num_entities)
+            indptr = np.zeros(num_entities + 1, dtype=np.int64)
+            np.cumsum(counts, out=indptr[1:])
+            
+            self.relation_index[rel_type] = (indptr, (pairs % num_entities).astype(np.int32))
+    
+    def _get_related_books(self, rel_type, entity_id):
+        """获取与实体存在指定关系的所有图书ID（升序）"""
+        indptr, book_ids = self.relation_index[rel_type]
+        if entity_id < 0 or entity_id + 1 >= len(indptr):
+            return []
+        return book_ids[indptr[entity_id]:indptr[entity_id + 1]].tolist()
+    
+    def search_books(self, query, limit=10):
+        """按书名搜索图书（完全匹配 > 前缀匹配 > 子串匹配，同组内按评分排序）"""
+        results = []
+        for book_id in self.title_index.search(query, limit):
+            entity = self.entities[book_id]
+            results.append({
+                'book_id': book_id,
+                'book_name': entity['name'],
+                'book_url': entity.get('url', ''),
+                'rating': entity.get('rating', 0)
+            })
+        return results
+    
+    def similar_books(self, book_id, limit=10):
+        """
+        按读者评论查找相似图书（评论关键词 TF-IDF 向量的余弦相似度，近似最近邻查找）
         
-        return None
+        Returns:
+            [{'book_id', 'book_name', 'book_url', 'rating', 'similarity'}, ...]，按相似度降序
+        """
+        index = self._get_keyword_ann()
+        if index is None:
+            return []
+        results = []
+        for similar_id, similarity in index.query(book_id, limit):
+            entity = self.entities[similar_id]
+            results.append({
+                'book_id': similar_id,
+                'book_name': entity['name'],
+                'book_url': entity.get('url', ''),
+                'rating': entity.get('rating', 0),
+                'similarity': similarity
+            })
+        return results
+    
+    def _get_keyword_ann(self):
+        """
+        获取关键词向量索引（首次使用时加载），不存在或与当前数据版本不一致时返回 None
+        
+        索引由 python -m src.core.keyword_ann 离线构建，请求中不构建。
+        """
+        if self._keyword_ann is None:
+            if not KeywordANNIndex.exists(config.KG_KEYWORD_ANN_DIR):
+                print("未找到关键词向量索引，请先运行 python -m src.core.keyword_ann 构建")
+                self._keyword_ann = False
+            else:
+                index = KeywordANNIndex.load(config.KG_KEYWORD_ANN_DIR, mmap_mode='r')
+                if index.data_version != self._data_version():
+                    print("关键词向量索引与当前数据版本不一致，请重新构建")
+                    self._keyword_ann = False
+                else:
+                    self._keyword_ann = index
+        return self._keyword_ann or None
+    
+    def build_keyword_ann(self):
+        """离线构建关键词向量索引并保存"""
+        print("构建评论关键词向量索引...")
+        start_time = time.time()
+        index = KeywordANNIndex.build(self.keyword_store, data_version=self._data_version())
+        index.save(config.KG_KEYWORD_ANN_DIR)
+        self._keyword_ann = index
+        print(f"✓ 关键词向量索引构建完成: {len(index)} 本书，耗时 {time.time() - start_time:.1f} 秒")
+        return index
+    
+    def get_book_by_name(self, book_name):
+        """根据书名查找图书实体（完全匹配优先，其次包含匹配，多个候选时取热度最高的）"""
+        return self.title_index.resolve(book_name, self.book_popularity)
     
     def _calculate_keyword_similarity(self, book_id1, book_id2):
         """计算两本书的关键词相似度"""
@@ -488,7 +860,8 @@ class KeywordBasedRecommender:
         
         return weighted_sim
     
-    def recommend(self, favorite_books, top_k=20, strategy='mixed', relations=None, selected_keywords=None):
+    def recommend(self, favorite_books, top_k=20, strategy='mixed', relations=None, selected_keywords=None,
+                  engine=None):
         """
         基于关键词的深度推荐（支持自定义策略）
         
@@ -499,101 +872,302 @@ class KeywordBasedRecommender:
                 - 'mixed': 混合策略（知识图谱 + 关键词）
                 - 'kg_only': 仅使用知识图谱关系
                 - 'keyword_only': 仅使用关键词匹配
+                - 'embedding': 知识图谱实体嵌入（与喜欢书籍平均向量的点积，需先训练嵌入）
             relations: 指定使用的知识图谱关系，None表示使用全部
                 - 可选值: ['series', 'author', 'translator', 'publisher']
                 - 例如: ['series', 'author'] 只使用系列和作者关系
             selected_keywords: 用户选择的关键词列表，None表示使用所有关键词
                 - 例如: ['科幻', '宇宙', '文明'] 只使用这些关键词进行匹配
-            
+            engine: 打分引擎，None表示使用 config.SCORING_ENGINE
+                - 'python': 逐个候选累加得分
+                - 'sparse': 稀疏矩阵向量化打分
+                - 'neighbors': 查预计算近邻表（单本书结果与 'sparse' 相同，多本书为合并近邻列表的近似结果）
+        
         Returns:
             推荐结果列表
+        
+        各阶段的耗时和候选数记入 timing.recorder（见 /api/metrics）。
         """
-        # 设置默认关系
-        if relations is None:
-            relations = ['series', 'author', 'translator', 'publisher']
-        
-        # 关系权重配置
-        relation_weights = {
-            'series': 0.4,
-            'author': 0.3,
-            'translator': 0.2,
-            'publisher': 0.15
-        }
+        with timing.span('recommend') as span:
+            recommendations = self._recommend(
+                favorite_books, top_k, strategy, relations, selected_keywords, engine or config.SCORING_ENGINE,
+                self._sample_debug_log()
+            )
+            span.count(len(recommendations))
+        return recommendations
+    
+    def _sample_debug_log(self):
+        """本次请求是否输出详细日志（DEBUG 级别开启时按采样率抽取）"""
+        return self.logger.isEnabledFor(logging.DEBUG) and random.random() < config.RECOMMEND_LOG_SAMPLE_RATE
+    
+    def _recommend(self, favorite_books, top_k, strategy, relations, selected_keywords, engine, verbose):
+        """recommend() 的实现，verbose 为 True 时输出推荐过程的详细日志"""
+        # 设置默认关系（按固定顺序去重，结果只与关系集合有关）
+        relations = self._ordered_relations(relations)
+        relation_weights = self.RELATION_WEIGHTS
+        log = self.logger.debug if verbose else None
         
-        print(f"\n开始推荐，用户喜欢的书籍: {favorite_books}")
-        print(f"推荐策略: {strategy}")
-        if strategy in ['mixed', 'kg_only']:
-            print(f"使用关系: {', '.join(relations)}")
+        if log:
+            log(f"开始推荐，用户喜欢的书籍: {favorite_books}，推荐策略: {strategy}")
+            if strategy in ['mixed', 'kg_only']:
+                log(f"使用关系: {', '.join(relations)}")
         
         # 查找用户喜欢的书籍
-        favorite_entities = []
-        for book_name in favorite_books:
-            entity_id = self.get_book_by_name(book_name)
-            if entity_id is not None:
-                favorite_entities.append(entity_id)
-                print(f"找到书籍: {self.entities[entity_id]['name']}")
-                # 显示该书的关键词
-                if entity_id in self.book_keywords and strategy in ['mixed', 'keyword_only']:
-                    keywords = self.book_keywords[entity_id][:10]
-                    print(f"  关键词: {', '.join(keywords)}")
-            else:
-                print(f"未找到书籍: {book_name}")
+        with timing.span('resolve_names') as span:
+            favorite_entities = []
+            for book_name in favorite_books:
+                entity_id = self.get_book_by_name(book_name)
+                if entity_id is not None:
+                    favorite_entities.append(entity_id)
+                    # 显示该书的关键词
+                    if log:
+                        log(f"找到书籍: {self.entities[entity_id]['name']}")
+                        if entity_id in self.book_keywords and strategy in ['mixed', 'keyword_only']:
+                            log(f"  关键词: {', '.join(self.book_keywords[entity_id][:10])}")
+                elif log:
+                    log(f"未找到书籍: {book_name}")
+            span.count(len(favorite_entities))
         
         if not favorite_entities:
-            print("未找到任何匹配的书籍")
+            if log:
+                log("未找到任何匹配的书籍")
             return []
         
+        # 得分只与 (图书ID集合, 策略, 关系集合, 关键词集合, top_k) 有关，按此查缓存；
+        # favorite_entities 保持输入顺序，推荐理由按喜欢的书的输入顺序列出
+        if selected_keywords:
+            selected_keywords = sorted(set(selected_keywords))
+        cache_key = self._recommend_cache_key(favorite_entities, top_k, strategy, relations, selected_keywords, engine)
+        with timing.span('cache_lookup'):
+            cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            if log:
+                log(f"命中推荐结果缓存，共推荐 {len(cached)} 本书")
+            return cached
+        
         # 收集用户喜欢书籍的所有关键词
-        favorite_keywords = Counter()
-        if strategy in ['mixed', 'keyword_only']:
-            for fav_id in favorite_entities:
-                if fav_id in self.book_keyword_weights:
-                    for kw, weight in self.book_keyword_weights[fav_id].items():
-                        favorite_keywords[kw] += weight
-            
-            # 如果用户指定了关键词，只使用这些关键词
+        with timing.span('preferences') as span:
+            favorite_keywords = self._collect_favorite_keywords(favorite_entities, strategy, selected_keywords)
+            span.count(len(favorite_keywords))
+        if log and strategy in ['mixed', 'keyword_only']:
             if selected_keywords:
-                print(f"\n用户选择的关键词: {', '.join(selected_keywords)}")
-                # 过滤出用户选择的关键词
-                filtered_keywords = Counter()
-                for kw in selected_keywords:
-                    if kw in favorite_keywords:
-                        filtered_keywords[kw] = favorite_keywords[kw]
-                    else:
-                        # 即使不在原关键词中，也给予一定权重
-                        filtered_keywords[kw] = 0.5
-                favorite_keywords = filtered_keywords
+                log(f"用户选择的关键词: {', '.join(selected_keywords)}")
+            log(f"用户偏好关键词（Top 20）: {', '.join([kw for kw, _ in favorite_keywords.most_common(20)])}")
+        
+        if strategy == 'embedding':
+            if self._get_embeddings() is None:
+                return []
+            sorted_candidates = self._score_candidates_embedding(favorite_entities, top_k, log)
+        elif engine == 'sparse':
+            sorted_candidates = self._score_candidates_sparse(
+                favorite_entities, favorite_keywords, top_k, strategy, relations, relation_weights, log
+            )
+        elif engine == 'neighbors':
+            sorted_candidates = self._score_candidates_neighbors(
+                favorite_entities, favorite_keywords, top_k, strategy, relations, relation_weights, selected_keywords,
+                log
+            )
+        else:
+            sorted_candidates = self._score_candidates(
+                favorite_entities, favorite_keywords, top_k, strategy, relations, relation_weights, log
+            )
+        
+        # 构建推荐结果
+        with timing.span('serialize') as span:
+            recommendations = self._build_recommendations(sorted_candidates)
+            span.count(len(recommendations))
+        
+        if log:
+            log(f"推荐完成，共推荐 {len(recommendations)} 本书")
+        self.result_cache.put(cache_key, recommendations)
+        return recommendations
+    
+    def recommend_batch(self, requests, top_k=20, strategy='mixed', relations=None, batch_size=None):
+        """
+        批量推荐（离线任务用）
+        
+        所有输入的书名先去重后一次性解析，再按 batch_size 分块，
+        每块未命中缓存的输入用稀疏矩阵引擎一次批量打分。
+        结果与 recommend(..., engine='sparse') 逐个调用相同，并共用推荐结果缓存。
+        
+        Args:
+            requests: 输入列表，每项为书名列表，或 {'favorite_books': [...], 'selected_keywords': [...]}
+            top_k / strategy / relations: 同 recommend，对所有输入生效
+            batch_size: 每块的输入数，None表示使用 config.RECOMMEND_BATCH_SIZE
+        
+        Yields:
+            按输入顺序逐个产出推荐结果列表（格式同 recommend）；
+            某组输入的 favorite_books 不是书名列表时，在产出第一个结果前抛出 ValueError
+        """
+        requests = [
+            req if isinstance(req, dict) else {'favorite_books': req}
+            for req in requests
+        ]
+        for req in requests:
+            favorite_books = req.get('favorite_books') or []
+            # 字符串会被逐字符当作书名解析
+            if not isinstance(favorite_books, list) or not all(isinstance(name, str) for name in favorite_books):
+                raise ValueError(f"favorite_books 应为书名列表: {favorite_books!r}")
+        relations = self._ordered_relations(relations)
+        batch_size = batch_size or config.RECOMMEND_BATCH_SIZE
+        
+        # 一次性解析所有书名
+        names = {name for req in requests for name in req.get('favorite_books') or []}
+        resolved = {name: self.get_book_by_name(name) for name in names}
+        print(f"批量推荐: {len(requests)} 组输入，解析书名 {len(names)} 个，"
+              f"找到 {sum(1 for book_id in resolved.values() if book_id is not None)} 本")
+        
+        for start in range(0, len(requests), batch_size):
+            chunk = requests[start:start + batch_size]
+            yield from self._recommend_chunk(chunk, resolved, top_k, strategy, relations)
+    
+    def _recommend_chunk(self, chunk, resolved, top_k, strategy, relations):
+        """批量推荐的一块: 先查缓存，未命中的去重后一次批量打分"""
+        keys = []
+        pending = {}  # 缓存键 -> (图书ID列表, 偏好关键词)
+        results = {}
+        for req in chunk:
+            favorite_entities = [
+                resolved[name] for name in req.get('favorite_books') or []
+                if resolved[name] is not None
+            ]
+            if not favorite_entities:
+                keys.append(None)
+                continue
             
-            print(f"\n用户偏好关键词（Top 20）: {', '.join([kw for kw, _ in favorite_keywords.most_common(20)])}")
+            selected_keywords = req.get('selected_keywords')
+            if selected_keywords:
+                selected_keywords = sorted(set(selected_keywords))
+            key = self._recommend_cache_key(favorite_entities, top_k, strategy, relations, selected_keywords, 'sparse')
+            keys.append(key)
+            if key in results or key in pending:
+                continue
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending[key] = (
+                    favorite_entities,
+                    self._collect_favorite_keywords(favorite_entities, strategy, selected_keywords)
+                )
         
-        print(f"\n计算推荐得分...")
-        candidate_scores = {}
+        if pending and strategy == 'embedding':
+            # 嵌入打分对每组输入只是一次矩阵向量乘法，逐组计算；没有嵌入时不缓存空结果
+            has_embeddings = self._get_embeddings() is not None
+            for key, (favorite_entities, _) in pending.items():
+                if not has_embeddings:
+                    results[key] = []
+                    continue
+                results[key] = self._build_recommendations(self._score_candidates_embedding(favorite_entities, top_k))
+                self.result_cache.put(key, results[key])
+        elif pending:
+            engine = self._get_scoring_engine()
+            use_keywords = strategy in ['mixed', 'keyword_only']
+            kg_relations = relations if strategy in ['mixed', 'kg_only'] else []
+            favorite_sets = [favorite_entities for favorite_entities, _ in pending.values()]
+            keyword_sets = [
+                favorite_keywords.most_common(50) if use_keywords else []
+                for _, favorite_keywords in pending.values()
+            ]
+            top_books = engine.top_k_batch(
+                favorite_sets, keyword_sets, top_k,
+                keyword_factor=0.5 if strategy == 'mixed' else 1.0,
+                relations=kg_relations,
+                relation_weights=self.RELATION_WEIGHTS
+            )
+            for (key, (favorite_entities, favorite_keywords)), books in zip(pending.items(), top_books):
+                sorted_candidates = self._explain_candidates(
+                    books, favorite_entities, favorite_keywords, strategy, kg_relations, self.RELATION_WEIGHTS
+                )
+                results[key] = self._build_recommendations(sorted_candidates)
+                self.result_cache.put(key, results[key])
         
-        # 构建反向索引（仅构建需要的关系）
-        author_books = defaultdict(set)
-        series_books = defaultdict(set)
-        publisher_books = defaultdict(set)
-        translator_books = defaultdict(set)
+        print(f"批量推荐: 完成 {len(chunk)} 组，其中计算 {len(pending)} 组")
+        for key in keys:
+            yield [] if key is None else results[key]
+    
+    def _ordered_relations(self, relations):
+        """按固定顺序去重关系类型，None表示使用全部"""
+        if relations is None:
+            return list(self.ALL_RELATIONS)
+        return [rel for rel in self.ALL_RELATIONS if rel in relations]
+    
+    @staticmethod
+    def _recommend_cache_key(favorite_entities, top_k, strategy, relations, selected_keywords, engine):
+        """推荐结果缓存键（selected_keywords 需已排序；图书ID不计顺序）"""
+        return (
+            'recommend',
+            tuple(sorted(favorite_entities)),
+            strategy,
+            tuple(relations) if strategy in ['mixed', 'kg_only'] else None,
+            tuple(selected_keywords) if selected_keywords and strategy in ['mixed', 'keyword_only'] else None,
+            top_k,
+            engine
+        )
+    
+    def _collect_favorite_keywords(self, favorite_entities, strategy, selected_keywords):
+        """收集用户喜欢书籍的关键词及累计权重（Counter）"""
+        favorite_keywords = Counter()
+        if strategy not in ['mixed', 'keyword_only']:
+            return favorite_keywords
         
-        if strategy in ['mixed', 'kg_only']:
-            for book_id in self.book_entities:
-                neighbors = self.book_neighbors_cache[book_id]
-                if 'author' in relations:
-                    for author_id in neighbors['author']:
-                        author_books[author_id].add(book_id)
-                if 'series' in relations:
-                    for series_id in neighbors['series']:
-                        series_books[series_id].add(book_id)
-                if 'publisher' in relations:
-                    for pub_id in neighbors['publisher']:
-                        publisher_books[pub_id].add(book_id)
-                if 'translator' in relations:
-                    for trans_id in neighbors['translator']:
-                        translator_books[trans_id].add(book_id)
+        for fav_id in favorite_entities:
+            if fav_id in self.book_keyword_weights:
+                for kw, weight in self.book_keyword_weights[fav_id].items():
+                    favorite_keywords[kw] += weight
+        
+        # 如果用户指定了关键词，只使用这些关键词
+        if selected_keywords:
+            filtered_keywords = Counter()
+            for kw in selected_keywords:
+                if kw in favorite_keywords:
+                    filtered_keywords[kw] = favorite_keywords[kw]
+                else:
+                    # 即使不在原关键词中，也给予一定权重
+                    filtered_keywords[kw] = 0.5
+            favorite_keywords = filtered_keywords
+        return favorite_keywords
+    
+    def _build_recommendations(self, sorted_candidates):
+        """将 [(book_id, info), ...] 转换为推荐结果列表"""
+        recommendations = []
+        for book_id, info in sorted_candidates:
+            book = self.entities[book_id]
+            rating = self.book_ratings.get(book_id, 0)
+            stats = self.comment_stats.get(book_id, {})
+            
+            # 去重推荐理由
+            unique_reasons = []
+            seen = set()
+            for reason in info['reasons']:
+                if reason not in seen:
+                    unique_reasons.append(reason)
+                    seen.add(reason)
+            
+            recommendations.append({
+                'book_id': book_id,
+                'book_name': book['name'],
+                'book_url': book.get('url', ''),
+                'rating': rating,
+                'score': float(info['score']),
+                'reasons': unique_reasons[:5],  # 最多5条理由
+                'keywords': stats.get('keywords', []),
+                'matched_keywords': info['matched_keywords'][:10],
+                'comment_stats': stats,
+                'explanation': self._generate_explanation(book, unique_reasons, rating)
+            })
+        return recommendations
+    
+    def _score_candidates(self, favorite_entities, favorite_keywords, top_k, strategy, relations, relation_weights,
+                          log=None):
+        """逐个候选累加得分（字典实现），返回按得分排序的 [(book_id, info), ...]"""
+        candidate_scores = {}
         
         # 1. 基于关键词的推荐
         if strategy in ['mixed', 'keyword_only']:
-            print("基于关键词匹配...")
+            if log:
+                log("基于关键词匹配...")
+            started = time.perf_counter()
             for keyword, weight in favorite_keywords.most_common(50):
                 for book_id in self.keyword_to_books.get(keyword, []):
                     if book_id not in favorite_entities:
@@ -604,19 +1178,23 @@ class KeywordBasedRecommender:
                         keyword_score = weight * (0.5 if strategy == 'mixed' else 1.0)
                         candidate_scores[book_id]['score'] += keyword_score
                         candidate_scores[book_id]['matched_keywords'].append(keyword)
+            
+            timing.record_since('keyword_scoring', started, len(candidate_scores))
         
         # 2. 基于知识图谱的推荐
         if strategy in ['mixed', 'kg_only']:
-            print(f"基于知识图谱关系（{', '.join(relations)}）...")
+            if log:
+                log(f"基于知识图谱关系（{', '.join(relations)}）...")
+            started = time.perf_counter()
             for fav_id in favorite_entities:
                 fav_book = self.entities[fav_id]
-                fav_neighbors = self.book_neighbors_cache[fav_id]
+                fav_neighbors = self._get_neighbors_by_type(fav_id)
                 
                 # 相同系列
                 if 'series' in relations:
                     for series_id in fav_neighbors['series']:
                         series_name = self.entities[series_id]['name']
-                        for book_id in series_books[series_id]:
+                        for book_id in self._get_related_books('series', series_id):
                             if book_id not in favorite_entities:
                                 if book_id not in candidate_scores:
                                     candidate_scores[book_id] = {'score': 0, 'reasons': [], 'matched_keywords': [], 'strategy': strategy}
@@ -629,7 +1207,7 @@ class KeywordBasedRecommender:
                 if 'author' in relations:
                     for author_id in fav_neighbors['author']:
                         author_name = self.entities[author_id]['name']
-                        for book_id in author_books[author_id]:
+                        for book_id in self._get_related_books('author', author_id):
                             if book_id not in favorite_entities:
                                 if book_id not in candidate_scores:
                                     candidate_scores[book_id] = {'score': 0, 'reasons': [], 'matched_keywords': [], 'strategy': strategy}
@@ -642,7 +1220,7 @@ class KeywordBasedRecommender:
                 if 'translator' in relations:
                     for trans_id in fav_neighbors['translator']:
                         trans_name = self.entities[trans_id]['name']
-                        for book_id in translator_books[trans_id]:
+                        for book_id in self._get_related_books('translator', trans_id):
                             if book_id not in favorite_entities:
                                 if book_id not in candidate_scores:
                                     candidate_scores[book_id] = {'score': 0, 'reasons': [], 'matched_keywords': [], 'strategy': strategy}
@@ -655,7 +1233,7 @@ class KeywordBasedRecommender:
                 if 'publisher' in relations:
                     for pub_id in fav_neighbors['publisher']:
                         pub_name = self.entities[pub_id]['name']
-                        for book_id in publisher_books[pub_id]:
+                        for book_id in self._get_related_books('publisher', pub_id):
                             if book_id not in favorite_entities:
                                 if book_id not in candidate_scores:
                                     candidate_scores[book_id] = {'score': 0, 'reasons': [], 'matched_keywords': [], 'strategy': strategy}
@@ -663,97 +1241,272 @@ class KeywordBasedRecommender:
                                 candidate_scores[book_id]['reasons'].append(
                                     f"与《{fav_book['name']}》出版社相同: {pub_name}"
                                 )
+            
+            timing.record_since('kg_scoring', started, len(candidate_scores))
         
         # 3. 添加评分和评论加权
-        print("添加评分和热度加权...")
-        for book_id in candidate_scores:
-            # 豆瓣评分
-            rating = self.book_ratings.get(book_id, 0)
-            if rating > 0:
-                candidate_scores[book_id]['score'] += (rating / 10.0) * 0.15
-                if rating >= 8.5:
-                    candidate_scores[book_id]['reasons'].append(f"高分图书（豆瓣评分: {rating}）")
+        if log:
+            log("添加评分和热度加权...")
+        with timing.span('boost') as span:
+            for book_id, info in candidate_scores.items():
+                self._apply_boost_and_reasons(book_id, info, strategy, favorite_keywords)
+            span.count(len(candidate_scores))
+        
+        if log:
+            log(f"找到 {len(candidate_scores)} 本候选书籍")
+        
+        # 排序并返回Top-K（同分按图书ID升序，与稀疏矩阵引擎一致）
+        with timing.span('sort') as span:
+            span.count(len(candidate_scores))
+            return sorted(
+                candidate_scores.items(),
+                key=lambda x: (-x[1]['score'], x[0])
+            )[:top_k]
+    
+    def _score_candidates_sparse(self, favorite_entities, favorite_keywords, top_k, strategy, relations, relation_weights,
+                                 log=None):
+        """
+        使用稀疏矩阵引擎打分，只为最终的 Top-K 生成推荐理由
+        
+        排序结果与 _score_candidates 一致，返回格式相同。
+        """
+        engine = self._get_scoring_engine()
+        top_keywords = favorite_keywords.most_common(50) if strategy in ['mixed', 'keyword_only'] else []
+        kg_relations = relations if strategy in ['mixed', 'kg_only'] else []
+        
+        with timing.span('engine_scoring') as span:
+            top_books = engine.top_k(
+                favorite_entities, top_keywords, top_k,
+                keyword_factor=0.5 if strategy == 'mixed' else 1.0,
+                relations=kg_relations,
+                relation_weights=relation_weights
+            )
+            span.count(engine.last_candidate_count)
+        if log:
+            log(f"找到 {engine.last_candidate_count} 本候选书籍")
+        return self._explain_candidates(
+            top_books, favorite_entities, favorite_keywords, strategy, kg_relations, relation_weights
+        )
+    
+    def _explain_candidates(self, top_books, favorite_entities, favorite_keywords, strategy, kg_relations,
+                            relation_weights):
+        """为引擎选出的 Top-K 按与字典实现相同的顺序累加得分、生成理由"""
+        started = time.perf_counter()
+        top_keywords = favorite_keywords.most_common(50) if strategy in ['mixed', 'keyword_only'] else []
+        # 每个关键词的图书集合只查一次
+        keyword_books = [(keyword, weight, self.keyword_to_books.get(keyword, ())) for keyword, weight in top_keywords]
+        candidates = []
+        for book_id in top_books:
+            info = {'score': 0, 'reasons': [], 'matched_keywords': [], 'strategy': strategy}
             
-            # 评论热度
-            if book_id in self.comment_stats:
-                stats = self.comment_stats[book_id]
-                popularity = self.book_popularity.get(book_id, 0)
-                candidate_scores[book_id]['score'] += popularity * 0.05
-                
-                if stats['like_ratio'] > 0.7 and stats['total_comments'] > 50:
-                    candidate_scores[book_id]['reasons'].append(
-                        f"读者好评率高（{stats['like_count']}/{stats['total_comments']}条4-5星评论）"
-                    )
-                
-                if stats['total_comments'] > 500:
-                    candidate_scores[book_id]['reasons'].append(
-                        f"热门图书（{stats['total_comments']}条评论）"
-                    )
-                
-                if stats['avg_rating'] >= 4.0:
-                    candidate_scores[book_id]['reasons'].append(
-                        f"读者评分高（平均{stats['avg_rating']:.1f}星）"
-                    )
+            for keyword, weight, books in keyword_books:
+                if book_id in books:
+                    info['score'] += weight * (0.5 if strategy == 'mixed' else 1.0)
+                    info['matched_keywords'].append(keyword)
+            
+            for rel_type, reason in self._shared_relations(book_id, favorite_entities, kg_relations):
+                info['score'] += relation_weights[rel_type]
+                info['reasons'].append(reason)
             
-            # 添加关键词匹配理由（根据策略决定是否显示）
-            if strategy in ['mixed', 'keyword_only']:
-                matched_kws = candidate_scores[book_id]['matched_keywords']
-                if len(matched_kws) >= 3:  # 至少匹配3个关键词才考虑显示
-                    # 过滤出真正有意义的关键词
-                    meaningful_kws = []
-                    for kw in matched_kws[:10]:
-                        if kw in favorite_keywords and len(kw) >= 2:
-                            meaningful_kws.append(kw)
-                    
-                    # 只有当有足够多的有意义关键词时才显示
-                    if len(meaningful_kws) >= 3:
-                        kw_reason = f"评论关键词匹配: {', '.join(meaningful_kws[:5])}"
-                        # 在kg_only模式下不显示关键词，在其他模式下显示
-                        if strategy == 'keyword_only':
-                            # keyword_only模式：关键词理由放在最前面
-                            candidate_scores[book_id]['reasons'].insert(0, kw_reason)
-                        elif strategy == 'mixed':
-                            # mixed模式：关键词理由放在知识图谱关系之后
-                            candidate_scores[book_id]['reasons'].append(kw_reason)
-        
-        print(f"找到 {len(candidate_scores)} 本候选书籍")
-        
-        # 排序并返回Top-K
-        sorted_candidates = sorted(
-            candidate_scores.items(), 
-            key=lambda x: x[1]['score'], 
-            reverse=True
-        )[:top_k]
+            self._apply_boost_and_reasons(book_id, info, strategy, favorite_keywords)
+            candidates.append((book_id, info))
         
-        # 构建推荐结果
-        recommendations = []
-        for book_id, info in sorted_candidates:
-            book = self.entities[book_id]
-            rating = self.book_ratings.get(book_id, 0)
+        timing.record_since('boost', started, len(candidates))
+        
+        # 引擎已按得分排好序，这里用精确累加的得分做一次稳定排序
+        with timing.span('sort') as span:
+            span.count(len(candidates))
+            candidates.sort(key=lambda x: x[1]['score'], reverse=True)
+        return candidates
+    
+    def _shared_relations(self, book_id, favorite_entities, kg_relations):
+        """候选书与喜欢的书共有的关系实体，逐个产出 (关系类型, 推荐理由)"""
+        book_neighbors = self._get_neighbors_by_type(book_id)
+        for fav_id in favorite_entities:
+            fav_book = self.entities[fav_id]
+            fav_neighbors = self._get_neighbors_by_type(fav_id)
+            for rel_type, template in (
+                ('series', "与《{}》属于同一系列: {}"),
+                ('author', "与《{}》作者相同: {}"),
+                ('translator', "与《{}》译者相同: {}"),
+                ('publisher', "与《{}》出版社相同: {}"),
+            ):
+                if rel_type not in kg_relations:
+                    continue
+                for entity_id in fav_neighbors[rel_type]:
+                    if entity_id in book_neighbors[rel_type]:
+                        yield rel_type, template.format(fav_book['name'], self.entities[entity_id]['name'])
+    
+    def _score_candidates_embedding(self, favorite_entities, top_k, log=None):
+        """
+        用实体嵌入打分: 候选书向量与喜欢书籍平均向量的点积
+        
+        返回按得分排序的 [(book_id, info), ...]（同分按图书ID升序），
+        推荐理由为候选书与喜欢的书在知识图谱中共有的关系。
+        """
+        started = time.perf_counter()
+        embeddings = self._get_embeddings()
+        query = np.asarray(embeddings[favorite_entities], dtype=np.float32).mean(axis=0)
+        # 对整个（内存映射的）嵌入矩阵做一次矩阵向量乘法，再取图书的得分
+        book_ids = np.asarray(self.book_entities, dtype=np.int64)
+        scores = np.asarray(embeddings @ query)[book_ids]
+        
+        keep = ~np.isin(book_ids, favorite_entities)
+        book_ids, scores = book_ids[keep], scores[keep]
+        if top_k < len(book_ids):
+            # 保留所有不低于第 k 名得分的候选，同分时按图书ID取舍
+            threshold = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+            book_ids, scores = book_ids[scores >= threshold], scores[scores >= threshold]
+        order = np.lexsort((book_ids, -scores))[:top_k]
+        timing.record_since('engine_scoring', started, len(self.book_entities))
+        if log:
+            log(f"嵌入打分: {len(self.book_entities)} 本书")
+        
+        candidates = []
+        for book_id, score in zip(book_ids[order].tolist(), scores[order].tolist()):
+            reasons = [reason for _, reason in self._shared_relations(book_id, favorite_entities, self.ALL_RELATIONS)]
+            candidates.append((book_id, {
+                'score': score,
+                'reasons': reasons or ["在知识图谱中与您喜欢的书籍关联紧密"],
+                'matched_keywords': [],
+                'strategy': 'embedding'
+            }))
+        return candidates
+    
+    def _get_embeddings(self):
+        """
+        获取实体嵌入（首次使用时以内存映射方式加载），不存在或与知识图谱不匹配时返回 None
+        
+        加载失败的结果也会记住（只记录一次日志），重新加载知识图谱后再检查。
+        """
+        if self._embeddings is None:
+            if not os.path.exists(config.KG_EMBEDDINGS_FILE):
+                self.logger.warning("未找到实体嵌入，嵌入策略不可用；请先运行 python -m src.core.kg_embedding 训练")
+                self._embeddings = False
+            else:
+                embeddings = np.load(config.KG_EMBEDDINGS_FILE, mmap_mode='r')
+                if embeddings.ndim != 2 or embeddings.shape[0] != self.graph.number_of_nodes():
+                    self.logger.warning("实体嵌入与当前知识图谱不匹配，嵌入策略不可用；请重新训练")
+                    self._embeddings = False
+                else:
+                    self._embeddings = embeddings
+        # 嵌入是 ndarray，不能用 `or None`
+        return None if self._embeddings is False else self._embeddings
+    
+    def _score_candidates_neighbors(self, favorite_entities, favorite_keywords, top_k, strategy, relations,
+                                    relation_weights, selected_keywords, log=None):
+        """
+        使用预计算近邻表选出 Top-K，只为其生成推荐理由
+        
+        近邻表按默认关系、不指定关键词计算，其他参数或 top_k 超过近邻数时退回稀疏矩阵引擎。
+        单本书直接取近邻列表的前 top_k 个；多本书合并各自的近邻列表。
+        """
+        table = self._get_neighbor_table()
+        kg_relations = relations if strategy in ['mixed', 'kg_only'] else []
+        custom = (
+            (strategy in ['mixed', 'kg_only'] and list(relations) != list(self.ALL_RELATIONS))
+            or (strategy in ['mixed', 'keyword_only'] and selected_keywords)
+        )
+        if table is None or custom or top_k > table.top_n:
+            return self._score_candidates_sparse(
+                favorite_entities, favorite_keywords, top_k, strategy, relations, relation_weights, log
+            )
+        
+        boost_of = self._get_scoring_engine().boost_of if len(favorite_entities) > 1 else None
+        with timing.span('engine_scoring') as span:
+            if len(favorite_entities) == 1:
+                top_books = table.neighbors(strategy, favorite_entities[0])[0][:top_k].tolist()
+            else:
+                top_books = table.merge(strategy, favorite_entities, top_k, boost_of)
+            span.count(len(top_books))
+        if log:
+            log(f"查近邻表得到 {len(top_books)} 本候选书籍")
+        return self._explain_candidates(
+            top_books, favorite_entities, favorite_keywords, strategy, kg_relations, relation_weights
+        )
+    
+    def _get_neighbor_table(self):
+        """获取预计算近邻表（首次使用时加载），不存在或与当前数据版本不一致时返回 None"""
+        if self._neighbor_table is None:
+            if not NeighborTable.exists(config.KG_NEIGHBORS_DIR):
+                print("未找到近邻表，使用稀疏矩阵引擎")
+                self._neighbor_table = False
+            else:
+                table = NeighborTable.load(config.KG_NEIGHBORS_DIR, mmap_mode='r')
+                if table.data_version != self._data_version():
+                    print("近邻表与当前数据版本不一致，使用稀疏矩阵引擎（请重新生成近邻表）")
+                    self._neighbor_table = False
+                else:
+                    self._neighbor_table = table
+        return self._neighbor_table or None
+    
+    def build_neighbor_table(self, top_n=None):
+        """离线生成所有图书的近邻表并保存"""
+        table = NeighborTable.build(self, top_n)
+        table.save(config.KG_NEIGHBORS_DIR)
+        self._neighbor_table = table
+        self.result_cache.invalidate(self._cache_namespace())
+        print(f"近邻表已保存到 {config.KG_NEIGHBORS_DIR}")
+        return table
+    
+    def _get_scoring_engine(self):
+        """获取稀疏矩阵打分引擎（首次使用时构建）"""
+        if self._scoring_engine is None:
+            print("构建稀疏矩阵打分引擎...")
+            with timing.span('index_build'):
+                self._scoring_engine = SparseScoringEngine(self)
+        return self._scoring_engine
+    
+    def _apply_boost_and_reasons(self, book_id, info, strategy, favorite_keywords):
+        """为候选书籍添加评分和评论热度加权，并补充推荐理由"""
+        # 豆瓣评分
+        rating = self.book_ratings.get(book_id, 0)
+        if rating > 0:
+            info['score'] += (rating / 10.0) * 0.15
+            if rating >= 8.5:
+                info['reasons'].append(f"高分图书（豆瓣评分: {rating}）")
+        
+        # 评论热度
+        if book_id in self.comment_stats:
+            stats = self.comment_stats[book_id]
+            popularity = self.book_popularity.get(book_id, 0)
+            info['score'] += popularity * 0.05
             
-            # 去重推荐理由
-            unique_reasons = []
-            seen = set()
-            for reason in info['reasons']:
-                if reason not in seen:
-                    unique_reasons.append(reason)
-                    seen.add(reason)
+            if stats['like_ratio'] > 0.7 and stats['total_comments'] > 50:
+                info['reasons'].append(
+                    f"读者好评率高（{stats['like_count']}/{stats['total_comments']}条4-5星评论）"
+                )
             
-            recommendations.append({
-                'book_id': book_id,
-                'book_name': book['name'],
-                'book_url': book.get('url', ''),
-                'rating': rating,
-                'score': float(info['score']),
-                'reasons': unique_reasons[:5],  # 最多5条理由
-                'keywords': self.comment_stats.get(book_id, {}).get('keywords', []),
-                'matched_keywords': info['matched_keywords'][:10],
-                'comment_stats': self.comment_stats.get(book_id, {}),
-                'explanation': self._generate_explanation(book, unique_reasons, rating)
-            })
+            if stats['total_comments'] > 500:
+                info['reasons'].append(
+                    f"热门图书（{stats['total_comments']}条评论）"
+                )
+            
+            if stats['avg_rating'] >= 4.0:
+                info['reasons'].append(
+                    f"读者评分高（平均{stats['avg_rating']:.1f}星）"
+                )
         
-        print(f"\n推荐完成，共推荐 {len(recommendations)} 本书")
-        return recommendations
+        # 添加关键词匹配理由（根据策略决定是否显示）
+        if strategy in ['mixed', 'keyword_only']:
+            matched_kws = info['matched_keywords']
+            if len(matched_kws) >= 3:  # 至少匹配3个关键词才考虑显示
+                # 过滤出真正有意义的关键词
+                meaningful_kws = []
+                for kw in matched_kws[:10]:
+                    if kw in favorite_keywords and len(kw) >= 2:
+                        meaningful_kws.append(kw)
+                
+                # 只有当有足够多的有意义关键词时才显示
+                if len(meaningful_kws) >= 3:
+                    kw_reason = f"评论关键词匹配: {', '.join(meaningful_kws[:5])}"
+                    # 在kg_only模式下不显示关键词，在其他模式下显示
+                    if strategy == 'keyword_only':
+                        # keyword_only模式：关键词理由放在最前面
+                        info['reasons'].insert(0, kw_reason)
+                    elif strategy == 'mixed':
+                        # mixed模式：关键词理由放在知识图谱关系之后
+                        info['reasons'].append(kw_reason)
     
     def _generate_explanation(self, book, reasons, rating):
         """生成推荐解释"""
@@ -774,8 +1527,7 @@ class KeywordBasedRecommender:
 
 
 if __name__ == '__main__':
-    import time
-    
+
     recommender = KeywordBasedRecommender()
     recommender.load_kg()
     recommender.load_and_analyze_comments()
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+评论关键词缓存的数组存储
+关键词缓存保存为 .npy 数组和字符串表，可以用 mmap_mode='r' 零拷贝加载
+"""
+import os
+from collections.abc import Mapping, Set
+
+import numpy as np
+
+from src.core.graph_store import StringTable, ArrayView, replacing_directory
+
+
+class SortedIds:
+    """有序ID数组的只读集合视图（支持 in / 迭代 / len）"""
+    
+    def __init__(self, ids):
+        self.ids = ids
+    
+    def __contains__(self, item):
+        pos = np.searchsorted(self.ids, item)
+        return pos < len(self.ids) and self.ids[pos] == item
+    
+    def __iter__(self):
+        return iter(self.ids.tolist())
+    
+    def __len__(self):
+        return len(self.ids)
+
+
+class KeywordStore:
+    """
+    评论关键词存储
+    
+    - keywords: 有序关键词表，关键词ID即其在表中的位置
+    - book_indptr / book_keyword_ids / book_keyword_weights:
+      图书 -> 关键词（CSR，按实体ID索引，保持按权重降序的原始顺序）
+    - keyword_indptr / keyword_book_ids: 关键词 -> 图书（CSR，图书ID升序）
+    - has_stats / total_comments / like_count / avg_rating / popularity: 评论统计（按实体ID索引）
+    - comment_counts / comment_hashes: 每本书的评论指纹（评论数, 评论ID哈希之和），用于增量更新
+    - source_stat: 生成缓存时评论文件的 (大小, 修改时间ns)
+    
+    指纹数组为可选项，旧版缓存中不存在时为 None。
+    """
+    
+    ARRAYS = (
+        'book_indptr', 'book_keyword_ids', 'book_keyword_weights',
+        'keyword_indptr', 'keyword_book_ids',
+        'has_stats', 'total_comments', 'like_count', 'avg_rating', 'popularity',
+    )
+    OPTIONAL_ARRAYS = ('comment_counts', 'comment_hashes', 'source_stat')
+    
+    def __init__(self, keywords, **arrays):
+        self.keywords = keywords
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        for name in self.OPTIONAL_ARRAYS:
+            setattr(self, name, arrays.get(name))
+    
+    @classmethod
+    def from_dicts(cls, num_entities, book_keywords, book_keyword_weights, comment_stats, book_popularity,
+                   **fingerprints):
+        """
+        从关键词提取结果（字典形式）构建
+        
+        fingerprints: 可选的 comment_counts / comment_hashes / source_stat 数组
+        """
+        vocab = sorted({kw for keywords in book_keywords.values() for kw in keywords})
+        keyword_ids = {kw: i for i, kw in enumerate(vocab)}
+        
+        book_ids = sorted(book_keywords)
+        counts = np.zeros(num_entities, dtype=np.int64)
+        kw_col = []
+        weight_col = []
+        book_col = []
+        for book_id in book_ids:
+            keywords = book_keywords[book_id]
+            weights = book_keyword_weights.get(book_id, {})
+            counts[book_id] = len(keywords)
+            for kw in keywords:
+                kw_col.append(keyword_ids[kw])
+                weight_col.append(weights.get(kw, 0))
+                book_col.append(book_id)
+        
+        book_indptr = np.zeros(num_entities + 1, dtype=np.int64)
+        np.cumsum(counts, out=book_indptr[1:])
+        kw_col = np.asarray(kw_col, dtype=np.int32)
+        book_col = np.asarray(book_col, dtype=np.int32)
+        
+        # 关键词 -> 图书
+        order = np.lexsort((book_col, kw_col))
+        keyword_indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(kw_col, minlength=len(vocab)), out=keyword_indptr[1:])
+        
+        # 评论统计
+        has_stats = np.zeros(num_entities, dtype=bool)
+        total_comments = np.zeros(num_entities, dtype=np.int32)
+        like_count = np.zeros(num_entities, dtype=np.int32)
+        avg_rating = np.zeros(num_entities, dtype=np.float64)
+        popularity = np.zeros(num_entities, dtype=np.float64)
+        for book_id, stats in comment_stats.items():
+            has_stats[book_id] = True
+            total_comments[book_id] = stats['total_comments']
+            like_count[book_id] = stats['like_count']
+            avg_rating[book_id] = stats['avg_rating']
+            popularity[book_id] = book_popularity.get(book_id, 0)
+        
+        return cls(
+            StringTable.from_strings(vocab),
+            book_indptr=book_indptr,
+            book_keyword_ids=kw_col,
+            book_keyword_weights=np.asarray(weight_col, dtype=np.float64),
+            keyword_indptr=keyword_indptr,
+            keyword_book_ids=book_col[order],
+            has_stats=has_stats,
+            total_comments=total_comments,
+            like_count=like_count,
+            avg_rating=avg_rating,
+            popularity=popularity,
+            **fingerprints
+        )
+    
+    def save(self, path):
+        """
+        保存为 .npy 文件目录
+        
+        服务启动时可能重新保存，而其他工作进程或实例正以 mmap 方式读取旧数组，
+        因此先写入临时目录再替换（见 replacing_directory）。
+        """
+        with replacing_directory(path) as tmp_path:
+            for name in self.ARRAYS:
+                np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(self, name))
+            for name in self.OPTIONAL_ARRAYS:
+                if getattr(self, name) is not None:
+                    np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(self, name))
+            self.keywords.save(tmp_path, 'keywords')
+    
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """从 .npy 文件目录加载"""
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in cls.ARRAYS
+        }
+        for name in cls.OPTIONAL_ARRAYS:
+            filename = os.path.join(path, f'{name}.npy')
+            if os.path.exists(filename):
+                arrays[name] = np.load(filename, mmap_mode=mmap_mode)
+        return cls(StringTable.load(path, 'keywords', mmap_mode=mmap_mode), **arrays)
+    
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, 'keywords_offsets.npy'))
+    
+    def has_fingerprints(self):
+        return self.comment_counts is not None and self.comment_hashes is not None
+    
+    def keyword_id(self, keyword):
+        """关键词ID，不存在时返回 None"""
+        pos = self.keywords.bisect_left(keyword)
+        if pos < len(self.keywords) and self.keywords[pos] == keyword:
+            return pos
+        return None
+    
+    def books_of(self, keyword_id):
+        """包含该关键词的图书ID数组（升序）"""
+        return self.keyword_book_ids[self.keyword_indptr[keyword_id]:self.keyword_indptr[keyword_id + 1]]
+    
+    def keywords_of(self, book_id):
+        """图书的 (关键词ID数组, 权重数组)，按权重降序"""
+        start, end = self.book_indptr[book_id], self.book_indptr[book_id + 1]
+        return self.book_keyword_ids[start:end], self.book_keyword_weights[start:end]
+    
+    def book_keywords_view(self):
+        """{book_id: [关键词, ...]} 视图"""
+        return _BookKeywordsView(self)
+    
+    def book_keyword_weights_view(self):
+        """{book_id: {关键词: 权重}} 视图"""
+        return _BookKeywordWeightsView(self)
+    
+    def keyword_to_books_view(self):
+        """{关键词: 图书ID集合} 视图"""
+        return _KeywordBooksView(self)
+    
+    def all_keywords_view(self):
+        """所有关键词的集合视图"""
+        return _KeywordSet(self)
+    
+    def comment_stats_view(self):
+        """{book_id: 评论统计字典} 视图"""
+        return _CommentStatsView(self)
+    
+    def book_popularity_view(self):
+        """{book_id: 热度} 视图"""
+        return ArrayView(self.popularity, self.has_stats)
+
+
+class _BookView(Mapping):
+    """按图书ID索引、只包含有评论统计的图书的视图基类"""
+    
+    def __init__(self, store):
+        self.store = store
+    
+    def __contains__(self, book_id):
+        has_stats = self.store.has_stats
+        return isinstance(book_id, (int, np.integer)) and 0 <= book_id < len(has_stats) and bool(has_stats[book_id])
+    
+    def __getitem__(self, book_id):
+        if book_id not in self:
+            raise KeyError(book_id)
+        return self._value(int(book_id))
+    
+    def __iter__(self):
+        return iter(np.flatnonzero(self.store.has_stats).tolist())
+    
+    def __len__(self):
+        return int(np.count_nonzero(self.store.has_stats))
+
+
+class _BookKeywordsView(_BookView):
+    def _value(self, book_id):
+        keyword_ids, _ = self.store.keywords_of(book_id)
+        return [self.store.keywords[i] for i in keyword_ids.tolist()]
+
+
+class _BookKeywordWeightsView(_BookView):
+    def _value(self, book_id):
+        keyword_ids, weights = self.store.keywords_of(book_id)
+        return {
+            self.store.keywords[i]: w
+            for i, w in zip(keyword_ids.tolist(), weights.tolist())
+        }
+
+
+class _CommentStatsView(_BookView):
+    def _value(self, book_id):
+        store = self.store
+        total_comments = int(store.total_comments[book_id])
+        like_count = int(store.like_count[book_id])
+        keyword_ids, _ = store.keywords_of(book_id)
+        return {
+            'total_comments': total_comments,
+            'like_count': like_count,
+            'like_ratio': like_count / total_comments if total_comments > 0 else 0,
+            'avg_rating': float(store.avg_rating[book_id]),
+            'keywords': [store.keywords[i] for i in keyword_ids[:10].tolist()]
+        }
+
+
+class _KeywordBooksView(Mapping):
+    def __init__(self, store):
+        self.store = store
+    
+    def __getitem__(self, keyword):
+        keyword_id = self.store.keyword_id(keyword)
+        if keyword_id is None:
+            raise KeyError(keyword)
+        return SortedIds(self.store.books_of(keyword_id))
+    
+    def __iter__(self):
+        return iter(self.store.keywords)
+    
+    def __len__(self):
+        return len(self.store.keywords)
+
+
+class _KeywordSet(Set):
+    def __init__(self, store):
+        self.store = store
+    
+    def __contains__(self, keyword):
+        return isinstance(keyword, str) and self.store.keyword_id(keyword) is not None
+    
+    def __iter__(self):
+        return iter(self.store.keywords)
+    
+    def __len__(self):
+        return len(self.store.keywords)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+知识图谱实体嵌入
+在 CSR 图存储的关系三元组上训练 TransE 嵌入（纯 NumPy，CPU 上按小批量向量化计算）
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from src.core.graph_store import GraphStore, RELATION_TYPES
+
+
+class TransETrainer:
+    """
+    TransE 嵌入训练器
+    
+    对每个三元组 (h, r, t) 要求 ||e_h + e_r - e_t|| 小于负样本的距离至少 margin，
+    负样本为把头或尾随机替换为同类型的其他实体。
+    每个小批量的梯度按实体行合并后用 Adam 更新（只更新本批涉及的行），
+    实体向量每次更新后重新归一化到单位长度。参数和优化器状态都用 float32。
+    
+    训练结果为 (实体数, 维度) 的 float32 数组，按实体ID索引（空ID为零向量），
+    用 np.save 保存后可以用 mmap_mode='r' 加载。
+    """
+    
+    def __init__(self, dim=None, learning_rate=None, batch_size=None, epochs=None, margin=1.0, seed=0):
+        self.dim = dim or config.EMBEDDING_DIM
+        self.learning_rate = learning_rate or config.LEARNING_RATE
+        self.batch_size = batch_size or config.BATCH_SIZE
+        self.epochs = epochs or config.EPOCHS
+        self.margin = margin
+        self.rng = np.random.default_rng(seed)
+    
+    @staticmethod
+    def triples(graph):
+        """图中所有关系三元组的 (heads, relations, tails) 数组"""
+        heads = np.repeat(np.arange(graph.number_of_nodes(), dtype=np.int64), np.diff(graph.indptr))
+        return heads, np.asarray(graph.edge_relations, dtype=np.int64), np.asarray(graph.indices, dtype=np.int64)
+    
+    def train(self, graph):
+        """
+        训练实体嵌入
+        
+        Args:
+            graph: GraphStore
+        
+        Returns:
+            float32 数组，形状 (实体数, dim)
+        """
+        heads, rels, tails = self.triples(graph)
+        node_types = np.asarray(graph.node_types)
+        num_entities = len(node_types)
+        
+        # 同类型实体连续存放，负采样时在同类型的区间内均匀抽取
+        valid = np.flatnonzero(node_types >= 0)
+        by_type = valid[np.argsort(node_types[valid], kind='stable')]
+        type_counts = np.bincount(node_types[valid], minlength=max(int(node_types.max(initial=0)) + 1, 1))
+        type_start = np.concatenate([[0], np.cumsum(type_counts)[:-1]])
+        
+        bound = 6 / np.sqrt(self.dim)
+        entity_vecs = self.rng.uniform(-bound, bound, (num_entities, self.dim)).astype(np.float32)
+        entity_vecs /= np.linalg.norm(entity_vecs, axis=1, keepdims=True)
+        relation_vecs = self.rng.uniform(-bound, bound, (len(RELATION_TYPES), self.dim)).astype(np.float32)
+        relation_vecs /= np.linalg.norm(relation_vecs, axis=1, keepdims=True)
+        self._entity_state = (np.zeros_like(entity_vecs), np.zeros_like(entity_vecs))
+        self._relation_state = (np.zeros_like(relation_vecs), np.zeros_like(relation_vecs))
+        self._step = 0
+        
+        print(f"训练 TransE 嵌入: {num_entities} 个实体, {len(heads)} 个三元组, "
+              f"维度 {self.dim}, 批大小 {self.batch_size}, {self.epochs} 轮")
+        for epoch in range(self.epochs):
+            start_time = time.time()
+            order = self.rng.permutation(len(heads))
+            total_loss = 0.0
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                h, r, t = heads[batch], rels[batch], tails[batch]
+                
+                # 负样本: 一半替换头，一半替换尾
+                corrupt_head = self.rng.random(len(batch)) < 0.5
+                replaced = np.where(corrupt_head, h, t)
+                codes = node_types[replaced]
+                negatives = by_type[type_start[codes] + (self.rng.random(len(batch)) * type_counts[codes]).astype(np.int64)]
+                neg_h = np.where(corrupt_head, negatives, h)
+                neg_t = np.where(corrupt_head, t, negatives)
+                
+                total_loss += self._train_batch(entity_vecs, relation_vecs, h, r, t, neg_h, neg_t)
+            print(f"  第 {epoch + 1}/{self.epochs} 轮: 平均损失 {total_loss / max(len(heads), 1):.4f}，"
+                  f"耗时 {time.time() - start_time:.1f} 秒")
+        
+        entity_vecs[node_types < 0] = 0
+        return entity_vecs
+    
+    def _train_batch(self, entity_vecs, relation_vecs, h, r, t, neg_h, neg_t):
+        """一个小批量的前向计算和参数更新，返回本批损失之和"""
+        pos = entity_vecs[h] + relation_vecs[r] - entity_vecs[t]
+        neg = entity_vecs[neg_h] + relation_vecs[r] - entity_vecs[neg_t]
+        pos_dist = np.linalg.norm(pos, axis=1)
+        neg_dist = np.linalg.norm(neg, axis=1)
+        losses = np.maximum(self.margin + pos_dist - neg_dist, 0)
+        active = losses > 0
+        if not active.any():
+            return 0.0
+        
+        # d||x||/dx = x / ||x||，只有违反间隔的样本有梯度
+        pos_grad = pos[active] / np.maximum(pos_dist[active], 1e-12)[:, None]
+        neg_grad = neg[active] / np.maximum(neg_dist[active], 1e-12)[:, None]
+        
+        entity_rows = np.concatenate([h[active], t[active], neg_h[active], neg_t[active]])
+        entity_grads = np.concatenate([pos_grad, -pos_grad, -neg_grad, neg_grad])
+        relation_rows = np.concatenate([r[active], r[active]])
+        relation_grads = np.concatenate([pos_grad, -neg_grad])
+        
+        self._step += 1
+        rows = self._adam_update(entity_vecs, self._entity_state, entity_rows, entity_grads)
+        entity_vecs[rows] /= np.maximum(np.linalg.norm(entity_vecs[rows], axis=1, keepdims=True), 1e-12)
+        self._adam_update(relation_vecs, self._relation_state, relation_rows, relation_grads)
+        return float(losses.sum())
+    
+    def _adam_update(self, params, state, rows, grads, beta1=0.9, beta2=0.999, eps=1e-8):
+        """按行合并梯度后做 Adam 更新（只更新出现的行），返回更新的行号"""
+        # 用 (行 x 样本) 的 0/1 稀疏矩阵乘法按行求和，比 np.add.at 快得多
+        rows, inverse = np.unique(rows, return_inverse=True)
+        merge = sparse.csr_matrix(
+            (np.ones(len(inverse), dtype=np.float32), (inverse, np.arange(len(inverse)))),
+            shape=(len(rows), len(inverse))
+        )
+        grad = merge @ grads
+        
+        m, v = state
+        m_rows = beta1 * m[rows] + (1 - beta1) * grad
+        v_rows = beta2 * v[rows] + (1 - beta2) * grad * grad
+        m[rows] = m_rows
+        v[rows] = v_rows
+        step = self.learning_rate * (1 - beta2 ** self._step) ** 0.5 / (1 - beta1 ** self._step)
+        params[rows] -= step * m_rows / (np.sqrt(v_rows) + eps)
+        return rows
+
+
+def train_embeddings(graph_dir=None, output_file=None, **kwargs):
+    """
+    训练知识图谱实体嵌入并保存为 .npy 文件
+    
+    Args:
+        graph_dir: 图存储目录，None表示使用 config.KG_GRAPH_DIR
+        output_file: 输出文件，None表示使用 config.KG_EMBEDDINGS_FILE
+        kwargs: 传给 TransETrainer 的参数
+    """
+    graph_dir = graph_dir or config.KG_GRAPH_DIR
+    output_file = output_file or config.KG_EMBEDDINGS_FILE
+    graph = GraphStore.load(graph_dir, mmap_mode='r')
+    
+    start_time = time.time()
+    embeddings = TransETrainer(**kwargs).train(graph)
+    
+    # 先写临时文件再替换，服务进程不会读到写了一半的文件
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    tmp_file = output_file + '.tmp.npy'
+    np.save(tmp_file, embeddings)
+    os.replace(tmp_file, output_file)
+    print(f"✓ 实体嵌入已保存到 {output_file}（{embeddings.shape[0]} x {embeddings.shape[1]}），"
+          f"耗时 {time.time() - start_time:.1f} 秒")
+    return embeddings
+
+
+if __name__ == '__main__':
+    train_embeddings()
@@ -9,20 +9,35 @@ import pickle
 import os
 import sys
 from pathlib import Path
-from collections import defaultdict
-import networkx as nx
-from tqdm import tqdm
 
 # 添加项目根目录到路径
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 from config import config
+from src.core.graph_store import GraphStore, NODE_TYPE_CODES, RELATION_CODES, RELATION_TYPES
+from src.core.title_index import TitleIndex
 
 
 class KnowledgeGraphBuilder:
     """知识图谱构建器"""
     
+    # 属性实体: (实体类型, 图书数据列名)，实体ID按此顺序分配
+    ATTRIBUTE_COLUMNS = (
+        ('author', 'author'),
+        ('publisher', 'publisher'),
+        ('translator', 'translator'),
+        ('series', 'seriesOfBook'),
+    )
+    
+    # 图书与属性实体之间的 (正向关系, 反向关系)
+    RELATION_NAMES = {
+        'author': ('written_by', 'write'),
+        'publisher': ('published_by', 'publish'),
+        'translator': ('translated_by', 'translate'),
+        'series': ('belongs_to', 'contains'),
+    }
+    
     def __init__(self):
         self.entities = {}  # 实体字典 {entity_id: entity_info}
         self.relations = []  # 关系列表 [(head, relation, tail)]
@@ -35,115 +50,78 @@ class KnowledgeGraphBuilder:
             'user': [],
             'word': []
         }
-        self.graph = nx.MultiDiGraph()
+        self.graph = None  # GraphStore，关系构建完成后生成
         
     def load_data(self):
-        """加载数据"""
+        """
+        加载图书信息（图谱只由图书信息构建，评论由推荐器从评论列存储按块读取）
+        
+        存在 Parquet 格式的图书信息时优先读取（实体的 original_data 保存完整记录，读取所有列）。
+        """
         print("正在加载数据...")
         try:
-            self.book_data = pd.read_pickle(config.BOOK_INFO_FILE)
+            if os.path.exists(config.BOOK_INFO_PARQUET_FILE):
+                self.book_data = pd.read_parquet(config.BOOK_INFO_PARQUET_FILE)
+            else:
+                self.book_data = pd.read_pickle(config.BOOK_INFO_FILE)
             print(f"成功加载 {len(self.book_data)} 条图书信息")
         except Exception as e:
             print(f"加载图书信息失败: {e}")
             self.book_data = pd.DataFrame()
-            
-        try:
-            self.comment_data = pd.read_pickle(config.COMMENT_FILE)
-            print(f"成功加载 {len(self.comment_data)} 条评论数据")
-        except Exception as e:
-            print(f"加载评论数据失败: {e}")
-            self.comment_data = pd.DataFrame()
+    
+    def _column(self, name):
+        """取出一列并逐个转为字符串（与 str(row.get(name, '')) 一致，列不存在时为空字符串）"""
+        if name not in self.book_data.columns:
+            return pd.Series('', index=self.book_data.index, dtype=object)
+        return self.book_data[name].map(str)
     
     def build_entities(self):
-        """构建实体"""
+        """构建实体（按列向量化处理）"""
         print("\n正在构建实体...")
         entity_id = 0
         
-        # 构建图书实体
-        if not self.book_data.empty:
-            for idx, row in tqdm(self.book_data.iterrows(), total=len(self.book_data), desc="处理图书实体"):
-                book_url = str(row.get('bookUrl', ''))
-                if book_url and book_url != 'nan':
-                    self.entities[entity_id] = {
-                        'id': entity_id,
-                        'type': 'book',
-                        'name': str(row.get('bookName', '')),
-                        'url': book_url,
-                        'rating': row.get('bookScore', 0),
-                        'original_data': row.to_dict()
-                    }
-                    self.entity_types['book'].append(entity_id)
-                    self.graph.add_node(entity_id, type='book', name=str(row.get('bookName', '')))
-                    entity_id += 1
-        
-        # 构建作者实体
-        author_map = {}
-        if not self.book_data.empty:
-            for idx, row in tqdm(self.book_data.iterrows(), total=len(self.book_data), desc="处理作者实体"):
-                author = str(row.get('author', ''))
-                if author and author != 'nan' and author not in author_map:
-                    author_map[author] = entity_id
-                    self.entities[entity_id] = {
-                        'id': entity_id,
-                        'type': 'author',
-                        'name': author
-                    }
-                    self.entity_types['author'].append(entity_id)
-                    self.graph.add_node(entity_id, type='author', name=author)
-                    entity_id += 1
-        
-        # 构建出版社实体
-        publisher_map = {}
-        if not self.book_data.empty:
-            for idx, row in tqdm(self.book_data.iterrows(), total=len(self.book_data), desc="处理出版社实体"):
-                publisher = str(row.get('publisher', ''))
-                if publisher and publisher != 'nan' and publisher not in publisher_map:
-                    publisher_map[publisher] = entity_id
-                    self.entities[entity_id] = {
-                        'id': entity_id,
-                        'type': 'publisher',
-                        'name': publisher
-                    }
-                    self.entity_types['publisher'].append(entity_id)
-                    self.graph.add_node(entity_id, type='publisher', name=publisher)
-                    entity_id += 1
-        
-        # 构建译者实体
-        translator_map = {}
+        # 构建图书实体: 每一行有效URL对应一个图书实体
         if not self.book_data.empty:
-            for idx, row in tqdm(self.book_data.iterrows(), total=len(self.book_data), desc="处理译者实体"):
-                translator = str(row.get('translator', ''))
-                if translator and translator != 'nan' and translator not in translator_map:
-                    translator_map[translator] = entity_id
-                    self.entities[entity_id] = {
-                        'id': entity_id,
-                        'type': 'translator',
-                        'name': translator
-                    }
-                    self.entity_types['translator'].append(entity_id)
-                    self.graph.add_node(entity_id, type='translator', name=translator)
-                    entity_id += 1
-        
-        # 构建系列实体
-        series_map = {}
-        if not self.book_data.empty:
-            for idx, row in tqdm(self.book_data.iterrows(), total=len(self.book_data), desc="处理系列实体"):
-                series = str(row.get('seriesOfBook', ''))
-                if series and series != 'nan' and series not in series_map:
-                    series_map[series] = entity_id
+            urls = self._column('bookUrl')
+            is_book = ((urls != '') & (urls != 'nan')).to_numpy()
+            books = self.book_data[is_book]
+            names = self._column('bookName')[is_book].tolist()
+            if 'bookScore' in books.columns:
+                ratings = books['bookScore'].tolist()
+            else:
+                ratings = [0] * len(books)
+            # 原始行数据: 按列取出后再按行组装，避免逐行构造 Series
+            columns = books.columns.tolist()
+            records = (dict(zip(columns, values)) for values in zip(*(books[c].tolist() for c in columns)))
+            
+            for name, url, rating, record in zip(names, urls[is_book].tolist(), ratings, records):
+                self.entities[entity_id] = {
+                    'id': entity_id,
+                    'type': 'book',
+                    'name': name,
+                    'url': url,
+                    'rating': rating,
+                    'original_data': record
+                }
+                self.entity_types['book'].append(entity_id)
+                entity_id += 1
+        
+        # 构建作者 / 出版社 / 译者 / 系列实体: factorize 按首次出现顺序分配ID
+        for entity_type, column in self.ATTRIBUTE_COLUMNS:
+            entity_map = {}
+            if not self.book_data.empty:
+                values = self._column(column)
+                _, uniques = pd.factorize(values.where((values != '') & (values != 'nan')))
+                for value in uniques.tolist():
+                    entity_map[value] = entity_id
                     self.entities[entity_id] = {
                         'id': entity_id,
-                        'type': 'series',
-                        'name': series
+                        'type': entity_type,
+                        'name': value
                     }
-                    self.entity_types['series'].append(entity_id)
-                    self.graph.add_node(entity_id, type='series', name=series)
+                    self.entity_types[entity_type].append(entity_id)
                     entity_id += 1
-        
-        self.author_map = author_map
-        self.publisher_map = publisher_map
-        self.translator_map = translator_map
-        self.series_map = series_map
+            setattr(self, f'{entity_type}_map', entity_map)
         
         print(f"\n实体构建完成:")
         print(f"  - 图书: {len(self.entity_types['book'])}")
@@ -154,66 +132,42 @@ class KnowledgeGraphBuilder:
         print(f"  总计: {len(self.entities)} 个实体")
     
     def build_relations(self):
-        """构建关系"""
+        """构建关系（按列向量化处理）"""
         print("\n正在构建关系...")
         
-        # 创建URL到实体ID的映射
+        # 创建URL到实体ID的映射（URL重复时取最后一个图书实体）
         url_to_entity = {}
-        for eid, entity in self.entities.items():
-            if entity['type'] == 'book':
-                url_to_entity[entity['url']] = eid
-        
-        # 构建图书-作者关系
-        if not self.book_data.empty:
-            for idx, row in tqdm(self.book_data.iterrows(), total=len(self.book_data), desc="构建图书-作者关系"):
-                book_url = str(row.get('bookUrl', ''))
-                author = str(row.get('author', ''))
-                if book_url in url_to_entity and author in self.author_map:
-                    book_id = url_to_entity[book_url]
-                    author_id = self.author_map[author]
-                    self.relations.append((book_id, 'written_by', author_id))
-                    self.relations.append((author_id, 'write', book_id))
-                    self.graph.add_edge(book_id, author_id, relation='written_by')
-                    self.graph.add_edge(author_id, book_id, relation='write')
-        
-        # 构建图书-出版社关系
-        if not self.book_data.empty:
-            for idx, row in tqdm(self.book_data.iterrows(), total=len(self.book_data), desc="构建图书-出版社关系"):
-                book_url = str(row.get('bookUrl', ''))
-                publisher = str(row.get('publisher', ''))
-                if book_url in url_to_entity and publisher in self.publisher_map:
-                    book_id = url_to_entity[book_url]
-                    publisher_id = self.publisher_map[publisher]
-                    self.relations.append((book_id, 'published_by', publisher_id))
-                    self.relations.append((publisher_id, 'publish', book_id))
-                    self.graph.add_edge(book_id, publisher_id, relation='published_by')
-                    self.graph.add_edge(publisher_id, book_id, relation='publish')
+        for eid in self.entity_types['book']:
+            url_to_entity[self.entities[eid]['url']] = eid
         
-        # 构建图书-译者关系
+        heads = []
+        tails = []
+        codes = []
         if not self.book_data.empty:
-            for idx, row in tqdm(self.book_data.iterrows(), total=len(self.book_data), desc="构建图书-译者关系"):
-                book_url = str(row.get('bookUrl', ''))
-                translator = str(row.get('translator', ''))
-                if book_url in url_to_entity and translator in self.translator_map:
-                    book_id = url_to_entity[book_url]
-                    translator_id = self.translator_map[translator]
-                    self.relations.append((book_id, 'translated_by', translator_id))
-                    self.relations.append((translator_id, 'translate', book_id))
-                    self.graph.add_edge(book_id, translator_id, relation='translated_by')
-                    self.graph.add_edge(translator_id, book_id, relation='translate')
-        
-        # 构建图书-系列关系
-        if not self.book_data.empty:
-            for idx, row in tqdm(self.book_data.iterrows(), total=len(self.book_data), desc="构建图书-系列关系"):
-                book_url = str(row.get('bookUrl', ''))
-                series = str(row.get('seriesOfBook', ''))
-                if book_url in url_to_entity and series in self.series_map:
-                    book_id = url_to_entity[book_url]
-                    series_id = self.series_map[series]
-                    self.relations.append((book_id, 'belongs_to', series_id))
-                    self.relations.append((series_id, 'contains', book_id))
-                    self.graph.add_edge(book_id, series_id, relation='belongs_to')
-                    self.graph.add_edge(series_id, book_id, relation='contains')
+            book_ids = self._column('bookUrl').map(url_to_entity).fillna(-1).to_numpy(dtype=np.int64)
+            
+            # 图书-作者 / 出版社 / 译者 / 系列关系，每行生成一对正向、反向关系
+            for entity_type, column in self.ATTRIBUTE_COLUMNS:
+                entity_map = getattr(self, f'{entity_type}_map')
+                attr_ids = self._column(column).map(entity_map).fillna(-1).to_numpy(dtype=np.int64)
+                mask = (book_ids >= 0) & (attr_ids >= 0)
+                forward, backward = self.RELATION_NAMES[entity_type]
+                
+                heads.append(np.column_stack([book_ids[mask], attr_ids[mask]]).ravel())
+                tails.append(np.column_stack([attr_ids[mask], book_ids[mask]]).ravel())
+                codes.append(np.tile(
+                    np.array([RELATION_CODES[forward], RELATION_CODES[backward]], dtype=np.int8),
+                    int(mask.sum())
+                ))
+        
+        heads = np.concatenate(heads) if heads else np.zeros(0, dtype=np.int64)
+        tails = np.concatenate(tails) if tails else np.zeros(0, dtype=np.int64)
+        codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int8)
+        relation_names = np.array(RELATION_TYPES, dtype=object)[codes]
+        self.relations = list(zip(heads.tolist(), relation_names.tolist(), tails.tolist()))
+        
+        node_types, names, urls, ratings = GraphStore.node_arrays(self.entities)
+        self.graph = GraphStore.from_arrays(node_types, heads, tails, codes, names, urls, ratings)
         
         print(f"\n关系构建完成: {len(self.relations)} 条关系")
     
@@ -229,12 +183,21 @@ class KnowledgeGraphBuilder:
                 'entity_types': self.entity_types
             }, f)
         
-        # 保存关系
-        with open(config.KG_RELATIONS_FILE, 'wb') as f:
-            pickle.dump({
-                'relations': self.relations,
-                'graph': self.graph
-            }, f)
+        # 保存关系图（CSR数组）
+        self.graph.save(config.KG_GRAPH_DIR)
+        
+        # 保存书名索引（图谱重建后实体ID会变化，索引需同步重建）
+        book_ids = np.flatnonzero(self.graph.node_types == NODE_TYPE_CODES['book'])
+        TitleIndex.build(
+            book_ids,
+            [self.graph.names[book_id] for book_id in book_ids.tolist()],
+            self.graph.ratings[book_ids]
+        ).save(config.KG_TITLE_INDEX_DIR)
+        
+        # 实体嵌入按旧的实体ID训练，图谱重建后需要重新训练
+        if os.path.exists(config.KG_EMBEDDINGS_FILE):
+            os.remove(config.KG_EMBEDDINGS_FILE)
+            print(f"已删除过期的实体嵌入: {config.KG_EMBEDDINGS_FILE}")
         
         print(f"知识图谱已保存到 {config.KG_DIR}")
     
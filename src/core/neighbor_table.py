@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+图书近邻表
+离线为每本书预计算各策略下的 Top-N 相似图书，单本书的推荐请求直接查表
+"""
+import os
+import sys
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from src.core.graph_store import replacing_directory
+
+
+class NeighborTable:
+    """
+    预计算的图书近邻表
+    
+    每种策略一个 CSR（按实体ID索引）:
+    - {strategy}_indptr: 每本书近邻列表的起止位置
+    - {strategy}_ids: 近邻图书ID，按得分降序（同分按图书ID升序）
+    - {strategy}_scores: 近邻得分（float32）
+    
+    得分与 recommend() 在默认关系、不指定关键词时对单本书的打分完全相同，
+    因此单本书请求查表得到的 Top-K 就是该书近邻列表的前 K 个。
+    data_version 记录生成时的数据版本，数据更新后近邻表自动失效。
+    """
+    
+    STRATEGIES = ('mixed', 'kg_only', 'keyword_only')
+    
+    def __init__(self, top_n, data_version, arrays):
+        self.top_n = top_n
+        self.data_version = data_version
+        self.arrays = arrays  # {strategy: (indptr, ids, scores)}
+    
+    @classmethod
+    def build(cls, recommender, top_n=None, batch_size=None):
+        """
+        用稀疏矩阵引擎批量计算所有图书的近邻
+        
+        Args:
+            recommender: 已加载知识图谱和关键词的 KeywordBasedRecommender
+            top_n: 每本书保留的近邻数，None表示使用 config.NEIGHBOR_TABLE_TOP_N
+            batch_size: 每次一起打分的图书数，None表示使用 config.RECOMMEND_BATCH_SIZE
+        """
+        top_n = top_n or config.NEIGHBOR_TABLE_TOP_N
+        batch_size = batch_size or config.RECOMMEND_BATCH_SIZE
+        engine = recommender._get_scoring_engine()
+        relations = list(recommender.ALL_RELATIONS)
+        book_ids = [int(book_id) for book_id in recommender.book_entities]
+        num_entities = recommender.graph.number_of_nodes()
+        
+        arrays = {}
+        for strategy in cls.STRATEGIES:
+            print(f"计算近邻表: {strategy}（{len(book_ids)} 本书，每本 Top-{top_n}）...")
+            start_time = time.time()
+            use_keywords = strategy in ['mixed', 'keyword_only']
+            kg_relations = relations if strategy in ['mixed', 'kg_only'] else []
+            
+            counts = np.zeros(num_entities, dtype=np.int64)
+            id_chunks = []
+            score_chunks = []
+            for start in range(0, len(book_ids), batch_size):
+                chunk = book_ids[start:start + batch_size]
+                keyword_sets = [
+                    recommender._collect_favorite_keywords([book_id], strategy, None).most_common(50)
+                    if use_keywords else []
+                    for book_id in chunk
+                ]
+                neighbors = engine.top_k_batch(
+                    [[book_id] for book_id in chunk], keyword_sets, top_n,
+                    keyword_factor=0.5 if strategy == 'mixed' else 1.0,
+                    relations=kg_relations,
+                    relation_weights=recommender.RELATION_WEIGHTS,
+                    with_scores=True
+                )
+                for book_id, (ids, scores) in zip(chunk, neighbors):
+                    counts[book_id] = len(ids)
+                    id_chunks.append(np.asarray(ids, dtype=np.int32))
+                    score_chunks.append(np.asarray(scores, dtype=np.float32))
+            
+            # 近邻列表按实体ID顺序拼接即为 CSR
+            order = np.argsort(book_ids, kind='stable')
+            indptr = np.zeros(num_entities + 1, dtype=np.int64)
+            np.cumsum(counts, out=indptr[1:])
+            arrays[strategy] = (
+                indptr,
+                np.concatenate([id_chunks[i] for i in order] or [np.zeros(0, dtype=np.int32)]),
+                np.concatenate([score_chunks[i] for i in order] or [np.zeros(0, dtype=np.float32)])
+            )
+            print(f"  完成，耗时 {time.time() - start_time:.1f} 秒，共 {int(indptr[-1])} 条近邻")
+        
+        return cls(top_n, recommender._data_version(), arrays)
+    
+    def save(self, path):
+        """保存为 .npy 文件目录（写入临时目录后替换，见 replacing_directory）"""
+        with replacing_directory(path) as tmp_path:
+            for strategy, (indptr, ids, scores) in self.arrays.items():
+                np.save(os.path.join(tmp_path, f'{strategy}_indptr.npy'), indptr)
+                np.save(os.path.join(tmp_path, f'{strategy}_ids.npy'), ids)
+                np.save(os.path.join(tmp_path, f'{strategy}_scores.npy'), scores)
+            # 元数据最后写入，作为近邻表完整的标志
+            with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'top_n': self.top_n, 'data_version': self.data_version}, f)
+    
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """从 .npy 文件目录加载"""
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {
+            strategy: tuple(
+                np.load(os.path.join(path, f'{strategy}_{name}.npy'), mmap_mode=mmap_mode)
+                for name in ('indptr', 'ids', 'scores')
+            )
+            for strategy in cls.STRATEGIES
+        }
+        return cls(meta['top_n'], meta['data_version'], arrays)
+    
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, 'meta.json'))
+    
+    def neighbors(self, strategy, book_id):
+        """图书在该策略下的 (近邻ID数组, 得分数组)，按得分降序"""
+        indptr, ids, scores = self.arrays[strategy]
+        start, end = indptr[book_id], indptr[book_id + 1]
+        return ids[start:end], scores[start:end]
+    
+    def merge(self, strategy, book_ids, k, boost):
+        """
+        合并多本书的近邻列表（多本书请求的近似 Top-K）
+        
+        各列表中的得分都包含候选书自身的评分/热度加权，合并时只计一次:
+        合并得分 = Σ(近邻得分 - 加权) + 加权。只出现在某本书 Top-N 之外的候选会被忽略。
+        
+        Args:
+            book_ids: 用户喜欢的图书ID列表
+            k: 返回数量
+            boost: 函数，图书ID数组 -> 评分/热度加权数组
+        
+        Returns:
+            图书ID列表，按合并得分降序（同分按图书ID升序）
+        """
+        ids_list, scores_list = zip(*(self.neighbors(strategy, book_id) for book_id in book_ids))
+        ids = np.concatenate(ids_list).astype(np.int64)
+        if len(ids) == 0 or k <= 0:
+            return []
+        
+        candidates, inverse = np.unique(ids, return_inverse=True)
+        candidate_boost = boost(candidates)
+        contribution = np.concatenate(scores_list).astype(np.float64) - candidate_boost[inverse]
+        merged = np.bincount(inverse, weights=contribution, minlength=len(candidates)) + candidate_boost
+        
+        keep = ~np.isin(candidates, np.asarray(book_ids, dtype=np.int64))
+        candidates = candidates[keep]
+        merged = merged[keep]
+        order = np.lexsort((candidates, -merged))[:k]
+        return candidates[order].tolist()
+
+
+if __name__ == '__main__':
+    from src.core.keyword_recommender import KeywordBasedRecommender
+    
+    recommender = KeywordBasedRecommender()
+    recommender.load_kg()
+    recommender.load_and_analyze_comments()
+    recommender.build_neighbor_table()
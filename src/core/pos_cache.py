@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+词性缓存
+同一个词会在大量图书的候选关键词中反复出现，词性只需标注一次。
+缓存在进程内共享，并持久化到磁盘供下次提取使用。
+"""
+import os
+import pickle
+
+_cache = {}  # {词: 主词性}，无法标注的词为空字符串
+_added = {}  # 新标注、尚未保存（或尚未回传主进程）的词性
+
+
+def get_pos(word):
+    """词的主词性（jieba 词性标注结果中第一个词的词性），无法标注时返回空字符串"""
+    pos = _cache.get(word)
+    if pos is None:
+        import jieba.posseg as pseg
+        
+        pos_tags = list(pseg.cut(word))
+        pos = pos_tags[0].flag if pos_tags else ''
+        _cache[word] = pos
+        _added[word] = pos
+    return pos
+
+
+def size():
+    return len(_cache)
+
+
+def take_added():
+    """取出并清空新标注的词性（工作进程用于把结果回传给主进程）"""
+    added = dict(_added)
+    _added.clear()
+    return added
+
+
+def update(entries):
+    """合并其他进程标注的词性"""
+    for word, pos in entries.items():
+        if word not in _cache:
+            _cache[word] = pos
+            _added[word] = pos
+
+
+def load(path):
+    """从磁盘加载词性缓存（文件不存在或损坏时忽略）"""
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, 'rb') as f:
+            _cache.update(pickle.load(f))
+    except Exception as e:
+        print(f"词性缓存加载失败: {e}")
+
+
+def save(path):
+    """有新标注的词性时写回磁盘（先写临时文件再替换）"""
+    if not _added:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(_cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    _added.clear()
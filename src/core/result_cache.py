@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+推荐结果缓存
+LRU + TTL 缓存，按条目数和字节数双重限制大小
+
+存储后端可替换:
+- ResultCache: 进程内缓存（默认）
+- SQLiteResultCache: 同一台机器上所有工作进程共享的 SQLite（WAL 模式）文件缓存
+- RedisResultCache: Redis 协议兼容的缓存服务（需要安装 redis 包）
+"""
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    LRU + TTL 结果缓存（进程内，线程安全）
+    
+    - 值以 pickle 字节保存，字节数即条目大小；取出时反序列化为新对象，
+      调用方修改返回结果不会影响缓存
+    - 超过条目数或字节数上限时，淘汰最久未使用的条目
+    - 条目写入超过 ttl 秒后失效
+    - 键为可 JSON 序列化的元组，加上命名空间（数据版本）转为字符串后存储
+    
+    子类通过重写 _load / _store / _clear_entries / _storage_stats 替换存储后端。
+    """
+    
+    # 数据重新加载后是否需要删除已有条目（进程内缓存删除；共享缓存只切换命名空间，
+    # 由其他仍在使用旧数据的工作进程继续命中，旧条目随 TTL / LRU 淘汰）
+    clear_on_invalidate = True
+    
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=600):
+        """
+        Args:
+            max_entries: 最大条目数，0 表示关闭缓存
+            max_bytes: 所有条目的最大总字节数
+            ttl: 条目有效期（秒），None 表示不过期
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.namespace = ''
+        self._entries = OrderedDict()  # key -> (过期时间, 数据)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+    
+    def _make_key(self, key):
+        return f'{self.namespace}:{json.dumps(key, ensure_ascii=False)}'
+    
+    def get(self, key):
+        """获取缓存值，未命中或已过期时返回 None"""
+        if not self.enabled:
+            return None
+        data = self._load(self._make_key(key))
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(data)
+    
+    def put(self, key, value):
+        """写入缓存，单个值超过字节上限时不缓存"""
+        if not self.enabled:
+            return
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        self._store(self._make_key(key), data)
+    
+    def clear(self):
+        """删除所有条目"""
+        self._clear_entries()
+        with self._lock:
+            self.invalidations += 1
+    
+    def invalidate(self, namespace=''):
+        """
+        数据（知识图谱或关键词缓存）重新加载后调用
+        
+        Args:
+            namespace: 新数据的版本标识，之后的读写都在该命名空间下进行
+        """
+        self.namespace = namespace
+        if self.clear_on_invalidate:
+            self._clear_entries()
+        with self._lock:
+            self.invalidations += 1
+    
+    def stats(self):
+        """命中统计（命中/未命中为本进程的计数）"""
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {
+                'backend': self.backend_name,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total > 0 else 0,
+                'invalidations': self.invalidations
+            }
+        stats.update(self._storage_stats())
+        return stats
+    
+    # ---- 存储后端 ----
+    
+    backend_name = 'memory'
+    
+    def _load(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def _store(self, key, data):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires, data)
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+    
+    def _clear_entries(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def _remove(self, key):
+        _, data = self._entries.pop(key)
+        self._bytes -= len(data)
+    
+    def _storage_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+    
+    def __len__(self):
+        return self._storage_stats()['entries']
+
+
+class SQLiteResultCache(ResultCache):
+    """
+    SQLite 文件缓存（WAL 模式），同一台机器上的多个工作进程共享
+    
+    每个线程（以及 fork 出的每个进程）使用独立连接。最近访问时间按秒级精度更新，
+    写入后检查条目数和字节数上限，按最近访问时间淘汰。
+    """
+    
+    clear_on_invalidate = False
+    backend_name = 'sqlite'
+    
+    def __init__(self, path, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=600):
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connect()
+    
+    def _connect(self):
+        """当前线程的连接（fork 之后重新连接）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS result_cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+            'expires REAL, accessed REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS result_cache_accessed ON result_cache (accessed)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+    
+    def _load(self, key):
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT value, expires, accessed FROM result_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        now = time.time()
+        if expires is not None and expires <= now:
+            conn.execute('DELETE FROM result_cache WHERE key = ?', (key,))
+            with self._lock:
+                self.expirations += 1
+            return None
+        if now - accessed >= 1:
+            conn.execute('UPDATE result_cache SET accessed = ? WHERE key = ?', (now, key))
+        return value
+    
+    def _store(self, key, data):
+        conn = self._connect()
+        now = time.time()
+        expires = now + self.ttl if self.ttl is not None else None
+        conn.execute(
+            'INSERT OR REPLACE INTO result_cache (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+            (key, sqlite3.Binary(data), len(data), expires, now)
+        )
+        self._evict(conn, now)
+    
+    def _evict(self, conn, now):
+        """删除过期条目，再按最近访问时间淘汰到上限以内"""
+        conn.execute('DELETE FROM result_cache WHERE expires IS NOT NULL AND expires <= ?', (now,))
+        count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM result_cache').fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        
+        evict_keys = []
+        for key, size in conn.execute('SELECT key, size FROM result_cache ORDER BY accessed'):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evict_keys.append(key)
+            count -= 1
+            total -= size
+        conn.executemany('DELETE FROM result_cache WHERE key = ?', [(key,) for key in evict_keys])
+        with self._lock:
+            self.evictions += len(evict_keys)
+    
+    def _clear_entries(self):
+        self._connect().execute('DELETE FROM result_cache')
+    
+    def _storage_stats(self):
+        count, total = self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM result_cache'
+        ).fetchone()
+        with self._lock:
+            return {
+                'entries': count,
+                'bytes': total,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'path': self.path
+            }
+
+
+class RedisResultCache(ResultCache):
+    """
+    Redis 协议兼容的共享缓存
+    
+    过期由服务端 TTL 处理；max_entries 只用于开关缓存，总大小上限需在服务端通过
+    maxmemory + allkeys-lru 策略配置，max_bytes 只限制单个条目。
+    """
+    
+    clear_on_invalidate = False
+    backend_name = 'redis'
+    
+    def __init__(self, url, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=600, prefix='book_rec:'):
+        import redis
+        
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+    
+    def _load(self, key):
+        return self._client.get(self.prefix + key)
+    
+    def _store(self, key, data):
+        self._client.set(self.prefix + key, data, ex=int(self.ttl) if self.ttl is not None else None)
+    
+    def _clear_entries(self):
+        keys = list(self._client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+    
+    def _storage_stats(self):
+        return {'url': self.url, 'prefix': self.prefix}
+
+
+def create_result_cache(backend='memory', max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=600,
+                        sqlite_file=None, redis_url=None):
+    """
+    按配置创建结果缓存，共享后端不可用时退回进程内缓存
+    
+    Args:
+        backend: 'memory'（进程内）、'sqlite'（本机共享文件）或 'redis'
+    """
+    try:
+        if backend == 'sqlite':
+            return SQLiteResultCache(sqlite_file, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        if backend == 'redis':
+            return RedisResultCache(redis_url, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+    except Exception as e:
+        print(f"结果缓存后端 {backend} 不可用: {e}，使用进程内缓存")
+    return ResultCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+稀疏矩阵打分引擎
+将关键词匹配和知识图谱关系打分转换为稀疏矩阵与偏好向量的乘法
+"""
+import numpy as np
+from scipy import sparse
+
+
+class SparseScoringEngine:
+    """
+    基于 SciPy CSR 矩阵的向量化打分引擎
+    
+    - 关键词矩阵: 关键词 x 图书 的 0/1 关联矩阵（来自关键词存储）
+    - 关系矩阵: 每种关系一个 实体 x 图书 的 0/1 关联矩阵（来自 relation_index）
+    - 加权向量: 每本书的评分加权 + 热度加权
+    
+    打分规则与 KeywordBasedRecommender._score_candidates 完全相同，
+    每个信号只需一次稀疏矩阵-向量乘法，Top-K 由 argpartition 选出。
+    """
+    
+    def __init__(self, recommender):
+        self.book_ids = np.asarray(recommender.book_entities, dtype=np.int64)
+        num_entities = recommender.graph.number_of_nodes()
+        
+        # 实体ID -> 矩阵列号（非图书为 -1）
+        self.book_col = np.full(num_entities, -1, dtype=np.int64)
+        self.book_col[self.book_ids] = np.arange(len(self.book_ids))
+        num_books = len(self.book_ids)
+        
+        # 关键词 x 图书（直接复用关键词存储的 关键词 -> 图书 CSR 数组）
+        store = recommender.keyword_store
+        if store is not None:
+            self.keyword_id = store.keyword_id
+            self.keyword_matrix = sparse.csr_matrix(
+                (np.ones(len(store.keyword_book_ids), dtype=np.float64),
+                 self.book_col[store.keyword_book_ids], store.keyword_indptr),
+                shape=(len(store.keywords), num_books)
+            )
+        else:
+            self.keyword_id = lambda keyword: None
+            self.keyword_matrix = sparse.csr_matrix((0, num_books), dtype=np.float64)
+        
+        # 实体 x 图书（每种关系一个）
+        self.relation_matrices = {}
+        for rel_type, (rel_indptr, rel_books) in recommender.relation_index.items():
+            self.relation_matrices[rel_type] = sparse.csr_matrix(
+                (np.ones(len(rel_books), dtype=np.float64), self.book_col[rel_books], rel_indptr),
+                shape=(len(rel_indptr) - 1, num_books)
+            )
+        
+        # 评分加权 + 热度加权（与 _apply_boost_and_reasons 相同）
+        ratings = np.nan_to_num(np.asarray(recommender.graph.ratings[self.book_ids], dtype=np.float64), nan=0.0)
+        if store is not None:
+            popularity = np.where(store.has_stats[self.book_ids], store.popularity[self.book_ids], 0.0)
+        else:
+            popularity = np.zeros(num_books, dtype=np.float64)
+        self.boost = np.where(ratings > 0, ratings / 10.0 * 0.15, 0.0) + popularity * 0.05
+        
+        self.get_neighbors = recommender._get_neighbors_by_type
+        self.last_candidate_count = 0
+    
+    def score(self, favorite_entities, top_keywords, keyword_factor=1.0, relations=(), relation_weights=None):
+        """
+        计算所有图书的得分
+        
+        Args:
+            favorite_entities: 用户喜欢的图书ID列表
+            top_keywords: [(关键词, 权重), ...]，即 favorite_keywords.most_common(50)
+            keyword_factor: 关键词得分系数
+            relations: 参与打分的关系类型
+            relation_weights: {关系类型: 权重}
+        
+        Returns:
+            (scores, is_candidate): 每本书的得分和是否为候选
+        """
+        num_books = len(self.book_ids)
+        scores = np.zeros(num_books, dtype=np.float64)
+        hits = np.zeros(num_books, dtype=np.float64)
+        
+        # 关键词信号
+        if top_keywords:
+            pref = np.zeros(self.keyword_matrix.shape[0], dtype=np.float64)
+            mask = np.zeros(self.keyword_matrix.shape[0], dtype=np.float64)
+            for keyword, weight in top_keywords:
+                row = self.keyword_id(keyword)
+                if row is not None:
+                    pref[row] = weight * keyword_factor
+                    mask[row] = 1.0
+            scores += self.keyword_matrix.T.dot(pref)
+            hits += self.keyword_matrix.T.dot(mask)
+        
+        # 知识图谱关系信号
+        for rel_type in relations:
+            matrix = self.relation_matrices[rel_type]
+            pref = np.zeros(matrix.shape[0], dtype=np.float64)
+            for fav_id in favorite_entities:
+                for entity_id in self.get_neighbors(fav_id)[rel_type]:
+                    pref[entity_id] += 1.0
+            if not pref.any():
+                continue
+            counts = matrix.T.dot(pref)
+            scores += counts * relation_weights[rel_type]
+            hits += counts
+        
+        is_candidate = hits > 0
+        fav_cols = self.book_col[np.asarray(favorite_entities, dtype=np.int64)]
+        is_candidate[fav_cols[fav_cols >= 0]] = False
+        
+        scores += self.boost
+        return scores, is_candidate
+    
+    def top_k(self, favorite_entities, top_keywords, k, **kwargs):
+        """返回得分最高的 k 本候选书籍ID（按得分降序，同分按图书ID升序）"""
+        scores, is_candidate = self.score(favorite_entities, top_keywords, **kwargs)
+        candidates = np.flatnonzero(is_candidate)
+        self.last_candidate_count = len(candidates)
+        if len(candidates) == 0 or k <= 0:
+            return []
+        
+        candidates, _ = self._select_top(candidates, scores[candidates], k)
+        return self.book_ids[candidates].tolist()
+    
+    def top_k_batch(self, favorite_sets, keyword_sets, k, keyword_factor=1.0, relations=(), relation_weights=None,
+                    with_scores=False):
+        """
+        批量计算多组输入的 Top-K
+        
+        每个信号只做一次 (请求 x 关键词/实体) 偏好矩阵与关联矩阵的稀疏矩阵乘法，
+        候选即命中矩阵每行的非零列，不会为每组输入展开整行稠密得分。
+        单组输入的结果与 top_k 完全相同。
+        
+        Args:
+            favorite_sets: [[图书ID, ...], ...]
+            keyword_sets: [[(关键词, 权重), ...], ...]，与 favorite_sets 一一对应
+            k: 每组返回的数量
+            with_scores: 是否同时返回得分
+        
+        Returns:
+            [[图书ID, ...], ...]，每组按得分降序（同分按图书ID升序）；
+            with_scores 时每组为 ([图书ID, ...], [得分, ...])
+        """
+        num_rows = len(favorite_sets)
+        num_books = len(self.book_ids)
+        scores = sparse.csr_matrix((num_rows, num_books), dtype=np.float64)
+        hits = sparse.csr_matrix((num_rows, num_books), dtype=np.float64)
+        
+        # 关键词信号
+        rows, cols, weights = [], [], []
+        for row, top_keywords in enumerate(keyword_sets):
+            for keyword, weight in top_keywords:
+                keyword_row = self.keyword_id(keyword)
+                if keyword_row is not None:
+                    rows.append(row)
+                    cols.append(keyword_row)
+                    weights.append(weight * keyword_factor)
+        if rows:
+            shape = (num_rows, self.keyword_matrix.shape[0])
+            pref = sparse.csr_matrix((weights, (rows, cols)), shape=shape)
+            mask = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=shape)
+            # 按关键词ID顺序累加，与单组打分的求和顺序一致
+            pref.sort_indices()
+            scores = scores + pref.dot(self.keyword_matrix)
+            hits = hits + mask.dot(self.keyword_matrix)
+        
+        # 知识图谱关系信号（重复的邻居实体在转换为 CSR 时累加为计数）
+        for rel_type in relations:
+            matrix = self.relation_matrices[rel_type]
+            rows, cols = [], []
+            for row, favorite_entities in enumerate(favorite_sets):
+                for fav_id in favorite_entities:
+                    for entity_id in self.get_neighbors(fav_id)[rel_type]:
+                        rows.append(row)
+                        cols.append(entity_id)
+            if not rows:
+                continue
+            pref = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(num_rows, matrix.shape[0]))
+            counts = pref.dot(matrix)
+            scores = scores + counts * relation_weights[rel_type]
+            hits = hits + counts
+        
+        scores.sort_indices()
+        hits.sort_indices()
+        results = []
+        for row, favorite_entities in enumerate(favorite_sets):
+            candidates = hits.indices[hits.indptr[row]:hits.indptr[row + 1]]
+            candidates = candidates[hits.data[hits.indptr[row]:hits.indptr[row + 1]] > 0]
+            
+            # 得分矩阵的非零列是命中矩阵非零列的子集
+            candidate_scores = np.zeros(len(candidates), dtype=np.float64)
+            score_cols = scores.indices[scores.indptr[row]:scores.indptr[row + 1]]
+            score_data = scores.data[scores.indptr[row]:scores.indptr[row + 1]]
+            pos = np.searchsorted(candidates, score_cols)
+            found = pos < len(candidates)
+            found[found] = candidates[pos[found]] == score_cols[found]
+            candidate_scores[pos[found]] = score_data[found]
+            
+            fav_cols = self.book_col[np.asarray(favorite_entities, dtype=np.int64)]
+            keep = ~np.isin(candidates, fav_cols[fav_cols >= 0])
+            candidates = candidates[keep]
+            candidate_scores = candidate_scores[keep] + self.boost[candidates]
+            
+            if len(candidates) == 0 or k <= 0:
+                results.append(([], []) if with_scores else [])
+                continue
+            candidates, candidate_scores = self._select_top(candidates, candidate_scores, k)
+            top_books = self.book_ids[candidates].tolist()
+            results.append((top_books, candidate_scores.tolist()) if with_scores else top_books)
+        return results
+    
+    @staticmethod
+    def _select_top(candidates, candidate_scores, k):
+        """
+        选出得分最高的 k 个候选（按得分降序，同分按列号即图书ID升序）
+        
+        argpartition 在第 k 名有并列得分时会任选其一，这里保留所有不低于第 k 名得分的候选
+        再排序截断，保证结果确定。
+        """
+        if len(candidates) > k:
+            kth_score = np.partition(candidate_scores, len(candidates) - k)[len(candidates) - k]
+            keep = candidate_scores >= kth_score
+            candidates = candidates[keep]
+            candidate_scores = candidate_scores[keep]
+        order = np.lexsort((candidates, -candidate_scores))[:k]
+        return candidates[order], candidate_scores[order]
+    
+    def boost_of(self, book_ids):
+        """图书ID数组对应的评分/热度加权"""
+        return self.boost[self.book_col[book_ids]]
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+书名索引
+加载时构建一次，用于书名的前缀/子串搜索和书名解析
+"""
+import os
+
+import numpy as np
+
+from src.core.graph_store import StringTable, replacing_directory
+
+
+class TitleIndex:
+    """
+    书名搜索索引
+    
+    - 前缀索引: 按书名排序的文档号数组，二分查找得到前缀区间（等价于压缩前缀树），
+      完全匹配即前缀区间中书名与输入相同的部分
+    - 子串索引: 字符 1-gram / 2-gram 倒排表（CSR格式），用于中文子串匹配
+    
+    内部文档号按评分从高到低分配，倒排表天然按评分排序，
+    子串搜索只需按顺序扫描最短的倒排表即可得到评分最高的结果。
+    所有数据都是数组和字符串表，可以保存后用 mmap_mode='r' 加载。
+    """
+    
+    def __init__(self, doc_book_ids, doc_names, sorted_docs, grams, gram_indptr, gram_docs):
+        self.doc_book_ids = doc_book_ids  # 文档号 -> 图书ID
+        self.doc_names = doc_names  # 文档号 -> 规范化书名
+        self.sorted_docs = sorted_docs  # 按书名排序的文档号
+        self.grams = grams  # 有序 gram 表
+        self.gram_indptr = gram_indptr
+        self.gram_docs = gram_docs
+    
+    @classmethod
+    def build(cls, book_ids, names, ratings):
+        """
+        Args:
+            book_ids: 图书实体ID列表
+            names: 书名列表
+            ratings: 评分列表（用于排序，NaN视为0）
+        """
+        ratings = np.nan_to_num(np.asarray(ratings, dtype=np.float64), nan=0.0)
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        
+        # 文档号按 (评分降序, 图书ID升序) 分配
+        doc_order = np.lexsort((book_ids, -ratings))
+        doc_names = [cls.normalize(names[i]) for i in doc_order.tolist()]
+        
+        # 前缀索引
+        sorted_docs = sorted(range(len(doc_names)), key=doc_names.__getitem__)
+        
+        # n-gram 倒排索引: gram -> 文档号（每个倒排表内文档号升序）
+        gram_ids = {}
+        gram_col = []
+        doc_col = []
+        for doc, name in enumerate(doc_names):
+            for gram in cls._ngrams(name):
+                gram_col.append(gram_ids.setdefault(gram, len(gram_ids)))
+                doc_col.append(doc)
+        
+        # gram 按字符串排序，便于二分查找
+        sorted_grams = sorted(gram_ids)
+        gram_rank = np.empty(len(gram_ids), dtype=np.int64)
+        gram_rank[[gram_ids[gram] for gram in sorted_grams]] = np.arange(len(sorted_grams))
+        gram_col = gram_rank[np.asarray(gram_col, dtype=np.int64)]
+        doc_col = np.asarray(doc_col, dtype=np.int32)
+        
+        order = np.lexsort((doc_col, gram_col))
+        counts = np.bincount(gram_col, minlength=len(sorted_grams))
+        gram_indptr = np.zeros(len(sorted_grams) + 1, dtype=np.int64)
+        np.cumsum(counts, out=gram_indptr[1:])
+        
+        return cls(
+            book_ids[doc_order],
+            StringTable.from_strings(doc_names),
+            np.asarray(sorted_docs, dtype=np.int32),
+            StringTable.from_strings(sorted_grams),
+            gram_indptr,
+            doc_col[order]
+        )
+    
+    def save(self, path):
+        """保存为 .npy 文件目录（写入临时目录后替换，见 replacing_directory）"""
+        with replacing_directory(path) as tmp_path:
+            np.save(os.path.join(tmp_path, 'doc_book_ids.npy'), self.doc_book_ids)
+            np.save(os.path.join(tmp_path, 'sorted_docs.npy'), self.sorted_docs)
+            np.save(os.path.join(tmp_path, 'gram_indptr.npy'), self.gram_indptr)
+            np.save(os.path.join(tmp_path, 'gram_docs.npy'), self.gram_docs)
+            self.doc_names.save(tmp_path, 'doc_names')
+            self.grams.save(tmp_path, 'grams')
+    
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """从 .npy 文件目录加载"""
+        return cls(
+            np.load(os.path.join(path, 'doc_book_ids.npy'), mmap_mode=mmap_mode),
+            StringTable.load(path, 'doc_names', mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'sorted_docs.npy'), mmap_mode=mmap_mode),
+            StringTable.load(path, 'grams', mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'gram_indptr.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'gram_docs.npy'), mmap_mode=mmap_mode)
+        )
+    
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, 'gram_docs.npy'))
+    
+    @staticmethod
+    def normalize(name):
+        """书名规范化: 去除首尾空白并转小写"""
+        return str(name).strip().lower()
+    
+    @staticmethod
+    def _ngrams(text):
+        """文本的 1-gram 和 2-gram 集合"""
+        grams = set(text)
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+        return grams
+    
+    def _postings(self, gram):
+        """获取 gram 的倒排表，不存在时返回 None"""
+        pos = self.grams.bisect_left(gram)
+        if pos >= len(self.grams) or self.grams[pos] != gram:
+            return None
+        return self.gram_docs[self.gram_indptr[pos]:self.gram_indptr[pos + 1]]
+    
+    def __len__(self):
+        return len(self.doc_book_ids)
+    
+    def exact_docs(self, query):
+        """书名完全等于 query（已规范化）的文档号，按评分排序"""
+        lo = self.doc_names.bisect_left(query, order=self.sorted_docs)
+        hi = self.doc_names.bisect_right(query, lo, order=self.sorted_docs)
+        return np.sort(self.sorted_docs[lo:hi]).tolist()
+    
+    def prefix_docs(self, query, limit):
+        """
+        前缀匹配
+        
+        Returns:
+            (exact, prefix): 完全匹配的全部文档号、其余前缀匹配中评分最高的 limit 个文档号，均按评分排序
+        """
+        lo = self.doc_names.bisect_left(query, order=self.sorted_docs)
+        mid = self.doc_names.bisect_right(query, lo, order=self.sorted_docs)
+        hi = self.doc_names.bisect_left(query + '\U0010ffff', mid, order=self.sorted_docs)
+        exact = np.sort(self.sorted_docs[lo:mid]).tolist()
+        docs = self.sorted_docs[mid:hi]
+        if len(docs) > limit:
+            docs = np.partition(docs, limit - 1)[:limit]
+        return exact, np.sort(docs).tolist()
+    
+    def substring_docs(self, query, limit, exclude=()):
+        """子串匹配，返回评分最高的 limit 个文档号（按评分排序）"""
+        grams = [query] if len(query) == 1 else [
+            query[i:i + 2] for i in range(len(query) - 1)
+        ]
+        postings = []
+        for gram in set(grams):
+            docs = self._postings(gram)
+            if docs is None or len(docs) == 0:
+                return []
+            postings.append(docs)
+        postings.sort(key=len)
+        
+        # 先对最短的几个倒排表求交，再逐个校验子串
+        candidates = postings[0]
+        for docs in postings[1:3]:
+            candidates = np.intersect1d(candidates, docs, assume_unique=True)
+        
+        results = []
+        for doc in candidates.tolist():
+            if doc in exclude or query not in self.doc_names[doc]:
+                continue
+            results.append(doc)
+            if len(results) >= limit:
+                break
+        return results
+    
+    def search(self, query, limit=10):
+        """
+        搜索书名
+        
+        排序: 完全匹配 > 前缀匹配 > 其他子串匹配，同组内按评分从高到低
+        
+        Returns:
+            图书实体ID列表
+        """
+        query = self.normalize(query)
+        if not query or limit <= 0:
+            return []
+        
+        exact, prefix = self.prefix_docs(query, limit)
+        docs = (exact + prefix)[:limit]
+        if len(docs) < limit:
+            docs += self.substring_docs(query, limit - len(docs), exclude=set(docs))
+        
+        return self.doc_book_ids[docs].tolist()
+    
+    def resolve(self, book_name, popularity=None, max_candidates=100):
+        """
+        将用户输入的书名解析为图书实体ID
+        
+        1. 规范化书名完全匹配
+        2. 包含匹配: 书名包含输入（n-gram索引，取评分最高的 max_candidates 个），
+           或输入包含书名（枚举输入的所有子串做完全匹配）
+        
+        多个候选时按 (热度, 评分, 图书ID升序) 选出唯一结果，保证结果确定。
+        
+        Args:
+            book_name: 用户输入的书名
+            popularity: {book_id: 热度}，None表示只按评分排序
+            max_candidates: 包含匹配时最多考虑的候选数
+        
+        Returns:
+            图书实体ID，未找到时返回 None
+        """
+        query = self.normalize(book_name)
+        if not query:
+            return None
+        
+        docs = self.exact_docs(query)
+        if not docs:
+            docs = self.substring_docs(query, max_candidates)
+            for start in range(len(query)):
+                for end in range(start + 1, len(query) + 1):
+                    docs.extend(self.exact_docs(query[start:end]))
+            if not docs:
+                return None
+        
+        # 文档号越小评分越高
+        if popularity is None:
+            best = min(docs)
+        else:
+            best = max(docs, key=lambda doc: (popularity.get(int(self.doc_book_ids[doc]), 0), -doc))
+        return int(self.doc_book_ids[best])
@@ -2,40 +2,175 @@
 """
 访问日志统计分析工具
 分析访问日志，统计IP、访问量、热门接口等
+
+日志行可以是原有的文本格式（IP=... | Method=... | Path=...），也可以是 JSON 格式
+（config.ACCESS_LOG_FORMAT = 'json'，另有状态码、耗时、推荐策略和书籍数）。
+
+每天的日志按小时汇总，与每个日志文件已读到的位置一起保存在当天的日志目录（见 update_day），
+再次分析时只读取新写入的内容，报告由各天的汇总合并得到。
+日志文件按 inode 识别: 轮转为 access.log.1 等备份后从原来的位置继续读取。
+分析多天的日志时，有新内容的日期在进程池中各自读取（每天的日志文件和轮转备份由一个进程处理），
+各进程返回当天的汇总，由主进程合并。
 """
 import os
 import re
+import sys
 from datetime import datetime, timedelta
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 import json
 
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils.timing import Histogram, LATENCY_BUCKETS_MS
+
+ROLLUP_FILE = 'access_rollup.json'  # 每天的小时汇总和读取位置
+SUMMARY_FILE = 'access_summary.json'  # 每天的汇总、每小时请求数和读取位置
+ROLLUP_VERSION = 1
+LOG_BACKUP_COUNT = 5  # 日志轮转的备份数（与 DateBasedLogger 的 backup_count 一致）
+READ_CHUNK_BYTES = 8 * 1024 * 1024
+HEAD_BYTES = 64  # 文件开头的字节，用于识别 inode 被新文件复用
+JSON_FIELDS = ('time', 'ip', 'method', 'path', 'status', 'latency_ms', 'strategy', 'books')
+# 日志行: 文本格式时一次匹配取出小时、IP、方法和路径（与 parse_log_line 逐个字段查找的结果相同），
+# 其他行（JSON 格式、空行等）整行放在最后一组
+LOG_LINE_PATTERN = re.compile(
+    r'^(?:\d{4}-\d{2}-\d{2} (\d{2}):\d{2}:\d{2} - \S+ - \S+ - IP=(\S+) \| Method=(\S+) \| Path=(\S+).*|(.*))$',
+    re.M
+)
+
+
+class HourlyRollup:
+    """一个小时（或合并后的多个小时）的访问统计"""
+    
+    COUNTERS = ('ips', 'paths', 'methods', 'statuses', 'strategies', 'books')
+    
+    def __init__(self):
+        self.requests = 0
+        self.ips = Counter()
+        self.paths = Counter()
+        self.methods = Counter()
+        self.statuses = Counter()
+        self.strategies = Counter()
+        self.books = Counter()  # 喜欢的书籍数 -> 请求数
+        self.ip_paths = defaultdict(Counter)
+        self.latency = Histogram(LATENCY_BUCKETS_MS)  # 耗时（毫秒）
+    
+    def add(self, data, count=1):
+        """计入 count 条字段相同的日志"""
+        self.requests += count
+        ip = data.get('ip')
+        path = data.get('path')
+        if ip is not None:
+            self.ips[ip] += count
+            if path is not None:
+                self.ip_paths[ip][path] += count
+        if path is not None:
+            self.paths[path] += count
+        if 'method' in data:
+            self.methods[data['method']] += count
+        if 'status' in data:
+            self.statuses[str(data['status'])] += count
+        if 'strategy' in data:
+            self.strategies[data['strategy']] += count
+        if 'books' in data:
+            self.books[str(data['books'])] += count
+        if 'latency_ms' in data:
+            for _ in range(count):
+                self.latency.observe(data['latency_ms'])
+    
+    def merge(self, other):
+        self.requests += other.requests
+        for name in self.COUNTERS:
+            getattr(self, name).update(getattr(other, name))
+        for ip, paths in other.ip_paths.items():
+            self.ip_paths[ip].update(paths)
+        self._merge_latency(other.latency.counts, other.latency.sum, other.latency.max)
+    
+    def _merge_latency(self, counts, total, maximum):
+        self.latency.counts = [a + b for a, b in zip(self.latency.counts, counts)]
+        self.latency.total += sum(counts)
+        self.latency.sum += total
+        self.latency.max = max(self.latency.max, maximum)
+    
+    def to_dict(self):
+        data = {'requests': self.requests}
+        for name in self.COUNTERS:
+            data[name] = dict(getattr(self, name))
+        data['ip_paths'] = {ip: dict(paths) for ip, paths in self.ip_paths.items()}
+        data['latency_ms'] = [self.latency.counts, self.latency.sum, self.latency.max]
+        return data
+    
+    @classmethod
+    def from_dict(cls, data):
+        rollup = cls()
+        rollup.requests = data['requests']
+        for name in cls.COUNTERS:
+            getattr(rollup, name).update(data[name])
+        for ip, paths in data['ip_paths'].items():
+            rollup.ip_paths[ip].update(paths)
+        rollup._merge_latency(*data['latency_ms'])
+        return rollup
+
 
 class AccessLogAnalyzer:
     """访问日志分析器"""
     
-    def __init__(self, log_base_dir='logs'):
+    def __init__(self, log_base_dir='logs', use_index=True, workers=None):
+        """
+        Args:
+            log_base_dir: 日志根目录
+            use_index: 是否读取和更新每天的小时汇总（False 时每次重新读取全部日志）
+            workers: 同时读取日志的进程数，None表示CPU核数，1表示在当前进程中依次读取
+        """
         self.log_base_dir = log_base_dir
+        self.use_index = use_index
+        self.workers = workers or os.cpu_count() or 1
         self.ip_pattern = re.compile(r'IP=([^\s]+)')
         self.method_pattern = re.compile(r'Method=([^\s]+)')
         self.path_pattern = re.compile(r'Path=([^\s]+)')
         self.time_pattern = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})')
-        
-    def get_log_files(self, days=1):
-        """获取最近N天的日志文件"""
-        log_files = []
+    
+    def get_log_dirs(self, days=1):
+        """获取最近N天的日志目录"""
+        log_dirs = []
         
         for i in range(days):
             date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
             log_dir = os.path.join(self.log_base_dir, date)
-            access_log = os.path.join(log_dir, 'access.log')
             
-            if os.path.exists(access_log):
-                log_files.append(access_log)
+            if os.path.isdir(log_dir):
+                log_dirs.append(log_dir)
         
+        return log_dirs
+    
+    @staticmethod
+    def get_day_files(log_dir):
+        """一天的访问日志文件（轮转的备份在前，越早的越靠前）"""
+        access_log = os.path.join(log_dir, 'access.log')
+        candidates = [f'{access_log}.{n}' for n in range(LOG_BACKUP_COUNT, 0, -1)] + [access_log]
+        return [path for path in candidates if os.path.exists(path)]
+    
+    def get_log_files(self, days=1):
+        """获取最近N天的日志文件"""
+        log_files = []
+        for log_dir in self.get_log_dirs(days):
+            log_files.extend(self.get_day_files(log_dir))
         return log_files
     
     def parse_log_line(self, line):
         """解析单行日志"""
+        if line.startswith('{'):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                data = {key: record[key] for key in JSON_FIELDS if record.get(key) is not None}
+                return data if data else None
+        
         data = {}
         
         # 提取时间
@@ -60,46 +195,189 @@ class AccessLogAnalyzer:
         
         return data if data else None
     
+    # ---- 增量汇总 ----
+    
+    def _load_json(self, log_dir, name):
+        """读取当天日志目录下的汇总文件，不存在、损坏或版本不同时返回 None"""
+        path = os.path.join(log_dir, name)
+        if not self.use_index or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return saved if saved.get('version') == ROLLUP_VERSION else None
+    
+    @staticmethod
+    def _save_json(log_dir, name, saved):
+        path = os.path.join(log_dir, name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(dict(saved, version=ROLLUP_VERSION), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+    
+    def _file_positions(self, log_dir, files):
+        """
+        一天的日志文件和各自上次读到的位置
+        
+        Args:
+            files: 保存的读取位置 {inode: {'offset': 位置, 'head': 文件开头的字节}}
+        
+        Returns:
+            [(路径, inode, 文件开头的字节, 上次读到的位置, 文件大小)]
+        """
+        result = []
+        for path in self.get_day_files(log_dir):
+            with open(path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                head = f.read(HEAD_BYTES)
+            key = str(stat.st_ino)
+            offset = 0
+            position = files.get(key)
+            # 同一 inode 且开头相同才是同一个文件（inode 可能被删除的备份复用）
+            if position and head.startswith(bytes.fromhex(position['head'])) and position['offset'] <= stat.st_size:
+                offset = position['offset']
+            result.append((path, key, head, offset, stat.st_size))
+        return result
+    
+    def _load_current(self, log_dir):
+        """当天汇总已包含全部日志时返回 (HourlyRollup, 每小时请求数)，有新内容时返回 None"""
+        summary = self._load_json(log_dir, SUMMARY_FILE)
+        if summary is None:
+            return None
+        files = self._file_positions(log_dir, summary['files'])
+        if len(files) == len(summary['files']) and all(offset == size for _, _, _, offset, size in files):
+            return HourlyRollup.from_dict(summary['total']), summary['hourly']
+        return None
+    
+    def update_day(self, log_dir):
+        """
+        读取一天的日志中上次之后新写入的内容，更新并保存汇总
+        
+        当天目录下保存两个文件:
+        - access_rollup.json: 各日志文件读到的位置和小时汇总，只在有新内容时读取
+        - access_summary.json: 同样的位置、当天汇总和每小时请求数，没有新内容时报告只读取这个文件
+        
+        Returns:
+            (当天的汇总 HourlyRollup, {小时('00'~'23'): 请求数})
+        """
+        current = self._load_current(log_dir)
+        if current is not None:
+            return current
+        
+        summary = self._load_json(log_dir, SUMMARY_FILE)
+        rollup = self._load_json(log_dir, ROLLUP_FILE) or {'files': {}, 'hours': {}}
+        positions = {}
+        new_hours = {}  # 本次读取的行按小时汇总
+        for path, key, head, offset, size in self._file_positions(log_dir, rollup['files']):
+            if offset < size:
+                with open(path, 'rb') as f:
+                    offset = self._scan(f, offset, new_hours)
+            positions[key] = {'offset': offset, 'head': head.hex()}
+        
+        hours = rollup['hours']
+        if summary is not None and summary['files'] == rollup['files']:
+            total = HourlyRollup.from_dict(summary['total'])
+        else:
+            # 没有当天汇总或上次写入中断（只写入了小时汇总），由小时汇总重新合并
+            total = HourlyRollup()
+            for data in hours.values():
+                total.merge(HourlyRollup.from_dict(data))
+        # 只解析和更新有新内容的小时
+        for hour, new_rollup in new_hours.items():
+            total.merge(new_rollup)
+            hour_rollup = HourlyRollup.from_dict(hours[hour]) if hour in hours else HourlyRollup()
+            hour_rollup.merge(new_rollup)
+            hours[hour] = hour_rollup.to_dict()
+        hourly = {hour: data['requests'] for hour, data in hours.items() if hour}
+        
+        if self.use_index:
+            self._save_json(log_dir, ROLLUP_FILE, {'files': positions, 'hours': hours})
+            self._save_json(log_dir, SUMMARY_FILE, {'files': positions, 'total': total.to_dict(), 'hourly': hourly})
+        return total, hourly
+    
+    def _scan(self, f, offset, hours):
+        """从 offset 开始读取完整的行计入小时汇总，返回读到的位置（不含末尾未写完的行）"""
+        f.seek(offset)
+        pending = b''
+        while True:
+            chunk = f.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            data = pending + chunk
+            end = data.rfind(b'\n')
+            if end < 0:
+                pending = data
+                continue
+            self._add_text(data[:end].decode('utf-8', 'replace'), hours)
+            offset += end + 1
+            pending = data[end + 1:]
+        return offset
+    
+    def _add_text(self, text, hours):
+        """
+        计入若干完整的日志行
+        
+        用 LOG_LINE_PATTERN 一次取出所有行的字段，相同的 (小时, IP, 方法, 路径) 先计数再计入汇总，
+        不是文本格式的行才逐行解析
+        """
+        for (hour, ip, method, path, line), count in Counter(LOG_LINE_PATTERN.findall(text)).items():
+            if hour:
+                data = {'ip': ip, 'method': method, 'path': path}
+            else:
+                data = self.parse_log_line(line)
+                if not data:
+                    continue
+                hour = data['time'][11:13] if 'time' in data else ''
+            rollup = hours.get(hour)
+            if rollup is None:
+                rollup = hours[hour] = HourlyRollup()
+            rollup.add(data, count)
+    
+    # ---- 报告 ----
+    
     def analyze(self, days=1):
         """分析访问日志"""
+        log_dirs = self.get_log_dirs(days)
         log_files = self.get_log_files(days)
         
-        if not log_files:
+        if not log_files and not any(os.path.exists(os.path.join(log_dir, SUMMARY_FILE)) for log_dir in log_dirs):
             return {
                 'error': '没有找到访问日志文件',
                 'log_dir': self.log_base_dir
             }
         
-        # 统计数据
-        total_requests = 0
-        ip_counter = Counter()
-        path_counter = Counter()
-        method_counter = Counter()
+        # 有新内容的日期在进程池中读取并更新汇总，其余直接读取当天汇总
+        day_results = {}
+        stale_dirs = []
+        for log_dir in log_dirs:
+            current = self._load_current(log_dir)
+            if current is None:
+                stale_dirs.append(log_dir)
+            else:
+                day_results[log_dir] = current
+        workers = min(self.workers, len(stale_dirs))
+        if workers > 1:
+            tasks = [(self.log_base_dir, self.use_index, log_dir) for log_dir in stale_dirs]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                day_results.update(zip(stale_dirs, pool.map(_update_day, tasks)))
+        else:
+            for log_dir in stale_dirs:
+                day_results[log_dir] = self.update_day(log_dir)
+        
+        # 合并各天的汇总
+        total = HourlyRollup()
         hourly_stats = defaultdict(int)
-        ip_paths = defaultdict(lambda: Counter())
-        
-        # 解析日志
-        for log_file in log_files:
-            with open(log_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    data = self.parse_log_line(line)
-                    if data:
-                        total_requests += 1
-                        
-                        if 'ip' in data:
-                            ip_counter[data['ip']] += 1
-                            if 'path' in data:
-                                ip_paths[data['ip']][data['path']] += 1
-                        
-                        if 'path' in data:
-                            path_counter[data['path']] += 1
-                        
-                        if 'method' in data:
-                            method_counter[data['method']] += 1
-                        
-                        if 'time' in data:
-                            hour = data['time'].split()[1].split(':')[0]
-                            hourly_stats[hour] += 1
+        for log_dir in log_dirs:
+            day_total, hourly_requests = day_results[log_dir]
+            total.merge(day_total)
+            for hour, requests in hourly_requests.items():
+                hourly_stats[hour] += requests
+        total_requests = total.requests
+        ip_counter = total.ips
+        path_counter = total.paths
+        method_counter = total.methods
+        ip_paths = total.ip_paths
         
         # 生成统计报告
         report = {
@@ -120,6 +398,11 @@ class AccessLogAnalyzer:
             ],
             'methods': dict(method_counter),
             'hourly_distribution': dict(sorted(hourly_stats.items())),
+            # 以下字段只有 JSON 格式的日志行才有
+            'statuses': dict(sorted(total.statuses.items())),
+            'latency_ms': {key: value for key, value in total.latency.snapshot().items() if key != 'buckets'},
+            'strategies': dict(total.strategies.most_common()),
+            'books': dict(sorted(total.books.items(), key=lambda item: int(item[0]))),
             'ip_details': {}
         }
         
@@ -172,6 +455,21 @@ class AccessLogAnalyzer:
             percentage = count / summary['total_requests'] * 100
             print(f"  {method:6s}: {count:5d} 次 ({percentage:.2f}%)")
         
+        # 状态码、耗时和推荐策略（JSON 格式的日志）
+        if report['statuses']:
+            print(f"\n【状态码分布】")
+            for status, count in report['statuses'].items():
+                print(f"  {status:6s}: {count:5d} 次")
+        latency = report['latency_ms']
+        if latency['count']:
+            print(f"\n【响应耗时】")
+            print(f"  平均 {latency['mean']:.1f} ms | P50 {latency['p50']:.1f} ms | "
+                  f"P90 {latency['p90']:.1f} ms | P99 {latency['p99']:.1f} ms | 最大 {latency['max']:.1f} ms")
+        if report['strategies']:
+            print(f"\n【推荐策略分布】")
+            for strategy, count in report['strategies'].items():
+                print(f"  {strategy:10s}: {count:5d} 次")
+        
         # 小时分布
         print(f"\n【小时访问分布】")
         for hour, count in sorted(report['hourly_distribution'].items()):
@@ -198,6 +496,12 @@ class AccessLogAnalyzer:
         return output_file
 
 
+def _update_day(task):
+    """进程池中执行: 读取一天的新日志并更新汇总，返回 (当天的汇总, 每小时请求数)"""
+    log_base_dir, use_index, log_dir = task
+    return AccessLogAnalyzer(log_base_dir, use_index=use_index, workers=1).update_day(log_dir)
+
+
 def main():
     """主函数"""
     import argparse
@@ -206,10 +510,12 @@ def main():
     parser.add_argument('-d', '--days', type=int, default=1, help='分析最近N天的日志 (默认: 1)')
     parser.add_argument('-o', '--output', type=str, help='导出JSON文件路径')
     parser.add_argument('--log-dir', type=str, default='logs', help='日志目录 (默认: logs)')
+    parser.add_argument('--no-index', action='store_true', help='不使用每天的小时汇总，重新读取全部日志')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='同时读取日志的进程数 (默认: CPU核数)')
     
     args = parser.parse_args()
     
-    analyzer = AccessLogAnalyzer(log_base_dir=args.log_dir)
+    analyzer = AccessLogAnalyzer(log_base_dir=args.log_dir, use_index=not args.no_index, workers=args.workers)
     
     # 打印报告
     analyzer.print_report(days=args.days)
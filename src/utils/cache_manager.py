@@ -4,6 +4,7 @@
 """
 import os
 import sys
+import shutil
 from pathlib import Path
 
 # 添加项目根目录到路径
@@ -12,13 +13,26 @@ sys.path.insert(0, str(project_root))
 
 from config import config
 
+def _dir_size(path):
+    """目录下所有文件的总大小（字节）"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
 def clear_keyword_cache():
-    """清除关键词缓存"""
-    cache_file = os.path.join(config.KG_DIR, 'comment_keywords.pkl')
-    if os.path.exists(cache_file):
-        os.remove(cache_file)
-        print(f"✓ 已删除关键词缓存: {cache_file}")
-    else:
+    """清除关键词缓存（数组存储目录和旧版 pickle 文件）"""
+    found = False
+    if os.path.isdir(config.KG_KEYWORDS_DIR):
+        shutil.rmtree(config.KG_KEYWORDS_DIR)
+        print(f"✓ 已删除关键词缓存: {config.KG_KEYWORDS_DIR}")
+        found = True
+    if os.path.exists(config.KG_COMMENT_KEYWORDS_FILE):
+        os.remove(config.KG_COMMENT_KEYWORDS_FILE)
+        print(f"✓ 已删除旧版关键词缓存: {config.KG_COMMENT_KEYWORDS_FILE}")
+        found = True
+    if not found:
         print("✗ 关键词缓存不存在")
 
 def clear_embeddings_cache():
@@ -29,11 +43,52 @@ def clear_embeddings_cache():
     else:
         print("✗ 嵌入缓存不存在")
 
+def clear_result_cache():
+    """清除共享推荐结果缓存（SQLite 文件）"""
+    found = False
+    for suffix in ('', '-wal', '-shm'):
+        path = config.RESULT_CACHE_SQLITE_FILE + suffix
+        if os.path.exists(path):
+            os.remove(path)
+            found = True
+    if found:
+        print(f"✓ 已删除推荐结果缓存: {config.RESULT_CACHE_SQLITE_FILE}")
+    else:
+        print("✗ 推荐结果缓存不存在")
+
+def clear_neighbor_table():
+    """清除预计算近邻表"""
+    if os.path.isdir(config.KG_NEIGHBORS_DIR):
+        shutil.rmtree(config.KG_NEIGHBORS_DIR)
+        print(f"✓ 已删除近邻表: {config.KG_NEIGHBORS_DIR}")
+    else:
+        print("✗ 近邻表不存在")
+
+def clear_keyword_ann():
+    """清除评论关键词向量索引"""
+    if os.path.isdir(config.KG_KEYWORD_ANN_DIR):
+        shutil.rmtree(config.KG_KEYWORD_ANN_DIR)
+        print(f"✓ 已删除关键词向量索引: {config.KG_KEYWORD_ANN_DIR}")
+    else:
+        print("✗ 关键词向量索引不存在")
+
+def clear_comment_store():
+    """清除评论列存储（下次分析评论时从评论文件重新转换）"""
+    if os.path.isdir(config.COMMENT_STORE_DIR):
+        shutil.rmtree(config.COMMENT_STORE_DIR)
+        print(f"✓ 已删除评论列存储: {config.COMMENT_STORE_DIR}")
+    else:
+        print("✗ 评论列存储不存在")
+
 def clear_all_cache():
     """清除所有缓存"""
     print("清除所有缓存...")
     clear_keyword_cache()
     clear_embeddings_cache()
+    clear_result_cache()
+    clear_neighbor_table()
+    clear_keyword_ann()
+    # 评论文件转换后可能已删除，评论列存储不在此清除（见 clear-comments）
     print("\n所有缓存已清除！")
 
 def show_cache_info():
@@ -43,10 +98,13 @@ def show_cache_info():
     print("="*60)
     
     # 关键词缓存
-    cache_file = os.path.join(config.KG_DIR, 'comment_keywords.pkl')
-    if os.path.exists(cache_file):
-        size = os.path.getsize(cache_file) / (1024 * 1024)  # MB
-        print(f"✓ 关键词缓存: {cache_file}")
+    if os.path.isdir(config.KG_KEYWORDS_DIR):
+        size = _dir_size(config.KG_KEYWORDS_DIR) / (1024 * 1024)  # MB
+        print(f"✓ 关键词缓存: {config.KG_KEYWORDS_DIR}")
+        print(f"  大小: {size:.2f} MB")
+    elif os.path.exists(config.KG_COMMENT_KEYWORDS_FILE):
+        size = os.path.getsize(config.KG_COMMENT_KEYWORDS_FILE) / (1024 * 1024)  # MB
+        print(f"✓ 关键词缓存（旧版）: {config.KG_COMMENT_KEYWORDS_FILE}")
         print(f"  大小: {size:.2f} MB")
     else:
         print("✗ 关键词缓存: 不存在")
@@ -59,6 +117,30 @@ def show_cache_info():
     else:
         print("\n✗ 嵌入缓存: 不存在")
     
+    # 近邻表
+    if os.path.isdir(config.KG_NEIGHBORS_DIR):
+        size = _dir_size(config.KG_NEIGHBORS_DIR) / (1024 * 1024)
+        print(f"\n✓ 近邻表: {config.KG_NEIGHBORS_DIR}")
+        print(f"  大小: {size:.2f} MB")
+    else:
+        print("\n✗ 近邻表: 不存在")
+    
+    # 关键词向量索引
+    if os.path.isdir(config.KG_KEYWORD_ANN_DIR):
+        size = _dir_size(config.KG_KEYWORD_ANN_DIR) / (1024 * 1024)
+        print(f"\n✓ 关键词向量索引: {config.KG_KEYWORD_ANN_DIR}")
+        print(f"  大小: {size:.2f} MB")
+    else:
+        print("\n✗ 关键词向量索引: 不存在")
+    
+    # 评论列存储
+    if os.path.isdir(config.COMMENT_STORE_DIR):
+        size = _dir_size(config.COMMENT_STORE_DIR) / (1024 * 1024)
+        print(f"\n✓ 评论列存储: {config.COMMENT_STORE_DIR}")
+        print(f"  大小: {size:.2f} MB")
+    else:
+        print("\n✗ 评论列存储: 不存在")
+    
     print("="*60)
 
 if __name__ == '__main__':
@@ -72,6 +154,14 @@ if __name__ == '__main__':
             clear_keyword_cache()
         elif command == 'clear-embeddings':
             clear_embeddings_cache()
+        elif command == 'clear-results':
+            clear_result_cache()
+        elif command == 'clear-neighbors':
+            clear_neighbor_table()
+        elif command == 'clear-ann':
+            clear_keyword_ann()
+        elif command == 'clear-comments':
+            clear_comment_store()
         elif command == 'info':
             show_cache_info()
         else:
@@ -81,6 +171,10 @@ if __name__ == '__main__':
             print("  python cache_manager.py clear             # 清除所有缓存")
             print("  python cache_manager.py clear-keywords    # 清除关键词缓存")
             print("  python cache_manager.py clear-embeddings  # 清除嵌入缓存")
+            print("  python cache_manager.py clear-results     # 清除共享推荐结果缓存")
+            print("  python cache_manager.py clear-neighbors   # 清除预计算近邻表")
+            print("  python cache_manager.py clear-ann         # 清除评论关键词向量索引")
+            print("  python cache_manager.py clear-comments    # 清除评论列存储")
     else:
         show_cache_info()
 
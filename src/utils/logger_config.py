@@ -2,11 +2,178 @@
 """
 日志配置模块
 按日期组织日志文件，每天创建独立的文件夹
+
+get_async_logger() 创建的日志记录器只把记录放入有界队列，
+由后台线程批量写入文件和控制台，磁盘和终端 I/O 不占用请求线程
 """
 import logging
 import os
+import queue
+import threading
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+def _write_batch(handler, records):
+    """
+    把一批记录写入 StreamHandler（含 RotatingFileHandler），最后只 flush 一次
+    
+    RotatingFileHandler 按写入的字节数累计判断是否轮转，不逐条 seek 文件；
+    批次的第一条和轮转后的第一条交给 emit（打开文件，用 shouldRollover 按实际文件大小检查）
+    """
+    rotating = isinstance(handler, RotatingFileHandler) and handler.maxBytes > 0
+    size = None
+    with handler.lock:
+        for record in records:
+            if not handler.filter(record):
+                continue
+            try:
+                msg = handler.format(record) + handler.terminator
+                if rotating:
+                    length = len(msg.encode(handler.encoding or 'utf-8', 'replace'))
+                    if size is not None and size + length >= handler.maxBytes:
+                        handler.doRollover()
+                        size = None
+                if handler.stream is None or (rotating and size is None):
+                    handler.emit(record)
+                    if rotating:
+                        size = handler.stream.tell()
+                    continue
+                handler.stream.write(msg)
+                if rotating:
+                    size += length
+            except Exception:
+                handler.handleError(record)
+        try:
+            handler.flush()
+        except Exception:
+            pass
+
+
+class BatchQueueListener(QueueListener):
+    """
+    批量写入的队列监听器
+    
+    后台线程每次取出队列中已有的记录（最多 batch_size 条），
+    每个 handler 逐条写入后只 flush 一次
+    """
+    
+    def __init__(self, queue, *handlers, batch_size=256):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+    
+    def enqueue_sentinel(self):
+        # 队列满时等待空位，停止前写完已排队的记录
+        self.queue.put(self._sentinel)
+    
+    def _monitor(self):
+        q = self.queue
+        while True:
+            batch = [q.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not self._sentinel]
+            if records:
+                self.handle_batch(records)
+            for _ in batch:
+                q.task_done()
+            if len(records) < len(batch):
+                break
+    
+    def handle_batch(self, records):
+        for handler in self.handlers:
+            selected = [record for record in records if record.levelno >= handler.level]
+            if not selected:
+                continue
+            if isinstance(handler, logging.StreamHandler):
+                _write_batch(handler, selected)
+            else:
+                for record in selected:
+                    handler.handle(record)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    有界队列日志 handler（请求线程只格式化消息并放入队列）
+    
+    队列满时按 overflow 处理:
+    - 'drop': 直接丢弃
+    - 'block': 最多等待 block_timeout 秒（None 表示一直等待），超时后丢弃
+    丢弃的记录数见 dropped。
+    
+    后台写入线程在本进程第一次记录日志时启动；预派生模式下 fork 出的子进程
+    没有父进程的线程，按进程号判断，在子进程中使用新的队列和写入线程。
+    """
+    
+    def __init__(self, handlers, queue_size=10000, batch_size=256, overflow='drop', block_timeout=1.0):
+        if overflow not in ('drop', 'block'):
+            raise ValueError(f"未知的队列溢出策略: {overflow}")
+        super().__init__(queue.Queue(queue_size))
+        self.target_handlers = handlers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+    
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            if self._listener_pid is not None:
+                # fork 之后父进程的队列可能还有未写入的记录，锁的状态也不可靠
+                self.queue = queue.Queue(self.queue_size)
+            self._listener = BatchQueueListener(self.queue, *self.target_handlers, batch_size=self.batch_size)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+    
+    def handle(self, record):
+        """
+        过滤后放入队列，不获取 handler 的 I/O 锁
+        
+        Handler.handle 在 self.lock 内调用 emit；'block' 模式下等待队列空位时，
+        其他线程的日志会在这个锁上排队，超时也不再按 block_timeout 计算。
+        """
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return rv
+    
+    def prepare(self, record):
+        # 只合并消息参数，时间、级别等格式化由后台线程完成
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+    
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            if self.overflow == 'block':
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+    
+    def close(self):
+        """停止写入线程（写完已排队的记录）"""
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._listener_pid = None
+        super().close()
 
 
 class DateBasedLogger:
@@ -37,13 +204,14 @@ class DateBasedLogger:
         
         return log_dir
     
-    def get_logger(self, name='app', level=logging.INFO):
+    def get_logger(self, name='app', level=logging.INFO, fmt=None):
         """
         获取日志记录器
         
         Args:
             name: 日志记录器名称（会作为日志文件名）
             level: 日志级别
+            fmt: 日志格式，None表示使用默认格式（时间 - 名称 - 级别 - 消息）
             
         Returns:
             logging.Logger: 配置好的日志记录器
@@ -59,6 +227,16 @@ class DateBasedLogger:
         # 清除已有的handlers（避免重复）
         logger.handlers.clear()
         
+        for handler in self._create_handlers(name, level, fmt):
+            logger.addHandler(handler)
+        
+        # 缓存logger
+        self.loggers[name] = logger
+        
+        return logger
+    
+    def _create_handlers(self, name, level, fmt=None):
+        """创建日志文件（按大小轮转）和控制台 handler"""
         # 获取日志目录
         log_dir = self._get_log_dir()
         log_file = os.path.join(log_dir, f'{name}.log')
@@ -78,38 +256,89 @@ class DateBasedLogger:
         
         # 设置日志格式
         formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            fmt or '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         file_handler.setFormatter(formatter)
         console_handler.setFormatter(formatter)
         
-        # 添加handlers
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        return [file_handler, console_handler]
+    
+    def get_async_logger(self, name, level=logging.INFO, queue_size=10000, batch_size=256,
+                         overflow='drop', block_timeout=1.0, fmt=None):
+        """
+        获取异步日志记录器（记录放入有界队列，后台线程批量写入）
         
-        # 缓存logger
-        self.loggers[name] = logger
+        Args:
+            name: 日志记录器名称（会作为日志文件名）
+            level: 日志级别
+            queue_size: 队列容量
+            batch_size: 每批最多写入的记录数
+            overflow: 队列满时的处理方式，'drop'（丢弃）或 'block'（等待）
+            block_timeout: 'block' 时最多等待的秒数，超时后丢弃
+            fmt: 日志格式，None表示使用默认格式
+        
+        Returns:
+            logging.Logger: 配置好的日志记录器
+        """
+        if name in self.loggers:
+            return self.loggers[name]
+        
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        logger.handlers.clear()
+        logger.addHandler(BoundedQueueHandler(
+            self._create_handlers(name, level, fmt), queue_size, batch_size, overflow, block_timeout
+        ))
         
+        self.loggers[name] = logger
         return logger
+    
+    def dropped_records(self, name):
+        """异步日志记录器因队列满丢弃的记录数"""
+        logger = self.loggers.get(name)
+        if logger is None:
+            return 0
+        return sum(handler.dropped for handler in logger.handlers if isinstance(handler, BoundedQueueHandler))
 
 
 # 创建全局日志管理器实例
 _logger_manager = DateBasedLogger()
 
 
-def get_logger(name='app', level=logging.INFO):
+def get_logger(name='app', level=logging.INFO, fmt=None):
     """
     获取日志记录器的便捷函数
     
     Args:
         name: 日志记录器名称
         level: 日志级别
+        fmt: 日志格式，None表示使用默认格式
         
     Returns:
         logging.Logger: 配置好的日志记录器
     """
-    return _logger_manager.get_logger(name, level)
+    return _logger_manager.get_logger(name, level, fmt)
+
+
+def get_async_logger(name, level=logging.INFO, **kwargs):
+    """
+    获取异步日志记录器的便捷函数
+    
+    Args:
+        name: 日志记录器名称
+        level: 日志级别
+        kwargs: queue_size / batch_size / overflow / block_timeout / fmt
+    
+    Returns:
+        logging.Logger: 配置好的日志记录器
+    """
+    return _logger_manager.get_async_logger(name, level, **kwargs)
+
+
+def dropped_records(name):
+    """异步日志记录器丢弃的记录数"""
+    return _logger_manager.dropped_records(name)
 
 
 # 使用示例
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+服务指标（Prometheus 文本格式）
+请求计数、按路由和推荐策略的延迟直方图、处理中的请求数，
+以及推荐器的数据规模、结果缓存大小和进程内存，由 /metrics 输出
+
+单进程时直接输出本进程的数值。预派生多进程模式下（enable_multiprocess）
+每个工作进程定期把自己的数值写入共享目录下的 <pid>.json，/metrics 合并所有进程的文件:
+计数器和直方图求和（已退出进程的文件保留，计数不会回退），仪表只统计仍在运行的进程。
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from src.utils.timing import Histogram
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class MetricsRegistry:
+    """
+    进程内指标注册表（线程安全）
+    
+    指标先用 describe() 声明类型:
+    - counter: 单调递增的计数
+    - histogram: 延迟直方图（LATENCY_BUCKETS_S）
+    - gauge: 当前值，多进程合并方式 merge 为 'sum'（求和）、'max'（取最大）或 'pid'（按进程输出，加 pid 标签）
+    
+    标签为 {名称: 值} 字典，同一指标的每组标签值各自计数。
+    collector 为抓取和写入文件前调用的函数，返回 [(指标名, 标签, 值), ...]，
+    用于从推荐器等对象读取当前值（计数器类型时应返回本进程的累计值）。
+    """
+    
+    def __init__(self, prefix='book_rec_', flush_interval=2.0):
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._meta = {}  # 指标名 -> (类型, 说明, 仪表合并方式)
+        self._counters = {}  # (指标名, 标签) -> 值
+        self._histograms = {}  # (指标名, 标签) -> Histogram
+        self._gauges = {}  # (指标名, 标签) -> 值
+        self._collectors = []
+        self._dir = None  # 多进程模式的共享目录
+        self._flusher_pid = None  # 已启动写入线程的进程
+    
+    def describe(self, name, kind, help_text, merge='sum'):
+        self._meta[name] = (kind, help_text, merge)
+    
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+    
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items())) if labels else ()
+    
+    def inc(self, name, labels=None, value=1):
+        """计数器增加 value"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._ensure_flusher()
+    
+    def observe(self, name, value, labels=None):
+        """直方图记录一次观测值"""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(LATENCY_BUCKETS_S)
+            histogram.observe(value)
+        self._ensure_flusher()
+    
+    def add_gauge(self, name, delta, labels=None):
+        """仪表增加 delta（可为负）"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+        self._ensure_flusher()
+    
+    # ---- 多进程 ----
+    
+    def enable_multiprocess(self, path):
+        """
+        启用多进程模式（在主进程 fork 工作进程之前调用），清空共享目录中上次运行留下的文件
+        
+        每个进程第一次记录指标时启动后台线程，每 flush_interval 秒写入一次本进程的数值。
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith('.json') or name.endswith('.tmp'):
+                os.remove(os.path.join(path, name))
+        self._dir = path
+    
+    def _ensure_flusher(self):
+        if self._dir is None or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            # fork 之后子进程中没有父进程的线程，按进程号判断是否需要启动
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+    
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+    
+    def flush(self, snapshot=None):
+        """把本进程的数值写入共享目录（先写临时文件再替换）"""
+        if self._dir is None:
+            return
+        snapshot = snapshot or self._snapshot()
+        filename = os.path.join(self._dir, f'{snapshot["pid"]}.json')
+        with open(filename + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(filename + '.tmp', filename)
+    
+    def _snapshot(self):
+        """本进程的所有数值（标签转为列表，可以写成 JSON）"""
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [
+                [name, list(labels), histogram.counts, histogram.sum]
+                for (name, labels), histogram in self._histograms.items()
+            ]
+            gauges = [[name, list(labels), value] for (name, labels), value in self._gauges.items()]
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                sample = [name, sorted(labels.items()), value]
+                if self._meta.get(name, ('gauge',))[0] == 'counter':
+                    counters.append(sample)
+                else:
+                    gauges.append(sample)
+        return {'pid': os.getpid(), 'counters': counters, 'histograms': histograms, 'gauges': gauges}
+    
+    def _load_snapshots(self):
+        """本进程（同时写入共享目录）和共享目录中其他进程的数值"""
+        own = self._snapshot()
+        if self._dir is None:
+            return [own]
+        self.flush(own)
+        snapshots = [own]
+        for name in os.listdir(self._dir):
+            if not name.endswith('.json') or name == f'{own["pid"]}.json':
+                continue
+            try:
+                with open(os.path.join(self._dir, name), encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+    
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+    
+    # ---- 输出 ----
+    
+    def collect(self):
+        """
+        合并所有进程的数值
+        
+        Returns:
+            {指标名: {标签元组: 值}}，直方图的值为 (各桶计数, 总和)
+        """
+        merged = {}
+        own_pid = os.getpid()
+        for snapshot in self._load_snapshots():
+            alive = snapshot['pid'] == own_pid or self._alive(snapshot['pid'])
+            for name, labels, value in snapshot['counters']:
+                samples = merged.setdefault(name, {})
+                key = tuple(map(tuple, labels))
+                samples[key] = samples.get(key, 0) + value
+            for name, labels, counts, total in snapshot['histograms']:
+                samples = merged.setdefault(name, {})
+                key = tuple(map(tuple, labels))
+                if key in samples:
+                    old_counts, old_total = samples[key]
+                    counts = [a + b for a, b in zip(old_counts, counts)]
+                    total += old_total
+                samples[key] = (counts, total)
+            if not alive:
+                continue
+            for name, labels, value in snapshot['gauges']:
+                merge = self._meta.get(name, ('gauge', '', 'sum'))[2]
+                samples = merged.setdefault(name, {})
+                key = tuple(map(tuple, labels))
+                if merge == 'pid':
+                    samples[key + (('pid', str(snapshot['pid'])),)] = value
+                elif merge == 'max':
+                    samples[key] = max(samples.get(key, value), value)
+                else:
+                    samples[key] = samples.get(key, 0) + value
+        return merged
+    
+    def render(self):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        merged = self.collect()
+        lines = []
+        for name in sorted(merged):
+            kind, help_text, _ = self._meta.get(name, ('gauge', '', 'sum'))
+            full_name = self.prefix + name
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            for labels, value in sorted(merged[name].items()):
+                if kind == 'histogram':
+                    counts, total = value
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS_S, counts):
+                        cumulative += count
+                        lines.append(f'{full_name}_bucket{_labels(labels + (("le", repr(float(bound))),))} {cumulative}')
+                    cumulative += counts[-1]
+                    lines.append(f'{full_name}_bucket{_labels(labels + (("le", "+Inf"),))} {cumulative}')
+                    lines.append(f'{full_name}_sum{_labels(labels)} {repr(float(total))}')
+                    lines.append(f'{full_name}_count{_labels(labels)} {cumulative}')
+                else:
+                    lines.append(f'{full_name}{_labels(labels)} {repr(float(value))}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    """标签元组 -> {name="value",...}（转义反斜杠、引号和换行）"""
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+# 全局注册表（每个进程一份，多进程模式下通过共享目录合并）
+registry = MetricsRegistry()
+registry.describe('http_requests_total', 'counter', '请求数（按路由、方法、状态码）')
+registry.describe('http_request_duration_seconds', 'histogram', '请求处理耗时（按路由、方法）')
+registry.describe('http_requests_in_flight', 'gauge', '正在处理的请求数（按路由）', merge='sum')
+registry.describe('recommend_duration_seconds', 'histogram', '推荐计算耗时（按策略）')
+
+
+def request_started(route):
+    """请求开始: 处理中计数加一，返回开始时间"""
+    registry.add_gauge('http_requests_in_flight', 1, {'route': route})
+    return time.perf_counter()
+
+
+def request_finished(route, method, status, start):
+    """请求结束: 处理中计数减一，记录请求数和耗时"""
+    registry.add_gauge('http_requests_in_flight', -1, {'route': route})
+    registry.inc('http_requests_total', {'route': route, 'method': method, 'status': str(status)})
+    registry.observe('http_request_duration_seconds', time.perf_counter() - start, {'route': route, 'method': method})
+
+
+@contextmanager
+def track_request(route, method):
+    """
+    统计一个请求（ASGI 入口直接处理的接口使用，Flask 视图由请求钩子统计）
+    
+    with track_request('/api/recommend', 'POST') as request_info:
+        ...
+        request_info['status'] = 200
+    
+    退出时 status 未设置（处理中抛出异常）按 500 计。
+    """
+    request_info = {'status': 500}
+    start = request_started(route)
+    try:
+        yield request_info
+    finally:
+        request_finished(route, method, request_info['status'], start)
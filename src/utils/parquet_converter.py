@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+原始数据转换工具
+将图书信息和评论数据的 pandas pickle 文件转换为 Parquet 列式存储（需要安装 pyarrow）
+
+- 图书信息保持原始行顺序（实体ID按行顺序分配）
+- 评论按 readBookUrl 稳定排序后写入，每个行组覆盖一段连续的图书链接，
+  读取部分图书的评论时可以按行组统计信息跳过不相关的行组
+- 每列单独压缩，重复值多的列使用字典编码
+
+转换后 KnowledgeGraphBuilder.load_data() 和 load_and_analyze_comments() 优先读取 Parquet 文件。
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+
+DICTIONARY_COLUMNS = ('readBookUrl', 'rating', 'userID', 'author', 'publisher', 'translator', 'seriesOfBook')  # 使用字典编码的列
+
+
+def _write_parquet(data, target_file, compression=None, row_group_size=None):
+    """写入 Parquet 文件（先写临时文件再替换）"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    os.makedirs(os.path.dirname(target_file), exist_ok=True)
+    tmp_file = target_file + '.tmp'
+    pq.write_table(
+        table, tmp_file,
+        compression=compression or config.PARQUET_COMPRESSION,
+        row_group_size=row_group_size or config.PARQUET_ROW_GROUP_SIZE,
+        use_dictionary=[name for name in DICTIONARY_COLUMNS if name in table.column_names],
+        write_statistics=True
+    )
+    os.replace(tmp_file, target_file)
+    return pq.ParquetFile(target_file).metadata
+
+
+def convert_book_info(source_file=None, target_file=None, **kwargs):
+    """
+    图书信息 pickle -> Parquet（保持行顺序）
+    
+    Args:
+        source_file: 源文件，None表示使用 config.BOOK_INFO_FILE
+        target_file: 目标文件，None表示使用 config.BOOK_INFO_PARQUET_FILE
+        kwargs: compression / row_group_size
+    """
+    source_file = source_file or config.BOOK_INFO_FILE
+    target_file = target_file or config.BOOK_INFO_PARQUET_FILE
+    start_time = time.time()
+    book_data = pd.read_pickle(source_file)
+    metadata = _write_parquet(book_data, target_file, **kwargs)
+    print(f"✓ 图书信息已转换: {target_file}（{metadata.num_rows} 行, {metadata.num_row_groups} 个行组, "
+          f"{os.path.getsize(target_file) / 1024 / 1024:.1f} MB），耗时 {time.time() - start_time:.1f} 秒")
+
+
+def convert_comments(source_file=None, target_file=None, **kwargs):
+    """
+    评论 pickle -> Parquet（按 readBookUrl 稳定排序，同一链接内保持原始顺序）
+    
+    Args:
+        source_file: 源文件，None表示使用 config.COMMENT_FILE
+        target_file: 目标文件，None表示使用 config.COMMENT_PARQUET_FILE
+        kwargs: compression / row_group_size
+    """
+    source_file = source_file or config.COMMENT_FILE
+    target_file = target_file or config.COMMENT_PARQUET_FILE
+    start_time = time.time()
+    comment_data = pd.read_pickle(source_file)
+    # 链接统一转为字符串（与评论列存储一致），保证排序和范围过滤的结果相同
+    comment_data['readBookUrl'] = comment_data['readBookUrl'].map(str)
+    comment_data = comment_data.sort_values('readBookUrl', kind='stable', ignore_index=True)
+    metadata = _write_parquet(comment_data, target_file, **kwargs)
+    print(f"✓ 评论数据已转换: {target_file}（{metadata.num_rows} 行, {metadata.num_row_groups} 个行组, "
+          f"{os.path.getsize(target_file) / 1024 / 1024:.1f} MB），耗时 {time.time() - start_time:.1f} 秒")
+
+
+def main():
+    """命令行入口"""
+    targets = sys.argv[1:] or ['books', 'comments']
+    for target in targets:
+        if target == 'books':
+            convert_book_info()
+        elif target == 'comments':
+            convert_comments()
+        else:
+            print(f"未知数据: {target}")
+            print("用法: python src/utils/parquet_converter.py [books] [comments]")
+            return
+
+
+if __name__ == '__main__':
+    main()
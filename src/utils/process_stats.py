@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+进程资源统计
+用于多进程模式下报告每个进程的内存占用
+"""
+import os
+import sys
+
+
+def memory_usage(pid='self'):
+    """
+    进程内存占用（MB）
+    
+    Linux 下读取 /proc/<pid>/smaps_rollup，区分共享页和私有页:
+    预派生的工作进程与主进程共享的写时复制页计入 shared，只有 private 是该进程独占的内存。
+    其他系统只返回 rss（峰值）。
+    
+    Returns:
+        {'rss': ..., 'pss': ..., 'shared': ..., 'private': ...}
+    """
+    smaps_file = f'/proc/{pid}/smaps_rollup'
+    if os.path.exists(smaps_file):
+        fields = {}
+        with open(smaps_file) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+        return {
+            'rss': fields.get('Rss', 0) / 1024,
+            'pss': fields.get('Pss', 0) / 1024,
+            'shared': (fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)) / 1024,
+            'private': (fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) / 1024
+        }
+    
+    try:
+        import resource
+    except ImportError:
+        return {'rss': 0}
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return {'rss': max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024}
+
+
+def format_memory(usage):
+    """内存占用的简短描述"""
+    text = f"RSS {usage['rss']:.1f} MB"
+    if 'private' in usage:
+        text += f"（私有 {usage['private']:.1f} MB，共享 {usage['shared']:.1f} MB，PSS {usage['pss']:.1f} MB）"
+    return text
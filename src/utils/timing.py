@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+分阶段计时
+推荐等热路径中用 span() 记录每个阶段的耗时和处理的候选数，
+按阶段聚合为固定桶边界的直方图，由 /api/metrics 输出（每个进程单独统计）
+"""
+import bisect
+import threading
+import time
+
+# 耗时直方图的桶上界（毫秒）
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# 候选数直方图的桶上界
+COUNT_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+class Histogram:
+    """
+    固定桶边界的直方图
+    
+    counts[i] 为落在 (buckets[i - 1], buckets[i]] 的观测数，最后一个桶为超过所有边界的观测。
+    分位数按所在桶内线性插值估计。
+    """
+    
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+    
+    def quantile(self, q):
+        """估计分位数（q 取 0~1），没有观测时返回 0"""
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+    
+    def snapshot(self):
+        """直方图摘要（桶为累计计数，键为桶上界）"""
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets['+Inf'] = self.total
+        return {
+            'count': self.total,
+            'sum': self.sum,
+            'mean': self.sum / self.total if self.total else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': buckets
+        }
+
+
+class Span:
+    """
+    一个阶段的计时（上下文管理器），退出时把耗时记入 SpanRecorder
+    
+    with recorder.span('kg_scoring') as span:
+        ...
+        span.count(len(candidates))
+    """
+    
+    __slots__ = ('recorder', 'name', 'items', 'start')
+    
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.items = None
+        self.start = 0.0
+    
+    def count(self, items):
+        """记录本阶段处理的候选数"""
+        self.items = items
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.recorder.record(self.name, (time.perf_counter() - self.start) * 1000, self.items)
+        return False
+
+
+class SpanRecorder:
+    """按阶段聚合耗时（毫秒）和候选数的直方图（线程安全）"""
+    
+    def __init__(self, latency_buckets=LATENCY_BUCKETS_MS, count_buckets=COUNT_BUCKETS):
+        self.latency_buckets = latency_buckets
+        self.count_buckets = count_buckets
+        self._lock = threading.Lock()
+        self._durations = {}  # 阶段 -> 耗时直方图
+        self._counts = {}  # 阶段 -> 候选数直方图
+        self._started = time.time()
+    
+    def span(self, name):
+        return Span(self, name)
+    
+    def record(self, name, duration_ms, items=None):
+        """记录一次阶段耗时，items 不为 None 时同时记录候选数"""
+        with self._lock:
+            histogram = self._durations.get(name)
+            if histogram is None:
+                histogram = self._durations[name] = Histogram(self.latency_buckets)
+            histogram.observe(duration_ms)
+            if items is not None:
+                histogram = self._counts.get(name)
+                if histogram is None:
+                    histogram = self._counts[name] = Histogram(self.count_buckets)
+                histogram.observe(items)
+    
+    def snapshot(self):
+        """
+        所有阶段的统计
+        
+        Returns:
+            {'since': 开始统计的时间戳, 'spans': {阶段: {'duration_ms': 直方图摘要, 'items': 直方图摘要}}}
+        """
+        with self._lock:
+            spans = {}
+            for name, histogram in self._durations.items():
+                spans[name] = {'duration_ms': histogram.snapshot()}
+                if name in self._counts:
+                    spans[name]['items'] = self._counts[name].snapshot()
+            return {'since': self._started, 'spans': spans}
+    
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._started = time.time()
+
+
+# 全局记录器（每个进程一份）
+recorder = SpanRecorder()
+
+
+def span(name):
+    """在全局记录器上为一个阶段计时"""
+    return recorder.span(name)
+
+
+def record_since(name, start, items=None):
+    """记录从 start（time.perf_counter() 的值）到现在的阶段耗时，用于不便改写为 with 语句的代码段"""
+    recorder.record(name, (time.perf_counter() - start) * 1000, items)
@@ -5,6 +5,9 @@
 """
 import os
 import sys
+import gc
+import time
+import argparse
 import subprocess
 from pathlib import Path
 
@@ -12,7 +15,9 @@ from pathlib import Path
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
+from config import config
 from src.utils.logger_config import get_logger
+from src.utils.process_stats import memory_usage, format_memory
 
 # 初始化日志
 logger = get_logger('start')
@@ -89,31 +94,31 @@ def build_knowledge_graph():
         return False
 
 
-def compute_embeddings():
-    """计算实体嵌入"""
+def compute_embeddings(train=False):
+    """计算实体嵌入（TransE），train 为 False 时只检查是否已训练"""
     logger.info("\n" + "=" * 60)
     logger.info("计算实体嵌入...")
     logger.info("=" * 60)
     
-    kg_dir = 'data/processed/knowledge_graph'
-    embeddings_file = os.path.join(kg_dir, 'embeddings.pkl')
-    
-    if os.path.exists(embeddings_file):
+    if os.path.exists(config.KG_EMBEDDINGS_FILE):
         logger.info("✓ 实体嵌入已存在，跳过计算")
         return True
     
+    if not train:
+        logger.info("未找到实体嵌入，embedding 推荐策略不可用")
+        logger.info("训练嵌入: python -m src.core.kg_embedding（或 python start.py --train-embeddings）")
+        return False
+    
     logger.info("开始计算实体嵌入（这可能需要几分钟）...")
     
     try:
-        from recommender import KGRecommender
-        recommender = KGRecommender()
-        recommender.load_kg()
-        recommender.compute_embeddings()
+        from src.core.kg_embedding import train_embeddings
+        train_embeddings()
         logger.info("✓ 实体嵌入计算完成")
         return True
     except Exception as e:
         logger.error(f"✗ 实体嵌入计算失败: {e}", exc_info=True)
-        logger.warning("系统将在没有嵌入的情况下运行（仅使用路径推理）")
+        logger.warning("系统将在没有嵌入的情况下运行（embedding 推荐策略不可用）")
         return False
 
 
@@ -137,8 +142,96 @@ def start_server():
         logger.error(f"\n✗ 服务启动失败: {e}", exc_info=True)
 
 
+def start_prefork_server(workers=None, asgi=False):
+    """
+    预派生多进程模式启动Web服务
+    
+    主进程加载一次知识图谱和关键词缓存，调用 gc.freeze() 后再 fork 工作进程，
+    工作进程以写时复制方式共享已加载的数据，内存不随进程数成倍增长。
+    
+    Args:
+        workers: 工作进程数，None 表示使用 config.PREFORK_WORKERS
+        asgi: 是否使用 ASGI 入口（uvicorn 工作进程）
+    """
+    from gunicorn.app.base import BaseApplication
+    
+    logger.info("\n" + "=" * 60)
+    logger.info("启动Web服务（预派生多进程模式）...")
+    logger.info("=" * 60)
+    
+    workers = workers or config.PREFORK_WORKERS
+    start_time = time.time()
+    
+    # 主进程加载推荐器
+    import app
+    app.init_recommender()
+    if asgi:
+        import asgi as asgi_module
+        application = asgi_module.application
+    else:
+        application = app.app
+    
+    # 各工作进程定期把指标写入共享目录，/metrics 合并所有进程的数值
+    from src.utils import metrics
+    metrics.registry.flush_interval = config.METRICS_FLUSH_INTERVAL
+    metrics.registry.enable_multiprocess(config.PREFORK_METRICS_DIR)
+    
+    # 已加载的对象移入永久代，工作进程中的垃圾回收不再扫描（写入）这些对象，避免触发页复制
+    gc.collect()
+    gc.freeze()
+    
+    load_seconds = time.time() - start_time
+    logger.info(f"主进程加载完成: 用时 {load_seconds:.1f} 秒，{format_memory(memory_usage())}")
+    
+    def post_worker_init(worker):
+        logger.info(
+            f"工作进程 {worker.pid} 就绪: 启动后 {time.time() - start_time:.1f} 秒，"
+            f"{format_memory(memory_usage())}"
+        )
+    
+    options = {
+        'bind': f'{config.HOST}:{config.PORT}',
+        'workers': workers,
+        'preload_app': True,
+        'timeout': config.PREFORK_TIMEOUT,
+        'post_worker_init': post_worker_init,
+    }
+    if asgi:
+        options['worker_class'] = 'uvicorn.workers.UvicornWorker'
+    else:
+        options['worker_class'] = 'gthread'
+        options['threads'] = config.PREFORK_THREADS
+    
+    class PreforkApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+        
+        def load(self):
+            return application
+    
+    logger.info(f"访问地址: http://localhost:{config.PORT}（{workers} 个工作进程）")
+    logger.info("按 Ctrl+C 停止服务\n")
+    PreforkApplication().run()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='图书推荐系统启动脚本')
+    parser.add_argument('--prefork', action='store_true',
+                        help='预派生多进程模式（主进程加载数据后 fork 工作进程）')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='预派生模式的工作进程数（默认 config.PREFORK_WORKERS）')
+    parser.add_argument('--asgi', action='store_true',
+                        help='预派生模式下使用 ASGI 入口')
+    parser.add_argument('--train-embeddings', action='store_true',
+                        help='启动前训练实体嵌入（未训练时；默认不训练，embedding 推荐策略不可用）')
+    return parser.parse_args()
+
+
 def main():
     """主函数"""
+    args = parse_args()
+    
     logger.info("\n")
     logger.info("╔" + "=" * 58 + "╗")
     logger.info("║" + " " * 10 + "基于知识图谱的可解释图书推荐系统" + " " * 10 + "║")
@@ -157,11 +250,14 @@ def main():
         logger.error("\n知识图谱构建失败，无法继续")
         sys.exit(1)
     
-    # 4. 计算实体嵌入
-    compute_embeddings()
+    # 4. 计算实体嵌入（默认只检查，训练较慢，需显式开启）
+    compute_embeddings(train=args.train_embeddings)
     
     # 5. 启动服务
-    start_server()
+    if args.prefork:
+        start_prefork_server(workers=args.workers, asgi=args.asgi)
+    else:
+        start_server()
 
 
 if __name__ == '__main__':
@@ -4,6 +4,7 @@
 """
 import pickle
 import os
+import numpy as np
 import sys
 from pathlib import Path
 
@@ -12,6 +13,7 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from config import config
+from src.core.graph_store import GraphStore
 
 def check_pickle_file(filepath, filename):
     """检查单个 pickle 文件"""
@@ -42,6 +44,37 @@ def check_pickle_file(filepath, filename):
         print(f"❌ 文件损坏: {str(e)}")
         return False
 
+def check_graph_store(path):
+    """检查 CSR 图存储目录"""
+    print(f"\n检查图存储: {path}")
+    
+    if not GraphStore.exists(path):
+        print(f"❌ 图存储不存在")
+        return False
+    
+    try:
+        graph = GraphStore.load(path, mmap_mode='r')
+        print(f"✓ 图存储完整，可以正常加载")
+        print(f"  - 节点: {graph.number_of_nodes()} 个")
+        print(f"  - 边: {graph.number_of_edges()} 条")
+        return True
+    except Exception as e:
+        print(f"❌ 图存储损坏: {str(e)}")
+        return False
+
+def check_embeddings(filepath):
+    """检查实体嵌入数组"""
+    print(f"\n检查实体嵌入: {filepath}")
+    
+    try:
+        embeddings = np.load(filepath, mmap_mode='r')
+        print(f"✓ 实体嵌入完整，可以正常加载")
+        print(f"  - 形状: {embeddings.shape}, 类型: {embeddings.dtype}")
+        return True
+    except Exception as e:
+        print(f"❌ 实体嵌入损坏: {str(e)}")
+        return False
+
 def main():
     """主函数"""
     print("=" * 60)
@@ -50,8 +83,6 @@ def main():
     
     files_to_check = [
         (config.KG_ENTITIES_FILE, "entities.pkl"),
-        (config.KG_RELATIONS_FILE, "relations.pkl"),
-        (config.KG_EMBEDDINGS_FILE, "embeddings.pkl"),
     ]
     
     # 检查评论关键词文件（如果存在）
@@ -62,6 +93,10 @@ def main():
     results = {}
     for filepath, filename in files_to_check:
         results[filename] = check_pickle_file(filepath, filename)
+    results["graph/"] = check_graph_store(config.KG_GRAPH_DIR)
+    # 实体嵌入是可选的（未训练时 embedding 策略不可用）
+    if os.path.exists(config.KG_EMBEDDINGS_FILE):
+        results["embeddings.npy"] = check_embeddings(config.KG_EMBEDDINGS_FILE)
     
     print("\n" + "=" * 60)
     print("检查结果汇总:")
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+测试访问日志分析（文本和 JSON 格式、增量读取、日志轮转、多进程读取）
+"""
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils.access_stats import AccessLogAnalyzer, ROLLUP_FILE, SUMMARY_FILE
+
+
+def _text_line(hour, ip, path, method='GET'):
+    today = datetime.now().strftime('%Y-%m-%d')
+    return (f"{today} {hour:02d}:15:00 - access - INFO - IP={ip} | Method={method} | Path={path} | "
+            f"Query= | UserAgent=test\n")
+
+
+def _json_line(hour, ip, path, status, latency_ms, **fields):
+    today = datetime.now().strftime('%Y-%m-%d')
+    record = {'time': f'{today} {hour:02d}:30:00', 'ip': ip, 'method': 'POST', 'path': path, 'query': '',
+              'status': status, 'latency_ms': latency_ms, **fields, 'user_agent': 'test'}
+    return json.dumps(record) + '\n'
+
+
+def _append(path, text):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+
+
+def _comparable(report):
+    report = dict(report)
+    report['summary'] = dict(report['summary'], log_files=None)
+    return report
+
+
+def test_parse_log_line():
+    """文本格式和 JSON 格式"""
+    analyzer = AccessLogAnalyzer()
+    data = analyzer.parse_log_line(_text_line(9, '1.2.3.4', '/api/search'))
+    assert data['ip'] == '1.2.3.4' and data['method'] == 'GET' and data['path'] == '/api/search'
+    assert data['time'][11:13] == '09'
+    
+    data = analyzer.parse_log_line(_json_line(10, '1.2.3.4', '/api/recommend', 200, 12.5, strategy='mixed', books=2))
+    assert data['status'] == 200 and data['latency_ms'] == 12.5 and data['strategy'] == 'mixed' and data['books'] == 2
+    assert analyzer.parse_log_line('\n') is None
+    print("✓ 解析日志行")
+
+
+def test_incremental_and_rotation():
+    """增量读取（含未写完的行、日志轮转）与重新读取全部日志的结果相同"""
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = os.path.join(tmp, datetime.now().strftime('%Y-%m-%d'))
+        os.makedirs(log_dir)
+        access_log = os.path.join(log_dir, 'access.log')
+        _append(access_log, ''.join(_text_line(h % 24, f'10.0.0.{h % 3}', f'/p{h % 4}') for h in range(50)))
+        
+        analyzer = AccessLogAnalyzer(log_base_dir=tmp)
+        report = analyzer.analyze(days=1)
+        assert report['summary']['total_requests'] == 50
+        assert os.path.exists(os.path.join(log_dir, ROLLUP_FILE))
+        assert os.path.exists(os.path.join(log_dir, SUMMARY_FILE))
+        
+        # 新写入的内容和末尾未写完的行
+        line = _json_line(3, '10.0.0.9', '/api/recommend', 200, 8.0, strategy='kg', books=1)
+        _append(access_log, _text_line(5, '10.0.0.1', '/p1') + line[:20])
+        assert analyzer.analyze(days=1)['summary']['total_requests'] == 51
+        _append(access_log, line[20:])
+        report = analyzer.analyze(days=1)
+        assert report['summary']['total_requests'] == 52
+        assert report['strategies'] == {'kg': 1}
+        
+        # 轮转: 原文件改名为 access.log.1 后还有写入，再写入新的 access.log
+        os.rename(access_log, access_log + '.1')
+        _append(access_log + '.1', _text_line(6, '10.0.0.2', '/p2'))
+        _append(access_log, _text_line(7, '10.0.0.3', '/p3'))
+        report = analyzer.analyze(days=1)
+        assert report['summary']['total_requests'] == 54
+        assert report['hourly_distribution']['07'] == 3
+        assert _comparable(report) == _comparable(AccessLogAnalyzer(tmp, use_index=False).analyze(days=1))
+        
+        # 当天汇总丢失时由小时汇总重新合并
+        os.remove(os.path.join(log_dir, SUMMARY_FILE))
+        assert _comparable(analyzer.analyze(days=1)) == _comparable(report)
+    print("✓ 增量读取和日志轮转")
+
+
+def test_json_fields():
+    """JSON 格式日志的状态码、耗时、推荐策略和书籍数"""
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = os.path.join(tmp, datetime.now().strftime('%Y-%m-%d'))
+        os.makedirs(log_dir)
+        _append(os.path.join(log_dir, 'access.log'), ''.join([
+            _json_line(1, '1.1.1.1', '/api/recommend', 200, 20.0, strategy='mixed', books=1),
+            _json_line(1, '1.1.1.1', '/api/recommend', 200, 40.0, strategy='mixed', books=3),
+            _json_line(2, '2.2.2.2', '/api/recommend', 400, 1.0, strategy='kg', books=0),
+            _json_line(2, '2.2.2.2', '/api/search', 200, 2.0),
+        ]))
+        report = AccessLogAnalyzer(log_base_dir=tmp).analyze(days=1)
+        assert report['summary']['total_requests'] == 4
+        assert report['statuses'] == {'200': 3, '400': 1}
+        assert report['strategies'] == {'mixed': 2, 'kg': 1}
+        assert report['books'] == {'0': 1, '1': 1, '3': 1}
+        assert report['latency_ms']['count'] == 4
+        assert report['latency_ms']['max'] == 40.0
+        assert abs(report['latency_ms']['mean'] - 15.75) < 1e-9
+        assert report['hourly_distribution'] == {'01': 2, '02': 2}
+    print("✓ JSON 格式字段")
+
+
+
+def test_parallel_days():
+    """多天的日志在进程池中读取，合并结果与依次读取相同；文本行的快速匹配与逐行解析相同"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for day in range(4):
+            log_dir = os.path.join(tmp, (datetime.now() - timedelta(days=day)).strftime('%Y-%m-%d'))
+            os.makedirs(log_dir)
+            lines = [_text_line((h * 7 + day) % 24, f'10.0.{day}.{h % 5}', f'/p{h % 3}') for h in range(200)]
+            lines[50] = '无法解析的行\n\n'
+            lines[60] = _json_line(4, '10.0.0.1', '/api/recommend', 200, 5.0, strategy='mixed', books=1)
+            _append(os.path.join(log_dir, 'access.log'), ''.join(lines))
+        _append(os.path.join(log_dir, 'access.log.1'), _text_line(1, '10.9.9.9', '/old'))
+        
+        serial = AccessLogAnalyzer(tmp, use_index=False, workers=1).analyze(days=4)
+        assert serial['summary']['total_requests'] == 4 * 199 + 1
+        parallel = AccessLogAnalyzer(tmp, workers=2).analyze(days=4)
+        assert parallel == serial
+        assert AccessLogAnalyzer(tmp, workers=2).analyze(days=4) == serial
+        
+        # 逐行解析的结果
+        analyzer = AccessLogAnalyzer(tmp)
+        paths = Counter()
+        for log_file in analyzer.get_log_files(days=4):
+            with open(log_file, encoding='utf-8') as f:
+                for line in f:
+                    data = analyzer.parse_log_line(line)
+                    if data and 'path' in data:
+                        paths[data['path']] += 1
+        assert {item['path']: item['count'] for item in serial['top_paths']} == dict(paths)
+    print("✓ 多进程读取")
+
+
+if __name__ == '__main__':
+    test_parse_log_line()
+    test_incremental_and_rotation()
+    test_json_fields()
+    test_parallel_days()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+测试 Flask 接口的请求校验（合成数据，不依赖原始数据文件）
+"""
+import json
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import app as flask_app
+from tests.test_scoring_engine import _make_recommender
+
+
+def test_recommend_batch_validation():
+    """每组输入的 favorite_books 不是书名列表时，开始流式返回前就返回 400"""
+    flask_app.recommender = _make_recommender()
+    client = flask_app.app.test_client()
+    
+    for requests in (
+        [{'favorite_books': '三体'}],
+        [['三体'], {'favorite_books': ['三体', ['球状闪电']]}],
+        [{'favorite_books': [{'name': '三体'}]}],
+        [{'id': 'user-1'}],
+        [{'favorite_books': ['三体'], 'selected_keywords': '宇宙'}],
+        ['三体'],
+    ):
+        response = client.post('/api/recommend/batch', json={'requests': requests})
+        assert response.status_code == 400, requests
+        assert response.get_json()['success'] is False
+    
+    response = client.post('/api/recommend/batch', json={
+        'requests': [['三体'], {'id': 'user-1', 'favorite_books': ['不存在的书']}],
+        'top_k': 3
+    })
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['index'] for line in lines] == [0, 1]
+    assert [rec['book_id'] for rec in lines[0]['recommendations']] == [2, 5, 6]
+    assert lines[1]['id'] == 'user-1' and lines[1]['recommendations'] == []
+    
+    # 直接调用推荐器时同样拒绝
+    try:
+        list(flask_app.recommender.recommend_batch([{'favorite_books': '三体'}]))
+        assert False, '应抛出 ValueError'
+    except ValueError:
+        pass
+    print("✓ 批量推荐输入校验")
+
+
+if __name__ == '__main__':
+    test_recommend_batch_validation()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+测试 ASGI 入口: 推荐请求的背压（503）、搜索线程池和轻量接口
+"""
+import asyncio
+import json
+import sys
+import threading
+from pathlib import Path
+from urllib.parse import urlencode
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import app as flask_app
+from asgi import AsyncRecommendApp
+from tests.test_scoring_engine import _make_recommender
+
+
+async def _request(application, method, path, params=None, body=b''):
+    """发送一个 HTTP 请求，返回 (状态码, 响应头, 响应JSON)"""
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': urlencode(params or {}).encode('ascii'),
+        'headers': [(b'user-agent', b'test')],
+        'client': ('127.0.0.1', 12345)
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+    
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+    
+    async def send(message):
+        sent.append(message)
+    
+    await application(scope, receive, send)
+    return sent[0]['status'], dict(sent[0]['headers']), json.loads(sent[1]['body'])
+
+
+def _recommend_body(favorite_books):
+    return json.dumps({'favorite_books': favorite_books, 'top_k': 3}).encode('utf-8')
+
+
+def test_fast_routes():
+    """搜索在搜索线程池中执行，翻译直接返回"""
+    recommender = _make_recommender()
+    flask_app.recommender = recommender
+    threads = []
+    search_books = recommender.search_books
+    
+    def record_thread(query, limit=10):
+        threads.append(threading.current_thread().name)
+        return search_books(query, limit)
+    
+    recommender.search_books = record_thread
+    application = AsyncRecommendApp(recommend_workers=1, max_pending=1, max_body_bytes=1024)
+    
+    async def scenario():
+        status, headers, payload = await _request(application, 'GET', '/api/search', {'q': '三体', 'limit': 5})
+        assert status == 200 and headers[b'content-type'] == b'application/json'
+        assert [item['book_id'] for item in payload['data']['results']] == [0]
+        assert (await _request(application, 'GET', '/api/search'))[0] == 400
+        
+        status, _, payload = await _request(application, 'GET', '/api/translations/en')
+        assert status == 200 and payload['data']['lang'] == 'en'
+    
+    asyncio.run(scenario())
+    assert len(threads) == 1 and threads[0].startswith('search')
+    print("✓ 搜索和翻译")
+
+
+def test_backpressure():
+    """推荐请求达到上限时直接返回 503，搜索不受影响；请求体过大返回 413"""
+    recommender = _make_recommender()
+    flask_app.recommender = recommender
+    entered = threading.Event()
+    unblock = threading.Event()
+    recommend = recommender.recommend
+    
+    def blocking_recommend(*args, **kwargs):
+        entered.set()
+        unblock.wait(5)
+        return recommend(*args, **kwargs)
+    
+    recommender.recommend = blocking_recommend
+    application = AsyncRecommendApp(recommend_workers=1, max_pending=1, max_body_bytes=1024)
+    
+    async def scenario():
+        first = asyncio.ensure_future(
+            _request(application, 'POST', '/api/recommend', body=_recommend_body(['三体']))
+        )
+        assert await asyncio.get_running_loop().run_in_executor(None, entered.wait, 5)
+        
+        status, headers, payload = await _request(application, 'POST', '/api/recommend', body=_recommend_body(['三体']))
+        assert status == 503 and headers[b'retry-after'] == b'1' and payload['success'] is False
+        assert (await _request(application, 'GET', '/api/search', {'q': '三体'}))[0] == 200
+        
+        unblock.set()
+        status, _, payload = await first
+        assert status == 200
+        assert [rec['book_id'] for rec in payload['data']['recommendations']] == [2, 5, 6]
+        assert application.pending == 0
+        
+        status, _, _ = await _request(application, 'POST', '/api/recommend', body=b' ' * 2048)
+        assert status == 413 and application.pending == 0
+    
+    asyncio.run(scenario())
+    print("✓ 背压")
+
+
+if __name__ == '__main__':
+    test_fast_routes()
+    test_backpressure()
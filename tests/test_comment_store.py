@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+测试评论列存储的转换、分块读取和评论指纹
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.comment_store import CommentStore
+from src.utils.parquet_converter import convert_comments
+
+
+def _make_comments():
+    """3 个图书链接的评论，同一链接的评论在源数据中不连续"""
+    return pd.DataFrame({
+        'readBookUrl': ['u/b', 'u/a', 'u/b', 'u/c', 'u/a', 'u/b'],
+        'bookComment': ['b1', 'a1', 'b2', np.nan, 'a2', 'b3'],
+        'rating': ['rating5-t', 'rating3-t', None, 'rating4-t', 'bad', 'rating1-t'],
+        'id': [10, 11, 12, 13, 14, 15],
+    })
+
+
+def test_convert_and_load():
+    """按链接排序，同一链接内保持原始顺序；保存后可用 mmap 加载"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source_file = os.path.join(tmp, 'comments')
+        path = os.path.join(tmp, 'store')
+        _make_comments().to_pickle(source_file)
+        assert not CommentStore.exists(path)
+        CommentStore.convert(source_file, path)
+        assert CommentStore.exists(path)
+        
+        store = CommentStore.load(path, mmap_mode='r')
+        stat = os.stat(source_file)
+        assert store.source_stat == (stat.st_size, stat.st_mtime_ns)
+        assert list(store.urls) == ['u/a', 'u/b', 'u/c']
+        assert store.url_indptr.tolist() == [0, 2, 5, 6]
+        assert list(store.comments) == ['a1', 'a2', 'b1', 'b2', 'b3', 'nan']
+        assert store.rating_scores.tolist() == [3, 0, 5, 0, 1, 4]
+        assert len(store) == 6
+    print("✓ 转换/加载")
+
+
+def test_iter_chunks():
+    """每块不超过 max_rows 条评论，超过的单个链接单独成块"""
+    store = CommentStore.from_dataframe(_make_comments())
+    assert list(store.iter_chunks(3)) == [(0, 1), (1, 2), (2, 3)]
+    assert list(store.iter_chunks(5)) == [(0, 2), (2, 3)]
+    assert list(store.iter_chunks(100)) == [(0, 3)]
+    assert list(store.iter_chunks(1)) == [(0, 1), (1, 2), (2, 3)]
+    print("✓ 分块")
+
+
+def test_fingerprints():
+    """分块计算的指纹与整表计算相同，无法对应到图书的链接被忽略"""
+    comments = _make_comments()
+    store = CommentStore.from_dataframe(comments)
+    url_book_ids = np.array([4, 1, -1], dtype=np.int64)  # u/a -> 4, u/b -> 1, u/c 不是图书
+    
+    hashes = pd.util.hash_pandas_object(comments['id'], index=False).to_numpy()
+    expected_hashes = np.zeros(5, dtype=np.uint64)
+    expected_hashes[4] = hashes[[1, 4]].sum()
+    expected_hashes[1] = hashes[[0, 2, 5]].sum()
+    
+    for chunk_rows in (1, 2, 100):
+        counts, fingerprint_hashes = store.fingerprints(url_book_ids, 5, chunk_rows)
+        assert counts.tolist() == [0, 3, 0, 0, 2]
+        assert np.array_equal(fingerprint_hashes, expected_hashes)
+    print("✓ 评论指纹")
+
+
+def _assert_same(store, expected):
+    assert list(store.urls) == list(expected.urls)
+    assert list(store.comments) == list(expected.comments)
+    assert np.array_equal(store.url_indptr, expected.url_indptr)
+    assert np.array_equal(store.rating_scores, expected.rating_scores)
+    assert np.array_equal(store.id_hashes, expected.id_hashes)
+
+
+def test_convert_parquet():
+    """Parquet 转换（按块读取、复用旧存储中没有变化的链接）与 pickle 转换结果相同"""
+    with tempfile.TemporaryDirectory() as tmp:
+        comments = _make_comments()
+        comments.to_pickle(os.path.join(tmp, 'comments'))
+        convert_comments(os.path.join(tmp, 'comments'), os.path.join(tmp, 'comments.parquet'), row_group_size=2)
+        expected = CommentStore.from_dataframe(comments)
+        for chunk_rows in (1, 2, 100):
+            path = os.path.join(tmp, f'store_{chunk_rows}')
+            store = CommentStore.convert(os.path.join(tmp, 'comments.parquet'), path, chunk_rows=chunk_rows)
+            _assert_same(store, expected)
+        
+        # u/a 的评论变化、u/c 删除、新增 u/d，u/b 从旧存储复用
+        previous = CommentStore.load(os.path.join(tmp, 'store_2'), mmap_mode='r')
+        updated = pd.concat([comments[comments['readBookUrl'] != 'u/c'], pd.DataFrame({
+            'readBookUrl': ['u/a', 'u/d'], 'bookComment': ['a3', 'd1'], 'rating': ['rating2-t', 'rating5-t'], 'id': [16, 17]
+        })], ignore_index=True)
+        updated.to_pickle(os.path.join(tmp, 'updated'))
+        convert_comments(os.path.join(tmp, 'updated'), os.path.join(tmp, 'updated.parquet'), row_group_size=2)
+        store = CommentStore.convert(
+            os.path.join(tmp, 'updated.parquet'), os.path.join(tmp, 'store_2'), previous=previous, chunk_rows=2
+        )
+        _assert_same(store, CommentStore.from_dataframe(updated))
+        assert not os.path.exists(os.path.join(tmp, 'store_2.tmp'))
+        
+        # 没有按链接排序的 Parquet 文件退化为整表转换
+        comments.to_parquet(os.path.join(tmp, 'unsorted.parquet'))
+        store = CommentStore.convert(os.path.join(tmp, 'unsorted.parquet'), os.path.join(tmp, 'store_u'))
+        _assert_same(store, expected)
+    print("✓ Parquet 转换")
+
+
+if __name__ == '__main__':
+    test_convert_and_load()
+    test_iter_chunks()
+    test_fingerprints()
+    test_convert_parquet()
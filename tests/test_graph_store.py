@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+测试图存储的保存和加载（写入临时目录后替换）
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.graph_store import GraphStore
+
+
+def _make_graph(num_books):
+    """num_books 本书，都由作者（最后一个实体）所写"""
+    entities = {book_id: {'type': 'book', 'name': f'图书{book_id}', 'rating': 8.0} for book_id in range(num_books)}
+    entities[num_books] = {'type': 'author', 'name': '作者'}
+    relations = [(book_id, 'written_by', num_books) for book_id in range(num_books)]
+    return GraphStore.from_relations(entities, relations)
+
+
+def test_save_replace():
+    """重新保存时替换整个目录: 已用 mmap 加载的旧图仍可读取，不留下临时目录"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'graph')
+        _make_graph(3).save(path)
+        assert GraphStore.exists(path)
+        old = GraphStore.load(path, mmap_mode='r')
+        assert old.number_of_nodes() == 4 and old.neighbors(0) == [3]
+        
+        _make_graph(1000).save(path)
+        assert sorted(os.listdir(tmp)) == ['graph']
+        graph = GraphStore.load(path, mmap_mode='r')
+        assert graph.number_of_nodes() == 1001 and graph.names[999] == '图书999'
+        assert old.number_of_nodes() == 4 and old.neighbors(2) == [3] and old.names[2] == '图书2'
+    print("✓ 保存/替换")
+
+
+if __name__ == '__main__':
+    test_save_replace()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+测试评论关键词向量的近似最近邻索引
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from src.core.keyword_store import KeywordStore
+from src.core.keyword_ann import KeywordANNIndex
+from tests.test_scoring_engine import _make_recommender
+
+
+def _make_store(num_books=2000, num_topics=100, seed=0):
+    """每本书的关键词来自一个主题词表 + 少量随机词"""
+    rng = np.random.default_rng(seed)
+    vocab = [f'词{i}' for i in range(5000)]
+    topics = rng.integers(0, len(vocab), size=(num_topics, 30))
+    book_keywords = {}
+    book_keyword_weights = {}
+    for book_id in range(1, num_books + 1):  # 实体0不是图书
+        words = set(rng.choice(topics[rng.integers(num_topics)], size=15).tolist())
+        words.update(rng.integers(0, len(vocab), size=5).tolist())
+        keywords = [vocab[i] for i in sorted(words)]
+        book_keywords[book_id] = keywords
+        book_keyword_weights[book_id] = {kw: float(rng.random()) for kw in keywords}
+    return KeywordStore.from_dicts(num_books + 1, book_keywords, book_keyword_weights, {}, {})
+
+
+def test_recall():
+    """近似查找的 Recall@10 接近精确查找，结果按相似度降序且不含查询书本身"""
+    index = KeywordANNIndex.build(_make_store())
+    assert len(index) == 2000
+    assert index.doc_of(0) is None and index.query(0) == []
+    
+    results = index.query(1, 10)
+    assert len(results) == 10
+    assert 1 not in [book_id for book_id, _ in results]
+    similarities = [similarity for _, similarity in results]
+    assert similarities == sorted(similarities, reverse=True)
+    
+    result = index.measure_recall(k=10, sample_size=100)
+    print(f"Recall@10 = {result['recall']:.3f}, 近似 {result['ann_ms']:.2f} ms, 精确 {result['exact_ms']:.2f} ms")
+    assert result['recall'] >= 0.9
+    print("✓ 召回率")
+
+
+def test_save_load():
+    """保存后用 mmap 加载，查询结果不变；重新保存时替换整个目录，已加载的旧索引仍可查询"""
+    index = KeywordANNIndex.build(_make_store(num_books=300), data_version='v1')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'keyword_ann')
+        index.save(path)
+        assert KeywordANNIndex.exists(path)
+        loaded = KeywordANNIndex.load(path, mmap_mode='r')
+        assert loaded.data_version == 'v1'
+        for book_id in (1, 50, 300):
+            assert loaded.query(book_id, 5) == index.query(book_id, 5)
+        
+        new_index = KeywordANNIndex.build(_make_store(num_books=500, seed=1), data_version='v2')
+        new_index.save(path)
+        assert sorted(os.listdir(tmp)) == ['keyword_ann']
+        assert KeywordANNIndex.load(path, mmap_mode='r').data_version == 'v2'
+        assert loaded.query(50, 5) == index.query(50, 5)
+    print("✓ 保存/加载")
+
+
+def test_similar_books_offline_index():
+    """请求中只加载离线构建的索引: 不存在或数据版本不一致时返回空列表"""
+    recommender = _make_recommender()
+    saved = config.KG_KEYWORD_ANN_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        config.KG_KEYWORD_ANN_DIR = os.path.join(tmp, 'keyword_ann')
+        try:
+            assert recommender.similar_books(5) == []
+            assert not os.path.exists(config.KG_KEYWORD_ANN_DIR)
+            
+            KeywordANNIndex.build(recommender.keyword_store, data_version='旧版本').save(config.KG_KEYWORD_ANN_DIR)
+            recommender._keyword_ann = None
+            assert recommender.similar_books(5) == []
+            
+            recommender.build_keyword_ann()
+            recommender._keyword_ann = None
+            assert sorted(item['book_id'] for item in recommender.similar_books(5)) == [0, 3]
+        finally:
+            config.KG_KEYWORD_ANN_DIR = saved
+    print("✓ 离线构建的索引")
+
+
+if __name__ == '__main__':
+    test_recall()
+    test_save_load()
+    test_similar_books_offline_index()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+测试关键词存储的保存和加载（写入临时目录后替换）
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.keyword_store import KeywordStore
+
+
+def _make_store(keywords, **fingerprints):
+    """图书1 的关键词为 keywords（权重都是 1.0），共 3 个实体"""
+    return KeywordStore.from_dicts(
+        3, {1: keywords}, {1: {kw: 1.0 for kw in keywords}},
+        {1: {'total_comments': 10, 'like_count': 8, 'avg_rating': 4.0}}, {1: 0.5},
+        **fingerprints
+    )
+
+
+def test_save_replace():
+    """重新保存时替换整个目录: 已用 mmap 加载的旧存储仍可读取，没有的可选数组不会残留"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'keywords')
+        _make_store(['宇宙', '文明'], comment_counts=np.array([0, 10, 0]), comment_hashes=np.array([0, 7, 0])).save(path)
+        assert KeywordStore.exists(path)
+        old = KeywordStore.load(path, mmap_mode='r')
+        assert old.has_fingerprints()
+        
+        _make_store(['人生']).save(path)
+        assert sorted(os.listdir(tmp)) == ['keywords']
+        store = KeywordStore.load(path, mmap_mode='r')
+        assert not store.has_fingerprints()
+        assert list(store.book_keywords_view()[1]) == ['人生']
+        assert list(old.book_keywords_view()[1]) == ['宇宙', '文明']
+        assert old.comment_counts.tolist() == [0, 10, 0]
+    print("✓ 保存/替换")
+
+
+if __name__ == '__main__':
+    test_save_replace()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+测试 TransE 实体嵌入训练和重新训练后的结果缓存失效
+"""
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from src.core.graph_store import GraphStore, NODE_TYPE_CODES, RELATION_CODES
+from src.core.keyword_recommender import KeywordBasedRecommender
+from src.core.kg_embedding import TransETrainer, train_embeddings
+from tests.test_scoring_engine import _make_recommender
+
+
+def _make_graph():
+    """4 位作者各写 5 本书（written_by / write 双向关系），实体 20 为空ID"""
+    node_types = [NODE_TYPE_CODES['book']] * 20 + [-1] + [NODE_TYPE_CODES['author']] * 4
+    heads, tails, codes = [], [], []
+    for book_id in range(20):
+        author_id = 21 + book_id // 5
+        heads += [book_id, author_id]
+        tails += [author_id, book_id]
+        codes += [RELATION_CODES['written_by'], RELATION_CODES['write']]
+    names = [f'实体{i}' for i in range(len(node_types))]
+    return GraphStore.from_arrays(node_types, heads, tails, codes, names, [''] * len(names), [0] * len(names))
+
+
+def test_same_author_closer():
+    """同一作者的书在嵌入空间中比不同作者的书更接近"""
+    graph = _make_graph()
+    embeddings = TransETrainer(dim=16, learning_rate=0.01, batch_size=8, epochs=100).train(graph)
+    assert embeddings.shape == (25, 16) and embeddings.dtype == np.float32
+    assert not embeddings[20].any()
+    
+    books = embeddings[:20]
+    similarity = books @ books.T
+    same = np.equal.outer(np.arange(20) // 5, np.arange(20) // 5) & ~np.eye(20, dtype=bool)
+    different = ~np.equal.outer(np.arange(20) // 5, np.arange(20) // 5)
+    assert similarity[same].mean() > similarity[different].mean() + 0.3
+    print(f"✓ 同作者平均相似度 {similarity[same].mean():.3f}，不同作者 {similarity[different].mean():.3f}")
+
+
+def test_save_mmap():
+    """训练结果保存为 .npy，可以用 mmap 加载"""
+    with tempfile.TemporaryDirectory() as tmp:
+        graph_dir = os.path.join(tmp, 'graph')
+        output_file = os.path.join(tmp, 'embeddings.npy')
+        _make_graph().save(graph_dir)
+        
+        embeddings = train_embeddings(graph_dir, output_file, dim=8, batch_size=8, epochs=2)
+        loaded = np.load(output_file, mmap_mode='r')
+        assert isinstance(loaded, np.memmap)
+        assert np.array_equal(loaded, embeddings)
+    print("✓ 保存/mmap 加载")
+
+
+def test_cache_namespace():
+    """重新训练嵌入后推荐结果缓存的命名空间改变"""
+    saved = config.KG_GRAPH_DIR, config.KG_KEYWORDS_DIR, config.KG_EMBEDDINGS_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        config.KG_GRAPH_DIR = os.path.join(tmp, 'graph')
+        config.KG_KEYWORDS_DIR = os.path.join(tmp, 'keywords')
+        config.KG_EMBEDDINGS_FILE = os.path.join(tmp, 'embeddings.npy')
+        try:
+            _make_graph().save(config.KG_GRAPH_DIR)
+            namespaces = [KeywordBasedRecommender._cache_namespace()]
+            for seed in range(2):
+                train_embeddings(dim=8, batch_size=8, epochs=1, seed=seed)
+                namespaces.append(KeywordBasedRecommender._cache_namespace())
+            assert len(set(namespaces)) == 3
+        finally:
+            config.KG_GRAPH_DIR, config.KG_KEYWORDS_DIR, config.KG_EMBEDDINGS_FILE = saved
+    print("✓ 结果缓存命名空间")
+
+
+def test_missing_embeddings():
+    """没有嵌入时嵌入策略返回空结果，只检查文件、记录一次日志"""
+    saved = config.KG_EMBEDDINGS_FILE
+    recommender = _make_recommender()
+    messages = []
+    handler = logging.Handler()
+    handler.emit = lambda record: messages.append(record.getMessage())
+    recommender.logger.addHandler(handler)
+    with tempfile.TemporaryDirectory() as tmp:
+        config.KG_EMBEDDINGS_FILE = os.path.join(tmp, 'embeddings.npy')
+        try:
+            for _ in range(3):
+                assert recommender.recommend(['三体'], top_k=3, strategy='embedding') == []
+                recommender.result_cache.clear()
+            assert len([message for message in messages if '嵌入' in message]) == 1
+            
+            # 行数与知识图谱不一致的嵌入同样不可用
+            np.save(config.KG_EMBEDDINGS_FILE, np.zeros((3, 8), dtype=np.float32))
+            recommender._embeddings = None
+            assert recommender._get_embeddings() is None and recommender._get_embeddings() is None
+            assert len([message for message in messages if '嵌入' in message]) == 2
+        finally:
+            config.KG_EMBEDDINGS_FILE = saved
+            recommender.logger.removeHandler(handler)
+    print("✓ 没有嵌入时只提示一次")
+
+
+if __name__ == '__main__':
+    test_same_author_closer()
+    test_save_mmap()
+    test_cache_namespace()
+    test_missing_embeddings()
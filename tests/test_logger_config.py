@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+测试异步日志（有界队列 + 后台批量写入）
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils.logger_config import BoundedQueueHandler, DateBasedLogger
+
+
+class _BlockingHandler(logging.Handler):
+    """处理第一条记录时等待 unblock，用于让队列积压"""
+    
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.unblock = threading.Event()
+        self.messages = []
+    
+    def emit(self, record):
+        self.entered.set()
+        self.unblock.wait()
+        self.messages.append(record.getMessage())
+
+
+def _make_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+def test_async_logger_writes_in_order():
+    """记录按顺序写入日志文件，关闭时写完已排队的记录"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DateBasedLogger(log_base_dir=tmp)
+        logger = manager.get_async_logger('test_async_access', batch_size=7)
+        logger.handlers[0].target_handlers[1].setLevel(logging.CRITICAL)  # 不输出到控制台
+        for i in range(100):
+            logger.info('request %d', i)
+        handler = logger.handlers[0]
+        handler.close()
+        for target in handler.target_handlers:
+            target.close()
+        
+        log_file = os.path.join(manager._get_log_dir(), 'test_async_access.log')
+        with open(log_file, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert [line.rsplit(' - ', 1)[1] for line in lines] == [f'request {i}' for i in range(100)]
+        assert manager.dropped_records('test_async_access') == 0
+        logger.handlers.clear()
+    print("✓ 按顺序批量写入")
+
+
+def test_drop_when_full():
+    """'drop': 队列满时丢弃并计数"""
+    target = _BlockingHandler()
+    handler = BoundedQueueHandler([target], queue_size=5, overflow='drop')
+    logger = _make_logger('test_async_drop', handler)
+    logger.info('first')
+    assert target.entered.wait(5)  # 写入线程卡在第一条记录
+    for i in range(8):
+        logger.info('queued %d', i)
+    assert handler.dropped == 3
+    
+    target.unblock.set()
+    handler.close()
+    assert target.messages == ['first'] + [f'queued {i}' for i in range(5)]
+    print("✓ 丢弃计数")
+
+
+def test_block_with_timeout():
+    """'block': 队列满时等待空位，超时后丢弃"""
+    target = _BlockingHandler()
+    handler = BoundedQueueHandler([target], queue_size=2, overflow='block', block_timeout=0.05)
+    logger = _make_logger('test_async_block', handler)
+    logger.info('first')
+    assert target.entered.wait(5)
+    for i in range(3):
+        logger.info('queued %d', i)
+    assert handler.dropped == 1
+    
+    # 写入线程腾出空位后，等待中的记录可以放入队列
+    threading.Timer(0.05, target.unblock.set).start()
+    handler.block_timeout = 5
+    logger.info('waited')
+    handler.close()
+    assert target.messages == ['first', 'queued 0', 'queued 1', 'waited']
+    assert handler.dropped == 1
+    print("✓ 等待超时")
+
+
+def test_block_without_lock():
+    """'block': 等待队列空位时不持有 handler 的锁"""
+    target = _BlockingHandler()
+    handler = BoundedQueueHandler([target], queue_size=1, overflow='block', block_timeout=5)
+    logger = _make_logger('test_async_block_lock', handler)
+    logger.info('first')
+    assert target.entered.wait(5)
+    logger.info('queued')
+    
+    waiting = threading.Thread(target=logger.info, args=('waited',))
+    waiting.start()
+    waiting.join(0.1)
+    assert waiting.is_alive()  # 队列已满，正在等待空位
+    acquired = handler.lock.acquire(timeout=1)
+    if acquired:
+        handler.lock.release()
+    
+    target.unblock.set()
+    waiting.join(5)
+    handler.close()
+    assert acquired
+    assert target.messages == ['first', 'queued', 'waited']
+    assert handler.dropped == 0
+    print("✓ 等待时不持有锁")
+
+
+def test_batch_rotation():
+    """批量写入时按累计字节数轮转，记录不丢失"""
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, 'rotate.log')
+        target = RotatingFileHandler(log_file, maxBytes=200, backupCount=20, encoding='utf-8')
+        target.setFormatter(logging.Formatter('%(message)s'))
+        handler = BoundedQueueHandler([target], batch_size=50)
+        logger = _make_logger('test_async_rotate', handler)
+        for i in range(60):
+            logger.info('记录 %02d', i)
+        handler.close()
+        target.close()
+        
+        # 编号越大的备份越早
+        files = [f'{log_file}.{n}' for n in range(20, 0, -1) if os.path.exists(f'{log_file}.{n}')] + [log_file]
+        assert len(files) > 3
+        lines = []
+        for path in files:
+            assert os.path.getsize(path) <= 200
+            with open(path, encoding='utf-8') as f:
+                lines.extend(f.read().splitlines())
+        assert lines == [f'记录 {i:02d}' for i in range(60)]
+    print("✓ 批量轮转")
+
+
+if __name__ == '__main__':
+    test_async_logger_writes_in_order()
+    test_drop_when_full()
+    test_block_with_timeout()
+    test_block_without_lock()
+    test_batch_rotation()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+测试服务指标的文本格式输出和多进程合并
+"""
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils.metrics import MetricsRegistry
+
+
+def _make_registry():
+    registry = MetricsRegistry(prefix='t_')
+    registry.describe('requests_total', 'counter', '请求数')
+    registry.describe('duration_seconds', 'histogram', '耗时')
+    registry.describe('in_flight', 'gauge', '处理中', merge='sum')
+    registry.describe('memory_bytes', 'gauge', '内存', merge='pid')
+    return registry
+
+
+def test_render():
+    """计数器、累计直方图桶、标签转义"""
+    registry = _make_registry()
+    registry.inc('requests_total', {'route': '/a', 'status': '200'})
+    registry.inc('requests_total', {'status': '200', 'route': '/a'}, 2)
+    registry.inc('requests_total', {'route': 'x"y\\z', 'status': '500'})
+    registry.observe('duration_seconds', 0.003)
+    registry.observe('duration_seconds', 0.07)
+    registry.observe('duration_seconds', 30)
+    
+    lines = registry.render().splitlines()
+    assert '# TYPE t_requests_total counter' in lines
+    assert 't_requests_total{route="/a",status="200"} 3.0' in lines
+    assert 't_requests_total{route="x\\"y\\\\z",status="500"} 1.0' in lines
+    assert '# TYPE t_duration_seconds histogram' in lines
+    assert 't_duration_seconds_bucket{le="0.005"} 1' in lines
+    assert 't_duration_seconds_bucket{le="0.05"} 1' in lines
+    assert 't_duration_seconds_bucket{le="0.1"} 2' in lines
+    assert 't_duration_seconds_bucket{le="10.0"} 2' in lines
+    assert 't_duration_seconds_bucket{le="+Inf"} 3' in lines
+    assert 't_duration_seconds_count 3' in lines
+    assert 't_duration_seconds_sum 30.073' in lines
+    print("✓ 文本格式")
+
+
+def test_collector():
+    """collector 返回的计数器和仪表按声明的类型输出"""
+    registry = _make_registry()
+    registry.register_collector(lambda: [
+        ('requests_total', {'route': '/cache'}, 5),
+        ('memory_bytes', {}, 1024)
+    ])
+    lines = registry.render().splitlines()
+    assert 't_requests_total{route="/cache"} 5.0' in lines
+    assert f't_memory_bytes{{pid="{os.getpid()}"}} 1024.0' in lines
+    print("✓ collector")
+
+
+def test_multiprocess_merge():
+    """多进程合并: 计数器和直方图求和（含已退出进程），仪表只统计仍在运行的进程"""
+    with tempfile.TemporaryDirectory() as tmp:
+        # 上次运行留下的文件在启用时清空
+        with open(os.path.join(tmp, '1.json'), 'w', encoding='utf-8') as f:
+            f.write('{}')
+        registry = _make_registry()
+        registry.enable_multiprocess(tmp)
+        assert os.listdir(tmp) == []
+        
+        registry.inc('requests_total', {'route': '/a'}, 2)
+        registry.observe('duration_seconds', 0.02)
+        registry.add_gauge('in_flight', 1)
+        
+        # 已退出进程（pid 不存在）写下的文件
+        dead_pid = 2 ** 22 + 12345
+        with open(os.path.join(tmp, f'{dead_pid}.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'pid': dead_pid,
+                'counters': [['requests_total', [['route', '/a']], 3]],
+                'histograms': [['duration_seconds', [], [0, 0, 1] + [0] * 9, 0.02]],
+                'gauges': [['in_flight', [], 4], ['memory_bytes', [], 2048]]
+            }, f)
+        
+        lines = registry.render().splitlines()
+        assert 't_requests_total{route="/a"} 5.0' in lines
+        assert 't_duration_seconds_bucket{le="0.025"} 2' in lines
+        assert 't_duration_seconds_count 2' in lines
+        assert 't_in_flight 1.0' in lines
+        assert not any(line.startswith('t_memory_bytes') for line in lines)
+        # 抓取时本进程的数值也写入共享目录
+        assert os.path.exists(os.path.join(tmp, f'{os.getpid()}.json'))
+    print("✓ 多进程合并")
+
+
+if __name__ == '__main__':
+    test_render()
+    test_collector()
+    test_multiprocess_merge()
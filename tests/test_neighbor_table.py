@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+测试预计算图书近邻表的保存/加载、查表、多本书合并和结果缓存失效
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from src.core.keyword_recommender import KeywordBasedRecommender
+from src.core.neighbor_table import NeighborTable
+
+
+def _make_table():
+    """5 个实体: 图书 0/1/2 有近邻列表，3/4 没有"""
+    arrays = {}
+    for strategy in NeighborTable.STRATEGIES:
+        indptr = np.array([0, 2, 4, 5, 5, 5], dtype=np.int64)
+        ids = np.array([1, 2, 2, 4, 3], dtype=np.int32)
+        scores = np.array([0.9, 0.5, 0.8, 0.6, 0.3], dtype=np.float32)
+        arrays[strategy] = (indptr, ids, scores)
+    return NeighborTable(2, 'v1', arrays)
+
+
+def test_save_load_lookup():
+    """保存后用 mmap 加载，查表结果不变"""
+    with tempfile.TemporaryDirectory() as tmp:
+        assert not NeighborTable.exists(tmp)
+        _make_table().save(tmp)
+        assert NeighborTable.exists(tmp)
+        
+        table = NeighborTable.load(tmp, mmap_mode='r')
+        assert table.top_n == 2 and table.data_version == 'v1'
+        ids, scores = table.neighbors('mixed', 1)
+        assert ids.tolist() == [2, 4]
+        assert np.allclose(scores, [0.8, 0.6])
+        assert table.neighbors('kg_only', 3)[0].tolist() == []
+    print("✓ 保存/加载/查表")
+
+
+def test_save_replace():
+    """重新保存时替换整个目录: 已用 mmap 加载的旧表仍可读取，不留下临时目录"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'neighbors')
+        _make_table().save(path)
+        old = NeighborTable.load(path, mmap_mode='r')
+        
+        arrays = {
+            strategy: (np.zeros(1001, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32))
+            for strategy in NeighborTable.STRATEGIES
+        }
+        NeighborTable(2, 'v2', arrays).save(path)
+        assert sorted(os.listdir(tmp)) == ['neighbors']
+        table = NeighborTable.load(path, mmap_mode='r')
+        assert table.data_version == 'v2' and table.neighbors('mixed', 999)[0].tolist() == []
+        assert old.data_version == 'v1' and old.neighbors('mixed', 1)[0].tolist() == [2, 4]
+    print("✓ 保存/替换")
+
+
+def test_merge():
+    """合并时加权只计一次，排除喜欢的书，同分按图书ID升序"""
+    table = _make_table()
+    boost = lambda book_ids: np.full(len(book_ids), 0.1)
+    
+    # 图书2: (0.5-0.1) + (0.8-0.1) + 0.1 = 1.2；图书4: 0.6；图书1 是喜欢的书
+    assert table.merge('mixed', [0, 1], 5, boost) == [2, 4]
+    assert table.merge('mixed', [0, 1], 1, boost) == [2]
+    # 只出现在一个列表中的候选得分不变，图书2 是喜欢的书
+    assert table.merge('mixed', [0, 2], 5, boost) == [1, 3]
+    assert table.merge('mixed', [3, 4], 5, boost) == []
+    print("✓ 多本书合并")
+
+
+def test_cache_namespace():
+    """重新生成近邻表后推荐结果缓存的命名空间改变，近邻表依赖的数据版本不变"""
+    saved = config.KG_GRAPH_DIR, config.KG_KEYWORDS_DIR, config.KG_NEIGHBORS_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        config.KG_GRAPH_DIR = os.path.join(tmp, 'graph')
+        config.KG_KEYWORDS_DIR = os.path.join(tmp, 'keywords')
+        config.KG_NEIGHBORS_DIR = os.path.join(tmp, 'neighbors')
+        try:
+            data_version = KeywordBasedRecommender._data_version()
+            namespace = KeywordBasedRecommender._cache_namespace()
+            _make_table().save(config.KG_NEIGHBORS_DIR)
+            assert KeywordBasedRecommender._data_version() == data_version
+            assert KeywordBasedRecommender._cache_namespace() != namespace
+        finally:
+            config.KG_GRAPH_DIR, config.KG_KEYWORDS_DIR, config.KG_NEIGHBORS_DIR = saved
+    print("✓ 结果缓存命名空间")
+
+
+if __name__ == '__main__':
+    test_save_load_lookup()
+    test_save_replace()
+    test_merge()
+    test_cache_namespace()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+测试推荐结果缓存（LRU + TTL）
+"""
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Process
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.result_cache import ResultCache, SQLiteResultCache
+
+
+def test_lru_eviction():
+    """超过条目数上限时淘汰最久未使用的条目"""
+    cache = ResultCache(max_entries=2, max_bytes=1024 * 1024, ttl=None)
+    cache.put('a', [1])
+    cache.put('b', [2])
+    assert cache.get('a') == [1]  # a 变为最近使用
+    cache.put('c', [3])
+    assert cache.get('b') is None
+    assert cache.get('a') == [1]
+    assert cache.get('c') == [3]
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['hits'] == 3 and stats['misses'] == 1
+    print("✓ LRU 淘汰")
+
+
+def test_byte_limit():
+    """超过字节数上限时淘汰，单个过大的值不缓存"""
+    cache = ResultCache(max_entries=100, max_bytes=2000, ttl=None)
+    cache.put('big', 'x' * 5000)
+    assert cache.get('big') is None
+    for i in range(10):
+        cache.put(i, 'x' * 500)
+    assert cache.stats()['bytes'] <= 2000
+    assert cache.get(9) is not None
+    assert cache.get(0) is None
+    print("✓ 字节数上限")
+
+
+def test_ttl_and_clear():
+    """过期条目失效，clear 清空全部条目"""
+    cache = ResultCache(max_entries=10, max_bytes=1024 * 1024, ttl=0.05)
+    cache.put('a', {'score': 1.0})
+    result = cache.get('a')
+    result['score'] = 2.0  # 修改返回值不影响缓存
+    assert cache.get('a') == {'score': 1.0}
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+    
+    cache.put('b', [1])
+    cache.clear()
+    assert cache.get('b') is None and len(cache) == 0
+    print("✓ TTL 过期与清空")
+
+
+def _put_in_child(path):
+    SQLiteResultCache(path).put(('recommend', (1, 2)), [{'book_id': 3}])
+
+
+def test_sqlite_shared():
+    """SQLite 后端: 其他进程写入的条目可以命中，超出上限时按访问时间淘汰"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'result_cache.db')
+        cache = SQLiteResultCache(path, max_entries=3, ttl=None)
+        
+        child = Process(target=_put_in_child, args=(path,))
+        child.start()
+        child.join()
+        assert cache.get(('recommend', (1, 2))) == [{'book_id': 3}]
+        
+        for i in range(5):
+            cache.put(i, [i])
+        assert cache.stats()['entries'] == 3
+        assert cache.get(4) == [4]
+        
+        # 切换命名空间后旧条目不再命中
+        cache.invalidate('v2')
+        assert cache.get(4) is None
+    print("✓ SQLite 共享缓存")
+
+
+if __name__ == '__main__':
+    test_lru_eviction()
+    test_byte_limit()
+    test_ttl_and_clear()
+    test_sqlite_shared()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+测试稀疏矩阵打分引擎与逐个累加打分的结果一致性
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.graph_store import GraphStore, EntityTable, ArrayView, NODE_TYPE_CODES
+from src.core.keyword_recommender import KeywordBasedRecommender
+from src.core.keyword_store import KeywordStore
+
+# 固定测试集: (喜欢的书籍, 策略, 关系, 关键词)
+TEST_CASES = [
+    (['三体'], 'mixed', None, None),
+    (['三体'], 'kg_only', None, None),
+    (['三体'], 'keyword_only', None, None),
+    (['三体'], 'kg_only', ['series', 'author'], None),
+    (['三体', '球状闪电'], 'mixed', None, None),
+    (['三体'], 'mixed', None, ['科幻', '宇宙', '文明']),
+    (['活着', '平凡的世界'], 'keyword_only', None, None),
+]
+
+
+def _build_recommender(entities, relations, book_keywords, book_keyword_weights):
+    """用实体、关系和关键词构建推荐器（不读取数据文件）"""
+    recommender = KeywordBasedRecommender()
+    recommender.graph = GraphStore.from_relations(entities, relations)
+    recommender.entities = EntityTable(recommender.graph)
+    recommender.entity_types = recommender.graph.entity_types()
+    recommender.book_entities = recommender.entity_types['book']
+    recommender.book_ratings = ArrayView(
+        recommender.graph.ratings, recommender.graph.node_types == NODE_TYPE_CODES['book']
+    )
+    recommender._build_relation_index()
+    recommender.title_index = recommender._build_title_index()
+    
+    # 关键词视图只包含有评论统计的图书；热度为0，不影响得分
+    comment_stats = {book_id: {'total_comments': 10, 'like_count': 5, 'avg_rating': 3.0} for book_id in book_keywords}
+    recommender._attach_keyword_store(
+        KeywordStore.from_dicts(len(entities), book_keywords, book_keyword_weights, comment_stats, {})
+    )
+    return recommender
+
+
+def _link(relations, entity_id, book_id, rel_type):
+    """添加图书与实体之间的双向关系"""
+    forward, backward = {
+        'author': ('written_by', 'write'),
+        'translator': ('translated_by', 'translate'),
+        'series': ('belongs_to', 'contains'),
+        'publisher': ('published_by', 'publish'),
+    }[rel_type]
+    relations.append((book_id, forward, entity_id))
+    relations.append((entity_id, backward, book_id))
+
+
+def _make_recommender():
+    """
+    合成数据: 图书0《三体》与其他图书通过关键词和知识图谱关系关联，得分有并列
+    
+    mixed 策略下的得分: 图书2/5/6 为 0.5，图书3/4 为 0.4，图书1 为 0.15；
+    字典实现中候选的插入顺序（先关键词后关系）与图书ID顺序不同。
+    """
+    names = ['三体', '流浪地球', '球状闪电', '超新星纪元', '朝闻道', '带上她的眼睛', '乡村教师']
+    entities = {book_id: {'type': 'book', 'name': name, 'rating': 0} for book_id, name in enumerate(names)}
+    entities.update({
+        7: {'type': 'author', 'name': '作者甲'},
+        8: {'type': 'translator', 'name': '译者乙'},
+        9: {'type': 'series', 'name': '系列丙'},
+        10: {'type': 'publisher', 'name': '出版社丁'},
+    })
+    relations = []
+    for entity_id, books in ((7, [0, 2]), (8, [0, 2]), (9, [0, 4]), (10, [0, 1, 3])):
+        for book_id in books:
+            _link(relations, entity_id, book_id, entities[entity_id]['type'])
+    
+    book_keywords = {0: ['星空', '宇宙', '文明'], 3: ['宇宙'], 5: ['宇宙', '文明'], 6: ['星空']}
+    book_keyword_weights = {
+        book_id: {kw: {'星空': 1.0}.get(kw, 0.5) for kw in keywords}
+        for book_id, keywords in book_keywords.items()
+    }
+    return _build_recommender(entities, relations, book_keywords, book_keyword_weights)
+
+
+def _make_random_recommender(num_books=300, seed=0):
+    """
+    随机合成数据: 每本书 1-2 位作者、1 个出版社，部分有系列和译者，0-6 个关键词
+    
+    关键词权重取 0.25 / 0.5 / 1.0，评分取 0 或 10，得分大量并列，
+    且两种引擎的浮点累加结果完全相同。
+    """
+    rng = np.random.default_rng(seed)
+    entities = {
+        book_id: {'type': 'book', 'name': f'图书{book_id}', 'rating': float(rng.choice([0, 10]))}
+        for book_id in range(num_books)
+    }
+    pools = {}
+    for rel_type, count in (('author', 40), ('publisher', 8), ('series', 15), ('translator', 10)):
+        start = len(entities)
+        pools[rel_type] = list(range(start, start + count))
+        for entity_id in pools[rel_type]:
+            entities[entity_id] = {'type': rel_type, 'name': f'{rel_type}{entity_id}'}
+    
+    relations = []
+    book_keywords = {}
+    book_keyword_weights = {}
+    vocab = [f'词{i}' for i in range(30)]
+    for book_id in range(num_books):
+        for author_id in rng.choice(pools['author'], size=rng.integers(1, 3), replace=False).tolist():
+            _link(relations, author_id, book_id, 'author')
+        _link(relations, int(rng.choice(pools['publisher'])), book_id, 'publisher')
+        if rng.random() < 0.5:
+            _link(relations, int(rng.choice(pools['series'])), book_id, 'series')
+        if rng.random() < 0.3:
+            _link(relations, int(rng.choice(pools['translator'])), book_id, 'translator')
+        keywords = [vocab[i] for i in sorted(rng.choice(len(vocab), size=rng.integers(0, 7), replace=False))]
+        if keywords:
+            book_keywords[book_id] = keywords
+            book_keyword_weights[book_id] = {kw: float(rng.choice([0.25, 0.5, 1.0])) for kw in keywords}
+    return _build_recommender(entities, relations, book_keywords, book_keyword_weights)
+
+
+def test_tie_order():
+    """合成数据上两种打分引擎的结果一致，同分按图书ID升序（包括第 k 名有并列的情况）"""
+    recommender = _make_recommender()
+    for strategy, top_k, expected in (
+        ('mixed', 20, [2, 5, 6, 3, 4, 1]),
+        ('mixed', 4, [2, 5, 6, 3]),
+        ('keyword_only', 2, [5, 6]),
+        ('kg_only', 3, [2, 4, 1]),
+    ):
+        results = {}
+        for engine in ('python', 'sparse'):
+            recommender.result_cache.clear()
+            results[engine] = recommender.recommend(['三体'], top_k=top_k, strategy=strategy, engine=engine)
+        assert [rec['book_id'] for rec in results['python']] == expected
+        assert [(rec['book_id'], rec['score']) for rec in results['python']] == \
+            [(rec['book_id'], rec['score']) for rec in results['sparse']]
+        assert [rec['reasons'] for rec in results['python']] == [rec['reasons'] for rec in results['sparse']]
+    print("✓ 合成数据并列得分排序一致")
+
+
+def test_reason_order():
+    """推荐理由按喜欢的书的输入顺序列出，调换输入顺序共用同一缓存键"""
+    recommender = _make_recommender()
+    reasons = {}
+    for favorite_books in (['流浪地球', '超新星纪元'], ['超新星纪元', '流浪地球']):
+        for engine in ('python', 'sparse'):
+            recommender.result_cache.clear()
+            results = recommender.recommend(favorite_books, top_k=3, strategy='kg_only', engine=engine)
+            assert [rec['book_id'] for rec in results] == [0]
+            reasons[favorite_books[0], engine] = results[0]['reasons']
+    for engine in ('python', 'sparse'):
+        assert reasons['流浪地球', engine] == ['与《流浪地球》出版社相同: 出版社丁', '与《超新星纪元》出版社相同: 出版社丁']
+        assert reasons['超新星纪元', engine] == reasons['流浪地球', engine][::-1]
+    
+    key = recommender._recommend_cache_key([1, 3], 3, 'kg_only', ['publisher'], None, 'python')
+    assert key == recommender._recommend_cache_key([3, 1], 3, 'kg_only', ['publisher'], None, 'python')
+    print("✓ 推荐理由保持输入顺序")
+
+
+def test_random_parity():
+    """随机合成图上两种打分引擎的 Top-K（图书、得分、推荐理由）完全相同，包括第 k 名并列的情况"""
+    recommender = _make_random_recommender()
+    cutoff_ties = 0
+    for book_id in range(0, 300, 7):
+        for strategy in ('mixed', 'kg_only', 'keyword_only'):
+            for relations in (None, ['author', 'publisher']):
+                results = {}
+                for engine in ('python', 'sparse'):
+                    for top_k in (5, 50):
+                        recommender.result_cache.clear()
+                        results[engine, top_k] = recommender.recommend(
+                            [f'图书{book_id}'], top_k=top_k, strategy=strategy, relations=relations, engine=engine
+                        )
+                for top_k in (5, 50):
+                    assert results['python', top_k] == results['sparse', top_k], (book_id, strategy, relations, top_k)
+                assert results['python', 5] == results['python', 50][:5]
+                
+                scores = [rec['score'] for rec in results['python', 50]]
+                ids = [rec['book_id'] for rec in results['python', 50]]
+                assert all(ids[i] < ids[i + 1] for i in range(len(ids) - 1) if scores[i] == scores[i + 1])
+                cutoff_ties += len(scores) > 5 and scores[4] == scores[5]
+    # 测试数据确实覆盖了第 k 名（k=5）并列的情况
+    assert cutoff_ties > 10
+    print(f"✓ 随机合成图两种引擎一致（第 5 名并列 {cutoff_ties} 次）")
+
+
+def test_scoring_engine():
+    """测试两种打分引擎的排序结果一致"""
+    print("初始化推荐系统...")
+    recommender = KeywordBasedRecommender()
+    recommender.load_kg()
+    recommender.load_and_analyze_comments()
+    
+    print("\n" + "="*80)
+    print("打分引擎一致性检查")
+    print("="*80)
+    
+    for favorite_books, strategy, relations, selected_keywords in TEST_CASES:
+        results = {}
+        for engine in ('python', 'sparse'):
+            results[engine] = recommender.recommend(
+                favorite_books,
+                top_k=20,
+                strategy=strategy,
+                relations=relations,
+                selected_keywords=selected_keywords,
+                engine=engine
+            )
+        
+        expected = [(rec['book_id'], round(rec['score'], 9)) for rec in results['python']]
+        actual = [(rec['book_id'], round(rec['score'], 9)) for rec in results['sparse']]
+        print(f"\n{favorite_books} / {strategy} / {relations}: {'✓ 一致' if expected == actual else '✗ 不一致'}")
+        assert expected == actual
+        assert [rec['reasons'] for rec in results['python']] == [rec['reasons'] for rec in results['sparse']]
+
+
+
+def test_recommend_batch():
+    """测试批量推荐与逐个推荐的结果一致"""
+    recommender = KeywordBasedRecommender()
+    recommender.load_kg()
+    recommender.load_and_analyze_comments()
+    
+    for strategy in ('mixed', 'kg_only', 'keyword_only'):
+        requests = [
+            {'favorite_books': favorite_books, 'selected_keywords': selected_keywords}
+            for favorite_books, _, _, selected_keywords in TEST_CASES
+        ]
+        recommender.result_cache.clear()
+        batch = list(recommender.recommend_batch(requests, top_k=20, strategy=strategy, batch_size=3))
+        
+        recommender.result_cache.clear()
+        for req, actual in zip(requests, batch):
+            expected = recommender.recommend(
+                req['favorite_books'],
+                top_k=20,
+                strategy=strategy,
+                selected_keywords=req['selected_keywords'],
+                engine='sparse'
+            )
+            print(f"\n批量 {req['favorite_books']} / {strategy}: {'✓ 一致' if expected == actual else '✗ 不一致'}")
+            assert expected == actual
+
+
+if __name__ == '__main__':
+    test_tie_order()
+    test_reason_order()
+    test_random_parity()
+    test_scoring_engine()
+    test_recommend_batch()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+测试分阶段计时和直方图
+"""
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils.timing import Histogram, SpanRecorder
+
+
+def test_histogram():
+    """桶计数为累计值，分位数在所在桶内插值且不超过最大值"""
+    histogram = Histogram((1, 10, 100))
+    for value in (0.5, 1, 5, 5, 50, 500):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 6 and snapshot['max'] == 500
+    assert snapshot['buckets'] == {'1': 2, '10': 4, '100': 5, '+Inf': 6}
+    assert 1 <= snapshot['p50'] <= 10
+    assert 100 <= snapshot['p99'] <= 500
+    assert Histogram((1,)).quantile(0.5) == 0.0
+    print("✓ 直方图")
+
+
+def test_span_recorder():
+    """span 记录耗时和候选数，异常退出时也记录，reset 后清零"""
+    recorder = SpanRecorder()
+    with recorder.span('scoring') as span:
+        time.sleep(0.01)
+        span.count(42)
+    try:
+        with recorder.span('scoring'):
+            raise ValueError
+    except ValueError:
+        pass
+    with recorder.span('sort'):
+        pass
+    
+    spans = recorder.snapshot()['spans']
+    assert spans['scoring']['duration_ms']['count'] == 2
+    assert spans['scoring']['duration_ms']['max'] >= 10
+    assert spans['scoring']['items']['count'] == 1 and spans['scoring']['items']['sum'] == 42
+    assert 'items' not in spans['sort']
+    
+    recorder.reset()
+    assert recorder.snapshot()['spans'] == {}
+    print("✓ 分阶段计时")
+
+
+if __name__ == '__main__':
+    test_histogram()
+    test_span_recorder()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+测试书名索引的搜索和保存（写入临时目录后替换）
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.title_index import TitleIndex
+
+
+def _make_index(names):
+    return TitleIndex.build(np.arange(len(names)), names, np.zeros(len(names)))
+
+
+def test_save_replace():
+    """重新保存时替换整个目录: 已用 mmap 加载的旧索引仍可搜索，不留下临时目录；写入出错时保留原索引"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'title_index')
+        _make_index(['三体', '三体II', '球状闪电']).save(path)
+        old = TitleIndex.load(path, mmap_mode='r')
+        assert old.search('三体', 10) == [0, 1]
+        
+        _make_index(['活着', '平凡的世界']).save(path)
+        assert sorted(os.listdir(tmp)) == ['title_index']
+        assert TitleIndex.load(path, mmap_mode='r').search('活着', 10) == [0]
+        assert old.search('三体', 10) == [0, 1]
+        
+        broken = _make_index(['围城'])
+        broken.grams = None
+        try:
+            broken.save(path)
+            assert False, '应抛出异常'
+        except AttributeError:
+            pass
+        assert sorted(os.listdir(tmp)) == ['title_index']
+        assert TitleIndex.load(path, mmap_mode='r').search('活着', 10) == [0]
+    print("✓ 保存/替换")
+
+
+if __name__ == '__main__':
+    test_save_replace()